@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class CommonConfig(AppConfig):
     name = "geniza.common"
+
+    def ready(self):
+        # record timing for solr and iiif requests
+        from geniza.common.timing import instrument
+
+        instrument()
@@ -1,8 +1,17 @@
+import logging
+import time
+from contextlib import ExitStack
+
 from django.conf import settings
+from django.db import connections
 from django.http import HttpRequest
 from django.utils import translation
 from django.views.i18n import set_language
 
+from geniza.common import timing
+
+logger = logging.getLogger(__name__)
+
 
 class PublicLocaleMiddleware:
     """Middleware to redirect anonymous users attempting to access locales that are not in
@@ -29,3 +38,54 @@ class PublicLocaleMiddleware:
         # otherwise, continue on with middleware chain
         response = self.get_response(request)
         return response
+
+
+class ServerTimingMiddleware:
+    """Middleware to time Solr requests, database queries, IIIF requests,
+    and template rendering, and count search result cache hits and misses,
+    for each request. Timing is logged for every
+    request, and added to the response as a `Server-Timing` header for
+    staff users. Must come after
+    :class:`~django.contrib.auth.middleware.AuthenticationMiddleware`."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest):
+        request_timing = timing.RequestTiming()
+        token = timing.current_timing.set(request_timing)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing.time_query))
+                response = self.get_response(request)
+        finally:
+            timing.current_timing.reset(token)
+
+        log_data = request_timing.log_data()
+        logger.info(
+            "%s %s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            " ".join("%s=%s" % item for item in log_data.items()),
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "timing": log_data,
+            },
+        )
+        user = getattr(request, "user", None)
+        if user is not None and user.is_staff:
+            response["Server-Timing"] = request_timing.server_timing()
+        return response
+
+    def process_template_response(self, request, response):
+        # template responses are rendered after this hook runs;
+        # time rendering from here until post-render callbacks are called
+        start = time.perf_counter()
+        response.add_post_render_callback(
+            lambda rendered: timing.record("template", time.perf_counter() - start)
+        )
+        return response
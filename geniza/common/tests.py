@@ -7,12 +7,13 @@ from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError
 from django.db import connection, models
 from django.db.migrations.executor import MigrationExecutor
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
 from django.test import TestCase, TransactionTestCase, override_settings
 
+from geniza.common import timing
 from geniza.common.admin import LocalUserAdmin, custom_empty_field_list_filter
 from geniza.common.fields import NaturalSortField, RangeField, RangeWidget
-from geniza.common.middleware import PublicLocaleMiddleware
+from geniza.common.middleware import PublicLocaleMiddleware, ServerTimingMiddleware
 from geniza.common.utils import absolutize_url, custom_tag_string
 
 
@@ -224,6 +225,136 @@ class TestMiddleware(TestCase):
                 assert response == middleware.get_response(request)
 
 
+class TestRequestTiming:
+    def test_record(self):
+        request_timing = timing.RequestTiming()
+        request_timing.record("solr", 0.02)
+        request_timing.record("solr", 0.01)
+        request_timing.record("db", 0.005)
+        request_timing.solr_qtime = 12
+        server_timing = request_timing.server_timing()
+        assert 'solr;dur=30.0;desc="Solr (2), QTime 12ms"' in server_timing
+        assert 'db;dur=5.0;desc="Database (1)"' in server_timing
+        # kinds with no calls are omitted
+        assert "iiif" not in server_timing
+        assert "total;dur=" in server_timing
+
+        log_data = request_timing.log_data()
+        assert log_data["solr_count"] == 2
+        assert log_data["solr_ms"] == 30.0
+        assert log_data["solr_qtime_ms"] == 12
+        assert log_data["iiif_count"] == 0
+        assert "total_ms" in log_data
+        assert log_data["search_cache_hits"] == 0
+
+    def test_record_cache(self):
+        # no current request; nothing recorded, no error
+        timing.record_cache("search_cache", True)
+
+        request_timing = timing.RequestTiming()
+        # caches with no lookups are omitted
+        assert "search_cache" not in request_timing.server_timing()
+        token = timing.current_timing.set(request_timing)
+        try:
+            timing.record_cache("search_cache", True)
+            timing.record_cache("search_cache", False)
+            timing.record_cache("search_cache", True)
+        finally:
+            timing.current_timing.reset(token)
+        assert (
+            'search_cache;desc="Search result cache: 2 hits, 1 misses"'
+            in request_timing.server_timing()
+        )
+        log_data = request_timing.log_data()
+        assert log_data["search_cache_hits"] == 2
+        assert log_data["search_cache_misses"] == 1
+
+    def test_timer(self):
+        # no current request; nothing recorded, no error
+        with timing.timer("iiif"):
+            pass
+
+        request_timing = timing.RequestTiming()
+        token = timing.current_timing.set(request_timing)
+        try:
+            with timing.timer("iiif"):
+                pass
+            timing.timed("iiif")(Mock())()
+        finally:
+            timing.current_timing.reset(token)
+        assert request_timing.counts["iiif"] == 2
+
+    def test_time_solr_request(self):
+        make_request = Mock(return_value={"responseHeader": {"QTime": 7}})
+        wrapped = timing.time_solr_request(make_request)
+        request_timing = timing.RequestTiming()
+        token = timing.current_timing.set(request_timing)
+        try:
+            assert wrapped("get", "url") == make_request.return_value
+            # response is None on error
+            make_request.return_value = None
+            assert wrapped("get", "url") is None
+        finally:
+            timing.current_timing.reset(token)
+        make_request.assert_called_with("get", "url")
+        assert request_timing.counts["solr"] == 2
+        assert request_timing.solr_qtime == 7
+
+    def test_instrument(self):
+        from parasolr.solr.base import ClientBase
+        from piffle.presentation import IIIFPresentation
+
+        # instrumented when app is loaded; calling again has no effect
+        make_request = ClientBase.make_request
+        timing.instrument()
+        assert ClientBase.make_request == make_request
+        assert make_request.timed
+        assert IIIFPresentation.from_url.timed
+
+
+class TestServerTimingMiddleware:
+    def test_call(self):
+        def get_response(request):
+            timing.record("solr", 0.01)
+            return response
+
+        response = HttpResponse()
+        middleware = ServerTimingMiddleware(get_response)
+        request = Mock(method="GET", path="/documents/")
+        request.user.is_staff = False
+        with patch("geniza.common.middleware.connections") as mock_connections:
+            mock_connections.all.return_value = []
+            with patch("geniza.common.middleware.logger") as mock_logger:
+                assert middleware(request) == response
+                assert "Server-Timing" not in response
+                mock_logger.info.assert_called_once()
+                args, kwargs = mock_logger.info.call_args
+                assert args[1:4] == ("GET", "/documents/", 200)
+                assert "solr_count=1" in args[4]
+                assert kwargs["extra"]["timing"]["solr_count"] == 1
+
+            # header added for staff users
+            request.user.is_staff = True
+            response = HttpResponse()
+            middleware(request)
+            assert response["Server-Timing"].startswith("solr;dur=")
+        # no longer recording once request is complete
+        assert timing.current_timing.get() is None
+
+    def test_process_template_response(self):
+        middleware = ServerTimingMiddleware(Mock())
+        response = Mock()
+        assert middleware.process_template_response(Mock(), response) == response
+        callback = response.add_post_render_callback.call_args[0][0]
+        request_timing = timing.RequestTiming()
+        token = timing.current_timing.set(request_timing)
+        try:
+            callback(response)
+        finally:
+            timing.current_timing.reset(token)
+        assert request_timing.counts["template"] == 1
+
+
 # range widget and field tests copied from mep (previously derrida via ppa)
 
 
@@ -0,0 +1,186 @@
+"""
+Per-request timing for Solr queries, database queries, IIIF requests, and
+template rendering, and hit and miss counts for in-process caches,
+collected by :class:`~geniza.common.middleware.ServerTimingMiddleware`.
+
+Solr requests made through parasolr and outbound IIIF requests
+(:meth:`piffle.presentation.IIIFPresentation.from_url` and
+:meth:`djiffy.importer.ManifestImporter.import_paths`) are timed by
+wrapping those methods when the app is loaded; see :meth:`instrument`.
+Remote manifests loaded by :mod:`geniza.corpus.iiif_fetch` are timed
+in the worker threads, on behalf of the request that started them.
+Calls made outside a request are not recorded.
+"""
+
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+#: timing for the current request, if any
+current_timing = contextvars.ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """Count and total duration of timed calls, by kind, for a single
+    request. Safe to record from multiple threads."""
+
+    #: kinds of calls that are timed, with descriptions
+    kinds = {
+        "solr": "Solr",
+        "db": "Database",
+        "iiif": "IIIF",
+        "template": "Template render",
+    }
+    #: caches with hit and miss counts, with descriptions
+    caches = {
+        "search_cache": "Search result cache",
+    }
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.counts = defaultdict(int)
+        self.durations = defaultdict(float)
+        #: total query time reported by Solr, in milliseconds
+        self.solr_qtime = 0
+        self.cache_hits = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, kind, duration):
+        """Record a call of the specified kind and its duration in seconds."""
+        with self.lock:
+            self.counts[kind] += 1
+            self.durations[kind] += duration
+
+    def record_cache(self, cache, hit):
+        """Record a hit or miss for the specified cache."""
+        with self.lock:
+            if hit:
+                self.cache_hits[cache] += 1
+            else:
+                self.cache_misses[cache] += 1
+
+    def total(self):
+        """Time in seconds since the request started"""
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        """Timing as the value of a `Server-Timing` header, with
+        durations in milliseconds."""
+        metrics = []
+        for kind, label in self.kinds.items():
+            if not self.counts[kind]:
+                continue
+            desc = "%s (%d)" % (label, self.counts[kind])
+            if kind == "solr":
+                desc += ", QTime %dms" % self.solr_qtime
+            metrics.append(
+                '%s;dur=%.1f;desc="%s"' % (kind, self.durations[kind] * 1000, desc)
+            )
+        for cache, label in self.caches.items():
+            if not self.cache_hits[cache] and not self.cache_misses[cache]:
+                continue
+            metrics.append(
+                '%s;desc="%s: %d hits, %d misses"'
+                % (cache, label, self.cache_hits[cache], self.cache_misses[cache])
+            )
+        metrics.append("total;dur=%.1f" % (self.total() * 1000))
+        return ", ".join(metrics)
+
+    def log_data(self):
+        """Timing as a flat dictionary for structured logging, with
+        durations in milliseconds."""
+        data = {"total_ms": round(self.total() * 1000, 1)}
+        for kind in self.kinds:
+            data["%s_count" % kind] = self.counts[kind]
+            data["%s_ms" % kind] = round(self.durations[kind] * 1000, 1)
+        data["solr_qtime_ms"] = self.solr_qtime
+        for cache in self.caches:
+            data["%s_hits" % cache] = self.cache_hits[cache]
+            data["%s_misses" % cache] = self.cache_misses[cache]
+        return data
+
+
+def record(kind, duration):
+    """Record a call for the current request, if there is one."""
+    timing = current_timing.get()
+    if timing is not None:
+        timing.record(kind, duration)
+
+
+def record_cache(cache, hit):
+    """Record a cache hit or miss for the current request, if there is one."""
+    timing = current_timing.get()
+    if timing is not None:
+        timing.record_cache(cache, hit)
+
+
+@contextmanager
+def timer(kind):
+    """Context manager to time a block of code as a call of the specified
+    kind for the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, time.perf_counter() - start)
+
+
+def timed(kind):
+    """Decorator to time every call to a function"""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(kind):
+                return func(*args, **kwargs)
+
+        wrapper.timed = True
+        return wrapper
+
+    return decorator
+
+
+def time_query(execute, sql, params, many, context):
+    """Database execute wrapper to time queries; see
+    :meth:`django.db.backends.base.base.BaseDatabaseWrapper.execute_wrapper`."""
+    with timer("db"):
+        return execute(sql, params, many, context)
+
+
+def time_solr_request(make_request):
+    """Wrap parasolr's method for making requests to Solr to record
+    round-trip time and the query time reported by Solr."""
+
+    @wraps(make_request)
+    def wrapper(*args, **kwargs):
+        with timer("solr"):
+            response = make_request(*args, **kwargs)
+        timing = current_timing.get()
+        if timing is not None and isinstance(response, dict):
+            qtime = response.get("responseHeader", {}).get("QTime") or 0
+            with timing.lock:
+                timing.solr_qtime += qtime
+        return response
+
+    wrapper.timed = True
+    return wrapper
+
+
+def instrument():
+    """Wrap Solr and IIIF request methods to record timing. Safe to call
+    more than once."""
+    from djiffy.importer import ManifestImporter
+    from parasolr.solr.base import ClientBase
+    from piffle.presentation import IIIFPresentation
+
+    if getattr(ClientBase.make_request, "timed", False):
+        return
+    ClientBase.make_request = time_solr_request(ClientBase.make_request)
+    IIIFPresentation.from_url = classmethod(
+        timed("iiif")(IIIFPresentation.from_url.__func__)
+    )
+    ManifestImporter.import_paths = timed("iiif")(ManifestImporter.import_paths)
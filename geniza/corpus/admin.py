@@ -2,9 +2,12 @@ from adminsortable2.admin import SortableAdminBase, SortableInlineAdminMixin
 from django import forms
 from django.conf import settings
 from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
 from django.contrib.postgres.aggregates import ArrayAgg
 from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
 from django.db.models import CharField, Count, F
 from django.db.models.functions import Concat
 from django.db.models.query import Prefetch
@@ -175,6 +178,108 @@ class HasTranscriptionListFilter(admin.SimpleListFilter):
             return queryset.exclude(footnotes__content__has_key="html")
 
 
+class SolrPagedResults:
+    """Admin search results paged and sorted in Solr, for use with a
+    :class:`~django.core.paginator.Paginator`. Counts results with Solr
+    and loads only the records for the requested page from the database,
+    in Solr sort order."""
+
+    def __init__(self, solr_queryset, queryset):
+        self.solr_queryset = solr_queryset.only("pgpid")
+        self.queryset = queryset
+
+    def count(self):
+        return self.solr_queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice):
+            return self[k : k + 1][0]
+        pks = [r["pgpid"] for r in self.solr_queryset[k]]
+        records = {doc.pk: doc for doc in self.queryset.filter(pk__in=pks)}
+        # skip any documents indexed in solr but since deleted
+        return [records[pk] for pk in pks if pk in records]
+
+
+class DocumentChangeList(ChangeList):
+    """Document changelist that pages and sorts keyword search results in
+    Solr, instead of filtering the database by every matching PGPID.
+    Falls back to the default changelist behavior (filtering by all PGPIDs
+    matching the search) when list filters are active, when sorting by a
+    column that is not in Solr, when showing all results, and for actions,
+    which operate on the full queryset."""
+
+    def get_queryset(self, request):
+        self.solr_queryset = None
+        if (
+            self.query
+            and request.method == "GET"
+            and not self.show_all
+            and not self.get_filters_params()
+        ):
+            sort = self.get_solr_sort()
+            if sort is not None:
+                self.solr_queryset = self.model_admin.get_solr_queryset(
+                    self.query
+                ).order_by(*sort)
+
+        if self.solr_queryset is None:
+            return super().get_queryset(request)
+
+        # search is handled by solr; don't filter the queryset by search term
+        search_term, self.query = self.query, ""
+        try:
+            return super().get_queryset(request)
+        finally:
+            self.query = search_term
+
+    def get_solr_sort(self):
+        """Solr sort for the current changelist ordering, or None if
+        sorting on a column that is not in Solr."""
+        sort = []
+        if ORDER_VAR in self.params:
+            for idx, order_type in self.get_ordering_field_columns().items():
+                try:
+                    field = self.model_admin.solr_sort_fields[self.list_display[idx]]
+                except (IndexError, KeyError):
+                    return None
+                sort.append("%s%s" % ("-" if order_type == "desc" else "", field))
+        else:
+            sort.append("shelfmark_s")
+        # sort by pgpid last, for consistent paging
+        return sort + ["pgpid_i"]
+
+    def get_results(self, request):
+        if self.solr_queryset is None:
+            return super().get_results(request)
+
+        results = SolrPagedResults(self.solr_queryset, self.queryset)
+        paginator = self.model_admin.get_paginator(request, results, self.list_per_page)
+        # count search results with solr
+        result_count = paginator.count
+        if self.model_admin.show_full_result_count:
+            full_result_count = self.root_queryset.count()
+        else:
+            full_result_count = None
+        try:
+            result_list = paginator.page(self.page_num).object_list
+        except InvalidPage:
+            raise IncorrectLookupParameters
+
+        self.result_count = result_count
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.show_admin_actions = not self.show_full_result_count or bool(
+            full_result_count
+        )
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = result_count <= self.list_max_show_all
+        self.multi_page = result_count > self.list_per_page
+        self.paginator = paginator
+
+
 @admin.register(Document)
 class DocumentAdmin(TabbedTranslationAdmin, SortableAdminBase, admin.ModelAdmin):
     form = DocumentForm
@@ -211,6 +316,15 @@ class DocumentAdmin(TabbedTranslationAdmin, SortableAdminBase, admin.ModelAdmin)
         "old_pgpids",
     )
     # TODO include search on edition once we add footnotes
+    #: solr fields for sorting search results by changelist column
+    solr_sort_fields = {
+        "id": "pgpid_i",
+        "shelfmark_display": "shelfmark_s",
+        "doctype": "type_s",
+        "last_modified": "last_modified_dt",
+        "has_image": "has_image_b",
+        "is_public": "status_s",
+    }
     save_as = True
     # display unset document type as Unknown
     empty_value_display = "Unknown"
@@ -319,18 +433,27 @@ class DocumentAdmin(TabbedTranslationAdmin, SortableAdminBase, admin.ModelAdmin)
             .order_by("shelfmk_all")
         )
 
+    def get_changelist(self, request, **kwargs):
+        return DocumentChangeList
+
+    def get_solr_queryset(self, search_term):
+        """Solr queryset for an admin search"""
+        # use AND instead of OR to get smaller result sets, more
+        # similar to default admin search behavior
+        return (
+            DocumentSolrQuerySet()
+            .admin_search(search_term)
+            .raw_query_parameters(**{"q.op": "AND"})
+        )
+
     def get_search_results(self, request, queryset, search_term):
         """Override admin search to use Solr."""
 
         # if search term is not blank, filter the queryset via solr search
         if search_term:
-            # - use AND instead of OR to get smaller result sets, more
-            #  similar to default admin search behavior
-            # - return pks for all matching records
+            # return pks for all matching records
             sqs = (
-                DocumentSolrQuerySet()
-                .admin_search(search_term)
-                .raw_query_parameters(**{"q.op": "AND"})
+                self.get_solr_queryset(search_term)
                 .only("pgpid")
                 .get_results(rows=100000)
             )
@@ -225,6 +225,9 @@ class DocumentSearchForm(RangeForm):
         label=_("Has Discussion"),
     )
 
+    # seed for random sort, so random results are consistent across pages
+    seed = forms.IntegerField(required=False, min_value=0, widget=forms.HiddenInput)
+
     # mapping of solr facet fields to form input
     solr_facet_fields = {
         "type": "doctype",
@@ -234,13 +237,13 @@ class DocumentSearchForm(RangeForm):
     }
 
     def filters_active(self):
-        """Check if any filters are active; returns true if form fields other than sort or q are set"""
+        """Check if any filters are active; returns true if form fields other than sort, q, or seed are set"""
         if self.is_valid():
             return bool(
                 {
                     k: v
                     for k, v in self.cleaned_data.items()
-                    if k not in ["q", "sort"] and bool(v)
+                    if k not in ["q", "sort", "seed"] and bool(v)
                 }
             )
         return False
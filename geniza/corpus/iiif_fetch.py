@@ -0,0 +1,162 @@
+"""
+Shared layer for loading remote IIIF manifests, for fragments that do not
+have a locally cached manifest.
+
+Manifests are requested concurrently in a thread pool of
+**IIIF_FETCH_MAX_WORKERS** threads (default 8), using a single
+:class:`requests.Session` so that HTTP connections are pooled and reused.
+At most **IIIF_FETCH_PER_HOST** requests (default 4) are made to any one
+host at a time, and requests time out after **IIIF_FETCH_TIMEOUT**
+seconds (default 10) connecting to or reading from the server. Concurrent
+requests for the same URL share a single HTTP request.
+
+Auth tokens configured in **DJIFFY_AUTH_TOKENS** are added to requests
+for the configured domains, as when manifests are imported with djiffy.
+"""
+
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from piffle.presentation import IIIFException, IIIFPresentation
+from requests.adapters import HTTPAdapter
+
+from geniza.common import timing
+
+logger = logging.getLogger(__name__)
+
+
+class ManifestFetcher:
+    """Thread pool for loading remote IIIF manifests, with per-host
+    concurrency limits and deduplication of in-flight requests."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        #: futures for requests in progress, keyed on url
+        self.in_flight = {}
+        #: semaphores limiting concurrent requests, keyed on host
+        self.host_limits = {}
+        self._executor = None
+        self._session = None
+
+    @property
+    def max_workers(self):
+        """Maximum number of concurrent requests"""
+        return getattr(settings, "IIIF_FETCH_MAX_WORKERS", 8)
+
+    @property
+    def per_host(self):
+        """Maximum number of concurrent requests to a single host"""
+        return getattr(settings, "IIIF_FETCH_PER_HOST", 4)
+
+    @property
+    def timeout(self):
+        """Seconds to wait when connecting to or reading from a server"""
+        return getattr(settings, "IIIF_FETCH_TIMEOUT", 10)
+
+    @property
+    def executor(self):
+        """Thread pool for requests, created on first use"""
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="iiif-fetch"
+                )
+            return self._executor
+
+    @property
+    def session(self):
+        """HTTP session with a connection pool large enough for every
+        worker, created on first use"""
+        with self.lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=self.max_workers)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def host_limit(self, url):
+        """Semaphore limiting concurrent requests to the host for a url"""
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self.host_limits[host]
+
+    def request_params(self, url):
+        """Query parameters for a url; adds auth token when configured
+        for the url domain"""
+        auth_tokens = getattr(settings, "DJIFFY_AUTH_TOKENS", None) or {}
+        domain = urlparse(url).netloc
+        if domain in auth_tokens:
+            return {"auth_token": auth_tokens[domain]}
+        return {}
+
+    def load(self, url):
+        """Request and parse a single manifest. Raises
+        :class:`~piffle.presentation.IIIFException` if the manifest could not
+        be retrieved or parsed."""
+        try:
+            with self.host_limit(url), timing.timer("iiif"):
+                response = self.session.get(
+                    url, params=self.request_params(url), timeout=self.timeout
+                )
+            if response.status_code != requests.codes.ok:
+                raise IIIFException(
+                    "Error retrieving manifest at %s: %s %s"
+                    % (url, response.status_code, response.reason)
+                )
+            try:
+                return IIIFPresentation(response.json())
+            except ValueError as err:
+                raise IIIFException("Error parsing JSON for %s: %s" % (url, err))
+        except requests.RequestException as err:
+            raise IIIFException("Error retrieving manifest at %s: %s" % (url, err))
+        finally:
+            # no longer in flight; later requests for this url will reload it
+            with self.lock:
+                self.in_flight.pop(url, None)
+
+    def submit(self, url):
+        """Start loading a manifest, or join a request in progress for
+        the same url. Returns a :class:`concurrent.futures.Future`."""
+        executor = self.executor
+        with self.lock:
+            future = self.in_flight.get(url)
+            if future is None:
+                # run in a copy of the current context, so that request
+                # timing is recorded for the request that started the load
+                context = contextvars.copy_context()
+                future = executor.submit(context.run, self.load, url)
+                self.in_flight[url] = future
+            return future
+
+    def fetch_all(self, urls):
+        """Load manifests for a list of urls concurrently. Returns a
+        dictionary of :class:`~piffle.presentation.IIIFPresentation` keyed
+        on url, with None for any manifest that could not be loaded."""
+        futures = {url: self.submit(url) for url in dict.fromkeys(urls)}
+        manifests = {}
+        for url, future in futures.items():
+            try:
+                manifests[url] = future.result()
+            except IIIFException as err:
+                logger.warning("Error loading IIIF manifest: %s (%s)" % (url, err))
+                manifests[url] = None
+        return manifests
+
+
+#: manifest fetcher for the current process
+manifest_fetcher = ManifestFetcher()
+
+
+def fetch_manifests(urls):
+    """Load remote IIIF manifests concurrently; see
+    :meth:`ManifestFetcher.fetch_all`."""
+    return manifest_fetcher.fetch_all(urls)
@@ -62,6 +62,62 @@ def empty_iiif_canvas():
     return canvas
 
 
+def canvas_from_djiffy(canvas):
+    """Build a IIIF canvas from a locally cached
+    :class:`djiffy.models.Canvas`, with a single image annotation
+    for the canvas image."""
+    return {
+        "@id": canvas.uri,
+        "@type": "sc:Canvas",
+        "label": canvas.label,
+        "width": canvas.width,
+        "height": canvas.height,
+        "images": [
+            {
+                "@type": "oa:Annotation",
+                "motivation": "sc:painting",
+                "resource": {
+                    "@id": str(canvas.image),
+                    "@type": "dctypes:Image",
+                    "format": "image/jpeg",
+                    "width": canvas.width,
+                    "height": canvas.height,
+                    "service": {
+                        "@context": "http://iiif.io/api/image/2/context.json",
+                        "@id": canvas.iiif_image_id,
+                        "profile": "http://iiif.io/api/image/2/level1.json",
+                    },
+                },
+                "on": canvas.uri,
+            }
+        ],
+    }
+
+
+def manifest_from_djiffy(manifest):
+    """Build a IIIF manifest from a locally cached
+    :class:`djiffy.models.Manifest` and its canvases, so that it can be
+    used in place of the remote manifest without an HTTP request."""
+    data = {
+        "@context": "http://iiif.io/api/presentation/2/context.json",
+        "@id": manifest.uri,
+        "@type": "sc:Manifest",
+        "label": manifest.label,
+        "sequences": [
+            {
+                "@type": "sc:Sequence",
+                "canvases": [
+                    canvas_from_djiffy(canvas) for canvas in manifest.canvases.all()
+                ],
+            }
+        ],
+    }
+    # attribution is optional; only include if the remote manifest had one
+    if "attribution" in manifest.extra_data:
+        data["attribution"] = manifest.extra_data["attribution"]
+    return IIIFPresentation(data)
+
+
 class AttrDictEncoder(DjangoJSONEncoder):
     # make attrdict json-serializable
     def default(self, obj):
@@ -77,24 +77,3 @@ def arabic_to_ja(text):
     # convert last letter to final form if necessary
     # needs to use regex to handle accented characters, which complicate last letter indexing
     return re.sub(re_he_final_letters, lambda m: he_final_letters[m.group(0)], text)
-
-
-def arabic_or_ja(text):
-    # if there is no arabic text, return as is
-    if not contains_arabic(text):
-        return text
-
-    # if there is arabic, split into words and make a pattern
-    # NOTE: this could fail on more complicated queriesn
-    words = re.split(r"\s+", text)
-    ja_words = [arabic_to_ja(word) for word in words]
-    search_words = []
-    for word, ja_word in dict(zip(words, ja_words)).items():
-        # if the words differ, combine them as an OR
-        if word != ja_word:
-            search_words.append("(%s|%s)" % (word, ja_word))
-        # otherwise, just return the one word
-        else:
-            search_words.append(word)
-    # combine them back into the search string
-    return " ".join(search_words)
@@ -0,0 +1,182 @@
+"""
+Manage command to check that the Solr index is consistent with
+:class:`~geniza.corpus.models.Document` records in the database, and
+optionally repair any differences.
+
+Generates index data for every document in the database (loaded in
+chunks) and compares its hash (see
+:meth:`~geniza.corpus.models.Document.index_data_hash`) with the hash
+stored in Solr when each document was indexed (loaded with cursor paging),
+so that changes to related records and status are detected without
+relying on timestamps from different servers. Reports drift:
+
+- documents in the database that are missing from Solr
+- documents in Solr that no longer exist in the database
+- documents whose index data has changed since they were indexed (e.g.
+  suppressed documents still indexed as public, or documents whose
+  footnotes have been edited); documents last changed with a partial
+  update have no stored hash, and are reported until they are reindexed
+
+With ``--repair``, missing and stale documents are reindexed and
+documents that no longer exist are deleted from Solr; nothing else
+is reindexed.
+
+Example usage::
+
+    # report drift between database and Solr
+    python manage.py check_index
+    # report and list drifted PGPIDs
+    python manage.py check_index -v 2
+    # reindex or remove drifted documents only
+    python manage.py check_index --repair
+
+"""
+
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import pluralize
+from parasolr.django import SolrClient
+
+from geniza.corpus.models import Document
+from geniza.corpus.solr_cache import mark_index_changed
+
+
+class Command(BaseCommand):
+    """Check for and repair differences between database and Solr index"""
+
+    help = __doc__
+
+    #: normal verbosity level
+    v_normal = 1
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Reindex missing and stale documents and remove deleted ones",
+        )
+        parser.add_argument(
+            "-p",
+            "--page-size",
+            type=int,
+            default=5000,
+            help="Number of documents per Solr request (default: %(default)s)",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options.get("verbosity", self.v_normal)
+        start_time = time.perf_counter()
+        solr = SolrClient()
+        try:
+            indexed = self.indexed_documents(solr, options["page_size"])
+        except requests.exceptions.ConnectionError as err:
+            # bail out if we error connecting to Solr
+            raise CommandError(err)
+        documents = self.database_documents()
+        drift = self.compare(documents, indexed)
+        self.report(drift, len(documents), len(indexed), start_time)
+
+        if options["repair"]:
+            try:
+                self.repair(solr, drift, indexed)
+            except requests.exceptions.ConnectionError as err:
+                raise CommandError(err)
+
+    def database_documents(self):
+        """Get the index data hash for all documents in the database, as
+        a dictionary keyed on PGPID."""
+        return {
+            doc.pk: doc.index_data()["index_hash_s"]
+            for chunk in Document.index_chunks(Document.items_to_index())
+            for doc in chunk
+        }
+
+    def indexed_documents(self, solr, page_size):
+        """Get Solr id and index data hash for all documents in Solr, as a
+        dictionary keyed on PGPID. Uses cursor paging to efficiently
+        retrieve all results."""
+        indexed = {}
+        cursor_mark = "*"
+        while True:
+            response = solr.query(
+                wrap=False,
+                q="*:*",
+                fq="item_type_s:%s" % Document.index_item_type(),
+                fl="id,pgpid_i,index_hash_s",
+                # cursor paging requires sort on unique key
+                sort="id asc",
+                rows=page_size,
+                cursorMark=cursor_mark,
+            )
+            if response is None:
+                raise CommandError("Error querying Solr")
+            for doc in response.response.docs:
+                indexed[doc.pgpid_i] = (doc.id, doc.get("index_hash_s"))
+            # cursor is unchanged when there are no more results
+            if response.nextCursorMark == cursor_mark:
+                break
+            cursor_mark = response.nextCursorMark
+        return indexed
+
+    def compare(self, documents, indexed):
+        """Compare database and indexed documents. Returns a dictionary of
+        sorted PGPID lists for missing, deleted, and stale documents."""
+        stale = [
+            pgpid
+            for pgpid in documents.keys() & indexed.keys()
+            # index data has changed since the document was indexed
+            if documents[pgpid] != indexed[pgpid][1]
+        ]
+        return {
+            "missing": sorted(documents.keys() - indexed.keys()),
+            "deleted": sorted(indexed.keys() - documents.keys()),
+            "stale": sorted(stale),
+        }
+
+    def report(self, drift, total_documents, total_indexed, start_time):
+        """Report the number of drifted documents of each kind."""
+        if self.verbosity < self.v_normal:
+            return
+        self.stdout.write(
+            "Checked {:,} document{} in database and {:,} in Solr in {:.2f}s".format(
+                total_documents,
+                pluralize(total_documents),
+                total_indexed,
+                time.perf_counter() - start_time,
+            )
+        )
+        labels = {
+            "missing": "missing from Solr",
+            "deleted": "in Solr but not in database",
+            "stale": "changed since indexing",
+        }
+        for key, label in labels.items():
+            self.stdout.write(
+                "{:,} document{} {}".format(
+                    len(drift[key]), pluralize(len(drift[key])), label
+                )
+            )
+            # list pgpids at higher verbosity
+            if drift[key] and self.verbosity > self.v_normal:
+                self.stdout.write("  %s" % ", ".join(str(p) for p in drift[key]))
+
+    def repair(self, solr, drift, indexed):
+        """Reindex missing and stale documents, and remove documents from
+        Solr that are no longer in the database."""
+        reindex = drift["missing"] + drift["stale"]
+        if reindex:
+            Document.index_items(Document.items_to_index().filter(pk__in=reindex))
+        if drift["deleted"]:
+            solr.update.delete_by_id([indexed[pgpid][0] for pgpid in drift["deleted"]])
+            Document.remove_transcription_lines(drift["deleted"], solr)
+        if reindex or drift["deleted"]:
+            solr.update.index([], commit=True)
+            mark_index_changed()
+        if self.verbosity >= self.v_normal:
+            self.stdout.write(
+                "Reindexed {:,} document{}; removed {:,} from Solr".format(
+                    len(reindex), pluralize(len(reindex)), len(drift["deleted"])
+                )
+            )
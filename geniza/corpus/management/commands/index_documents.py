@@ -0,0 +1,451 @@
+"""
+Manage command to reindex :class:`~geniza.corpus.models.Document` records
+in Solr in parallel.
+
+The list of PGPIDs is split into batches of at most ``--batch-size``
+documents. Each batch is loaded with the prefetching from
+:meth:`~geniza.corpus.models.Document.items_to_index` and converted to
+index data in a pool of worker processes; each worker has its own database
+connection and Solr session, and sends its batches to Solr as soon as they
+are ready. Transcription lines for each document (see
+:meth:`~geniza.corpus.models.Document.transcription_line_index_data`) are
+indexed along with it. Reports throughput per worker and total wall time.
+Use this command instead of parasolr's generic ``index`` command, which
+does not index or clear transcription lines.
+
+In ``--delta`` mode, only documents that have changed (directly or via
+related records) since the last successful delta run are reindexed; see
+:meth:`~geniza.corpus.models.Document.ids_changed_since`. The time of each
+successful run is stored as a :class:`~geniza.corpus.models.IndexWatermark`.
+If there is no watermark yet, all documents are indexed.
+
+With ``--offline``, IIIF images are indexed from locally cached manifests
+only, so indexing speed does not depend on remote IIIF servers. Fragments
+that have a IIIF url but no cached manifest are listed in a report at
+the end, so they can be imported with ``import_manifests``.
+
+With ``--changed-only``, index data is generated for every document but
+only sent to Solr when its hash (see
+:meth:`~geniza.corpus.models.Document.index_data_hash`) differs from the
+hash stored in Solr when the document was last indexed.
+
+With ``--shadow``, all documents are indexed into a separate shadow core
+(created from the configured configset, i.e. ``solr_conf``), so that the
+live core is not affected while the rebuild runs. Once the number of
+indexed documents has been verified against
+:meth:`~geniza.corpus.models.Document.total_to_index`, the shadow and live
+cores are swapped, so searches immediately use the new index. The
+previous index is kept in the shadow core until the next rebuild;
+``--rollback`` swaps the cores back to restore it.
+
+Example usage::
+
+    # reindex all documents with one worker per cpu
+    python manage.py index_documents
+    # reindex with four workers and batches of 500 documents
+    python manage.py index_documents --workers 4 --batch-size 500
+    # reindex in the current process only (no worker pool)
+    python manage.py index_documents --workers 1
+    # reindex documents changed since the last delta run
+    python manage.py index_documents --delta
+    # reindex without loading any remote IIIF manifests
+    python manage.py index_documents --offline
+    # only send documents to Solr if their index data has changed
+    python manage.py index_documents --changed-only
+    # rebuild in a shadow core and swap it with the live core when done
+    python manage.py index_documents --shadow
+    # swap back to the index that was live before the last shadow rebuild
+    python manage.py index_documents --rollback
+
+"""
+
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.template.defaultfilters import pluralize
+from django.utils import timezone
+from parasolr.django import SolrClient, SolrQuerySet
+from parasolr.solr import SolrClient as BaseSolrClient
+
+from geniza.corpus.models import Document, IndexWatermark
+from geniza.corpus.solr_cache import mark_index_changed
+
+#: solr client for the current process; initialized per worker
+solr_client = None
+
+
+def get_solr_client(core=None):
+    """Get a Solr client for the configured core, or for another core
+    on the same Solr server when `core` is specified."""
+    solr = SolrClient()
+    if core:
+        solr = BaseSolrClient(solr.solr_url, core, commitWithin=solr.commitWithin)
+    return solr
+
+
+def init_worker(offline=False, core=None):
+    """Initialize a worker process: make sure django is configured (required
+    when processes are spawned instead of forked), and create a Solr client
+    so that each worker has its own http session. If `offline` is True,
+    images are indexed from locally cached IIIF manifests only. If `core`
+    is specified, documents are indexed into that core instead of the
+    configured one."""
+    global solr_client
+    django.setup()
+    Document.index_remote_manifests = not offline
+    # any database connections inherited from the parent process must not
+    # be shared; close them so the worker opens its own
+    connections.close_all()
+    solr_client = get_solr_client(core)
+
+
+def pgpid_batches(pgpids, batch_size):
+    """Split a sorted list of PGPIDs into a list of consecutive batches,
+    each of which includes at most `batch_size` documents."""
+    return [pgpids[i : i + batch_size] for i in range(0, len(pgpids), batch_size)]
+
+
+def indexed_hashes(pgpids):
+    """Get the index data hashes currently stored in Solr for a batch
+    of documents by PGPID, as a dictionary keyed on Solr id."""
+    results = (
+        SolrQuerySet(solr_client)
+        .filter(
+            item_type_s=Document.index_item_type(),
+            pgpid_i__in=[str(pgpid) for pgpid in pgpids],
+        )
+        .only("id", "index_hash_s")
+        .get_results(rows=len(pgpids))
+    )
+    return {result["id"]: result.get("index_hash_s") for result in results}
+
+
+def index_pgpids(pgpids, changed_only=False):
+    """Generate index data for a batch of documents by PGPID
+    and send it to Solr. If `changed_only` is True, documents whose index
+    data hash matches the one in Solr are skipped. Returns a tuple of
+    process id, number of documents indexed, number skipped, and elapsed
+    time in seconds."""
+    start_time = time.perf_counter()
+    docs = list(Document.items_to_index().filter(id__in=pgpids))
+    index_data = [doc.index_data() for doc in docs]
+    skipped = 0
+    if changed_only and index_data:
+        current_hashes = indexed_hashes(pgpids)
+        changed = [
+            data
+            for data in index_data
+            if current_hashes.get(data["id"]) != data["index_hash_s"]
+        ]
+        skipped = len(index_data) - len(changed)
+        index_data = changed
+    if index_data:
+        solr_client.update.index(index_data)
+        # transcription lines only change when document index data changes
+        indexed_ids = set(data["id"] for data in index_data)
+        Document.index_transcription_lines(
+            [doc for doc in docs if doc.index_id() in indexed_ids], solr_client
+        )
+    return os.getpid(), len(index_data), skipped, time.perf_counter() - start_time
+
+
+class Command(BaseCommand):
+    """Reindex documents in Solr using a pool of worker processes"""
+
+    help = __doc__
+
+    #: name for the watermark used to track delta indexing
+    watermark_name = "document delta index"
+
+    #: suffix added to the configured core name for the shadow core
+    shadow_suffix = "_shadow"
+
+    #: normal verbosity level
+    v_normal = 1
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes (default: number of cpus; "
+            + "1 to index in the current process)",
+        )
+        parser.add_argument(
+            "-b",
+            "--batch-size",
+            type=int,
+            default=Document.index_chunk_size,
+            help="Maximum number of documents per batch (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-d",
+            "--delta",
+            action="store_true",
+            help="Only index documents changed since the last delta run",
+        )
+        parser.add_argument(
+            "--offline",
+            action="store_true",
+            help="Index images from locally cached IIIF manifests only, "
+            + "and report fragments with no cached manifest",
+        )
+        parser.add_argument(
+            "-c",
+            "--changed-only",
+            action="store_true",
+            help="Only send documents to Solr if their index data has changed",
+        )
+        parser.add_argument(
+            "-s",
+            "--shadow",
+            action="store_true",
+            help="Rebuild the full index in a shadow core, then swap it with "
+            + "the live core",
+        )
+        parser.add_argument(
+            "--rollback",
+            action="store_true",
+            help="Swap the live and shadow cores to restore the index that "
+            + "was live before the last shadow rebuild",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options.get("verbosity", self.v_normal)
+        if options["workers"] < 1 or options["batch_size"] < 1:
+            raise CommandError("Workers and batch size must be positive numbers")
+        if options["shadow"] and (options["delta"] or options["changed_only"]):
+            raise CommandError("Shadow rebuild always indexes all documents")
+
+        solr = SolrClient()
+        self.shadow_core = solr.collection + self.shadow_suffix
+        if options["rollback"]:
+            try:
+                self.rollback(solr)
+            except requests.exceptions.ConnectionError as err:
+                raise CommandError(err)
+            return
+
+        start_time = time.perf_counter()
+        # record the time before finding documents to index, so that
+        # any changes made while indexing will be included in the next run
+        run_started = timezone.now()
+        watermark = None
+        if options["delta"]:
+            watermark = IndexWatermark.objects.filter(name=self.watermark_name).first()
+
+        if watermark:
+            pgpids = sorted(Document.ids_changed_since(watermark.timestamp))
+            if self.verbosity >= self.v_normal:
+                self.stdout.write(
+                    "Found documents changed since %s" % watermark.timestamp
+                )
+        else:
+            pgpids = list(Document.objects.order_by("id").values_list("id", flat=True))
+        batches = pgpid_batches(pgpids, options["batch_size"])
+        if self.verbosity >= self.v_normal:
+            self.stdout.write(
+                "Indexing {:,} document{} in {:,} batch{} with {} worker{}".format(
+                    len(pgpids),
+                    pluralize(len(pgpids)),
+                    len(batches),
+                    pluralize(len(batches), "es"),
+                    options["workers"],
+                    pluralize(options["workers"]),
+                )
+            )
+
+        # index into the shadow core if requested; otherwise into the live core
+        core = None
+        if options["shadow"]:
+            core = self.shadow_core
+            try:
+                self.create_shadow_core(solr)
+            except requests.exceptions.ConnectionError as err:
+                raise CommandError(err)
+
+        # per-worker totals: number of documents and time spent indexing
+        worker_stats = defaultdict(lambda: {"count": 0, "skipped": 0, "time": 0.0})
+        try:
+            for pid, count, skipped, elapsed in self.index_batches(
+                batches,
+                options["workers"],
+                options["offline"],
+                options["changed_only"],
+                core,
+            ):
+                worker_stats[pid]["count"] += count
+                worker_stats[pid]["skipped"] += skipped
+                worker_stats[pid]["time"] += elapsed
+            # commit all the indexed changes
+            get_solr_client(core).update.index([], commit=True)
+            if options["shadow"]:
+                self.swap_shadow_core(solr, run_started)
+            else:
+                mark_index_changed()
+        except requests.exceptions.ConnectionError as err:
+            # bail out if we error connecting to Solr
+            raise CommandError(err)
+
+        # only update the watermark once all changes are indexed
+        if options["delta"]:
+            IndexWatermark.objects.update_or_create(
+                name=self.watermark_name, defaults={"timestamp": run_started}
+            )
+
+        self.report(worker_stats, time.perf_counter() - start_time)
+        if options["offline"]:
+            # limit to indexed documents for a delta; otherwise report all
+            self.report_missing_manifests(pgpids if watermark else None)
+
+    def index_batches(
+        self, batches, workers, offline=False, changed_only=False, core=None
+    ):
+        """Index a list of PGPID batches, either in the current process
+        or in a pool of worker processes. Generator; yields results from
+        :meth:`index_pgpids` as batches complete."""
+        if workers == 1:
+            init_worker(offline, core)
+            try:
+                for batch in batches:
+                    yield index_pgpids(batch, changed_only)
+            finally:
+                # restore default behavior for the current process
+                Document.index_remote_manifests = True
+            return
+
+        # close connections before starting worker processes, so that
+        # forked workers do not inherit and share an open connection
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=(offline, core)
+        ) as executor:
+            futures = [
+                executor.submit(index_pgpids, batch, changed_only) for batch in batches
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def create_shadow_core(self, solr):
+        """Create an empty shadow core for a full rebuild, using the
+        configured configset. Any existing shadow core (i.e., the index
+        from before the previous rebuild) is removed."""
+        if solr.core_admin.ping(self.shadow_core):
+            solr.core_admin.unload(
+                self.shadow_core, deleteIndex=True, deleteDataDir=True
+            )
+        config_set = settings.SOLR_CONNECTIONS["default"].get("CONFIGSET", "_default")
+        solr.core_admin.create(self.shadow_core, configSet=config_set)
+        if not solr.core_admin.ping(self.shadow_core):
+            raise CommandError("Failed to create shadow core %s" % self.shadow_core)
+        if self.verbosity >= self.v_normal:
+            self.stdout.write("Indexing into shadow core %s" % self.shadow_core)
+
+    def swap_shadow_core(self, solr, run_started):
+        """Verify the number of documents in the shadow core, then swap it
+        with the live core. Documents changed while the rebuild was running
+        were indexed into the live core, so they are reindexed again after
+        the swap."""
+        indexed = (
+            SolrQuerySet(get_solr_client(self.shadow_core))
+            .filter(item_type_s=Document.index_item_type())
+            .count()
+        )
+        expected = Document.total_to_index()
+        if indexed != expected:
+            raise CommandError(
+                "Shadow core %s has %d documents; expected %d. Live core not updated."
+                % (self.shadow_core, indexed, expected)
+            )
+        self.swap_cores(solr)
+        changed = Document.ids_changed_since(run_started)
+        if changed:
+            Document.index_items(Document.items_to_index().filter(pk__in=changed))
+        if self.verbosity >= self.v_normal:
+            self.stdout.write(
+                "Swapped shadow core into %s; run with --rollback to restore "
+                "the previous index" % solr.collection
+            )
+
+    def rollback(self, solr):
+        """Swap the live and shadow cores back, restoring the index
+        that was live before the last shadow rebuild."""
+        if not solr.core_admin.ping(self.shadow_core):
+            raise CommandError("No shadow core %s to roll back to" % self.shadow_core)
+        self.swap_cores(solr)
+        if self.verbosity >= self.v_normal:
+            self.stdout.write(
+                "Restored previous index from shadow core into %s" % solr.collection
+            )
+
+    def swap_cores(self, solr):
+        """Atomically swap the names of the live and shadow cores."""
+        response = solr.core_admin.make_request(
+            "get",
+            solr.core_admin.url,
+            params={
+                "action": "SWAP",
+                "core": solr.collection,
+                "other": self.shadow_core,
+            },
+        )
+        if response is None:
+            raise CommandError(
+                "Failed to swap cores %s and %s" % (solr.collection, self.shadow_core)
+            )
+        mark_index_changed()
+
+    def report(self, worker_stats, wall_time):
+        """Report throughput for each worker and the total elapsed time."""
+        if self.verbosity < self.v_normal:
+            return
+        total = skipped = 0
+        for i, stats in enumerate(worker_stats.values(), start=1):
+            total += stats["count"]
+            skipped += stats["skipped"]
+            self.stdout.write(
+                "Worker {}: {:,} document{} in {:.2f}s ({:,.1f} docs/sec)".format(
+                    i,
+                    stats["count"],
+                    pluralize(stats["count"]),
+                    stats["time"],
+                    stats["count"] / stats["time"] if stats["time"] else 0,
+                )
+            )
+        # using format for comma-separated numbers
+        self.stdout.write(
+            "Indexed {:,} document{} in {:.2f}s ({:,.1f} docs/sec)".format(
+                total,
+                pluralize(total),
+                wall_time,
+                total / wall_time if wall_time else 0,
+            )
+        )
+        if skipped:
+            self.stdout.write(
+                "Skipped {:,} unchanged document{}".format(skipped, pluralize(skipped))
+            )
+
+    def report_missing_manifests(self, pgpids):
+        """Report fragments on the indexed documents that have a IIIF url
+        but no locally cached manifest, and so were indexed without images."""
+        fragments = Document.fragments_without_manifest(pgpids)
+        total = fragments.count()
+        if not total or self.verbosity < self.v_normal:
+            return
+        self.stdout.write(
+            self.style.WARNING(
+                "{:,} fragment{} with no cached IIIF manifest "
+                "(run import_manifests to cache):".format(total, pluralize(total))
+            )
+        )
+        for fragment in fragments:
+            self.stdout.write("  %s\t%s" % (fragment.shelfmark, fragment.iiif_url))
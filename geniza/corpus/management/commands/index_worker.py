@@ -0,0 +1,145 @@
+"""
+Manage command to run a background worker that reindexes
+:class:`~geniza.corpus.models.Document` records queued for indexing.
+
+When **SOLR_INDEX_QUEUE** is enabled in settings, changes to documents and
+related records add PGPIDs to the
+:class:`~geniza.corpus.models.IndexQueueItem` table instead of indexing
+them during the request. This worker drains the queue in batches. Each
+batch is claimed in a short transaction using ``SELECT ... FOR UPDATE SKIP
+LOCKED``, so multiple workers can run at once without indexing the same
+documents, and indexed without holding any locks, so documents can still be
+queued while Solr is busy. Queued items are only removed once Solr has
+accepted the batch, so nothing is lost if indexing fails or the worker is
+stopped; documents that are changed again while a batch is being indexed
+stay in the queue for the next batch.
+
+Example usage::
+
+    # run continuously, checking for new items every five seconds
+    python manage.py index_worker
+    # index everything currently queued and then exit
+    python manage.py index_worker --once
+    # report queue depth and lag and exit
+    python manage.py index_worker --status
+
+"""
+
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import pluralize
+
+from geniza.corpus.models import Document, IndexQueueItem
+
+
+class Command(BaseCommand):
+    """Reindex documents from the database indexing queue"""
+
+    help = __doc__
+
+    #: normal verbosity level
+    v_normal = 1
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-b",
+            "--batch-size",
+            type=int,
+            default=Document.index_chunk_size,
+            help="Maximum number of documents per batch (default: %(default)s)",
+        )
+        parser.add_argument(
+            "-i",
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait when the queue is empty (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when the queue is empty instead of waiting for more",
+        )
+        parser.add_argument(
+            "--status",
+            action="store_true",
+            help="Report queue depth and lag and exit",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options.get("verbosity", self.v_normal)
+        if options["batch_size"] < 1:
+            raise CommandError("Batch size must be a positive number")
+
+        if options["status"]:
+            self.report_status()
+            return
+
+        try:
+            while True:
+                try:
+                    count = self.index_batch(options["batch_size"])
+                except requests.exceptions.ConnectionError as err:
+                    # bail out if we error connecting to Solr;
+                    # queued items are retained for the next run
+                    raise CommandError(err)
+                if count:
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            # queue items for an interrupted batch are released
+            self.stdout.write("Stopping index worker")
+
+    def index_batch(self, batch_size):
+        """Claim and index a batch of queued documents, and remove them
+        from the queue. Returns the number of queue items processed."""
+        items = IndexQueueItem.claim(batch_size)
+        if not items:
+            return 0
+        try:
+            # documents deleted since they were queued are skipped;
+            # they are removed from the index when deleted
+            documents = list(
+                Document.items_to_index().filter(pk__in=[item.pgpid for item in items])
+            )
+            success = Document.send_index_data(
+                [doc.index_data() for doc in documents]
+            ) and Document.index_transcription_lines(documents)
+        except BaseException:
+            # release the batch so it can be retried right away
+            IndexQueueItem.release(items)
+            raise
+        if not success:
+            IndexQueueItem.release(items)
+            self.stderr.write(
+                "Error indexing {:,} document{}; left in the queue to retry".format(
+                    len(documents), pluralize(documents)
+                )
+            )
+            return 0
+        # only remove items that have not been queued again since they
+        # were claimed; later changes may not be included in this batch
+        IndexQueueItem.dequeue(items)
+        indexed = len(documents)
+
+        if self.verbosity >= self.v_normal:
+            stats = IndexQueueItem.stats()
+            self.stdout.write(
+                "Indexed {:,} document{}; {:,} queued, lag {:.1f}s".format(
+                    indexed, pluralize(indexed), stats["depth"], stats["lag"]
+                )
+            )
+        return len(items)
+
+    def report_status(self):
+        """Report the current queue depth and lag."""
+        stats = IndexQueueItem.stats()
+        self.stdout.write(
+            "{:,} document{} queued, lag {:.1f}s".format(
+                stats["depth"], pluralize(stats["depth"]), stats["lag"]
+            )
+        )
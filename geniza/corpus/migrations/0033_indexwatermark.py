@@ -0,0 +1,29 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("corpus", "0032_revise_standard_date_help_text"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IndexWatermark",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, unique=True)),
+                ("timestamp", models.DateTimeField()),
+            ],
+        ),
+    ]
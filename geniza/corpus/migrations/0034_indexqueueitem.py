@@ -0,0 +1,35 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("corpus", "0033_indexwatermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IndexQueueItem",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "pgpid",
+                    models.PositiveIntegerField(unique=True, verbose_name="PGPID"),
+                ),
+                ("queued", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["queued"],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.13 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("corpus", "0034_indexqueueitem"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="indexqueueitem",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.13 on 2026-10-18 22:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("corpus", "0035_indexqueueitem_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="content_modified",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                editable=False,
+                help_text="Last change to this document or related records shown on its public pages",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.13 on 2026-10-18 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("corpus", "0036_document_content_modified"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="indexqueueitem",
+            name="claimed",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Time a worker started indexing this item",
+                null=True,
+            ),
+        ),
+    ]
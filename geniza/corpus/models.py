@@ -1,7 +1,13 @@
+import hashlib
+import json
 import logging
+import operator
+import threading
 from collections import defaultdict
-from functools import cached_property
-from itertools import chain
+from datetime import timedelta
+from functools import cached_property, reduce
+from itertools import chain, islice
+from urllib.parse import urljoin
 
 from django.conf import settings
 from django.contrib import admin, messages
@@ -11,13 +17,14 @@ from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres.fields import ArrayField
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
 from django.db.models.functions import Concat
 from django.db.models.functions.text import Lower
-from django.db.models.query import Prefetch
-from django.db.models.signals import pre_delete
+from django.db.models.query import Prefetch, prefetch_related_objects
+from django.db.models.signals import m2m_changed, pre_delete
 from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import strip_tags
 from django.utils.safestring import mark_safe
 from django.utils.translation import get_language
@@ -26,15 +33,17 @@ from djiffy.importer import ManifestImporter
 from djiffy.models import Manifest
 from parasolr.django.indexing import ModelIndexable
 from piffle.image import IIIFImageClient
-from piffle.presentation import IIIFException, IIIFPresentation
-from requests.exceptions import ConnectionError
+from piffle.presentation import IIIFException
 from taggit_selectize.managers import TaggableManager
-from urllib3.exceptions import HTTPError, NewConnectionError
+from urllib3.exceptions import NewConnectionError
 
 from geniza.common.models import TrackChangesModel
 from geniza.common.utils import absolutize_url
 from geniza.corpus.dates import DocumentDateMixin
-from geniza.corpus.iiif_utils import get_iiif_string
+from geniza.corpus.iiif_fetch import fetch_manifests
+from geniza.corpus.iiif_utils import get_iiif_string, manifest_from_djiffy
+from geniza.corpus.ja import arabic_to_ja, contains_arabic
+from geniza.corpus.solr_cache import mark_index_changed
 from geniza.corpus.solr_queryset import DocumentSolrQuerySet
 from geniza.footnotes.models import Creator, Footnote, Source
 
@@ -212,10 +221,12 @@ class Fragment(TrackChangesModel):
         """natural key: shelfmark"""
         return (self.shelfmark,)
 
-    def iiif_images(self):
+    def iiif_images(self, remote=True):
         """IIIF image URLs for this fragment. Returns a list of
         :class:`~piffle.image.IIIFImageClient` and corresponding list of labels,
-        or None if this fragement has no IIIF url associated."""
+        or None if this fragement has no IIIF url associated. If the manifest
+        is not cached locally, it is loaded from the remote url unless
+        `remote` is False."""
 
         # if there is no iiif for this fragment, bail out
         if not self.iiif_url:
@@ -228,20 +239,60 @@ class Fragment(TrackChangesModel):
                 images.append(canvas.image)
                 labels.append(canvas.label)
 
-        # if not cached, load from remote url
-        else:
-            try:
-                manifest = IIIFPresentation.from_url(self.iiif_url)
+        # if not cached, load from remote url (if allowed)
+        elif remote:
+            manifest = self.iiif_manifest()
+            if manifest is not None:
                 for canvas in manifest.sequences[0].canvases:
                     image_id = canvas.images[0].resource.service.id
                     images.append(IIIFImageClient(*image_id.rsplit("/", 1)))
                     # label provides library's recto/verso designation
                     labels.append(canvas.label)
-            except (IIIFException, ConnectionError, HTTPError):
-                logger.warning("Error loading IIIF manifest: %s" % self.iiif_url)
 
         return images, labels
 
+    def iiif_manifest(self, remote=True):
+        """IIIF manifest for this fragment as a
+        :class:`~piffle.presentation.IIIFPresentation`, built from the
+        locally cached manifest. If the manifest is not cached locally, it
+        is loaded from the remote url unless `remote` is False; remote loads
+        are logged, since they should only be needed until the manifest is
+        imported. Returns None if this fragment has no IIIF url or the
+        manifest could not be loaded."""
+        if not self.iiif_url:
+            return None
+        if self.manifest:
+            return manifest_from_djiffy(self.manifest)
+        if remote:
+            Fragment.load_remote_manifests([self])
+            return self.remote_manifest
+        return None
+
+    @staticmethod
+    def load_remote_manifests(fragments):
+        """Load remote IIIF manifests concurrently for any of the specified
+        fragments that have a IIIF url but no locally cached manifest, and
+        store them on the fragments as `remote_manifest`, so that
+        :meth:`iiif_manifest` and :meth:`iiif_images` do not request them
+        one at a time. Remote loads are logged, since they should only be
+        needed until the manifest is imported."""
+        pending = defaultdict(list)
+        for fragment in fragments:
+            if (
+                fragment.iiif_url
+                and not fragment.manifest
+                and not hasattr(fragment, "remote_manifest")
+            ):
+                pending[fragment.iiif_url].append(fragment)
+        if not pending:
+            return
+        for url in pending:
+            logger.warning("IIIF manifest not cached locally; loading %s" % url)
+        manifests = fetch_manifests(pending.keys())
+        for url, url_fragments in pending.items():
+            for fragment in url_fragments:
+                fragment.remote_manifest = manifests[url]
+
     def iiif_thumbnails(self):
         """html for thumbnails of iiif image, for display in admin"""
         # if there are no iiif images for this fragment, bail out
@@ -378,6 +429,16 @@ class DocumentSignalHandlers:
         "creator": "footnotes__source__authorship__creator",
     }
 
+    # lookup from model verbose name to document index data fields that
+    # can be updated with a partial update when a related record is saved
+    partial_update_fields = {
+        "tag": ["tags_ss_lower"],
+        "document type": ["type_s"],
+    }
+
+    #: documents queued for reindexing on commit, per thread
+    pending = threading.local()
+
     @staticmethod
     def related_change(instance, raw, mode):
         """reindex all associated documents when related data is changed"""
@@ -397,15 +458,96 @@ class DocumentSignalHandlers:
             return
 
         doc_filter = {"%s__pk" % doc_attr: instance.pk}
-        docs = Document.items_to_index().filter(**doc_filter)
-        if docs.exists():
+        # get ids now, since related records may be gone by the time
+        # the transaction is committed
+        pgpids = set(Document.objects.filter(**doc_filter).values_list("pk", flat=True))
+        if not pgpids:
+            return
+        # invalidate cached pages for affected documents
+        Document.mark_content_modified(pgpids)
+        partial_fields = DocumentSignalHandlers.partial_update_fields.get(model_name)
+        # only use partial update on save; deletion may require full reindexing
+        if partial_fields and mode == "save":
             logger.debug(
-                "%s %s, reindexing %d related document(s)",
+                "%s %s, queuing partial update for %d related document(s)",
                 model_name,
                 mode,
-                docs.count(),
+                len(pgpids),
             )
-            ModelIndexable.index_items(docs)
+            DocumentSignalHandlers.queue_partial_update(pgpids, partial_fields)
+        else:
+            logger.debug(
+                "%s %s, queuing %d related document(s) for reindexing",
+                model_name,
+                mode,
+                len(pgpids),
+            )
+            DocumentSignalHandlers.queue_reindex(pgpids)
+
+    @staticmethod
+    def queue_reindex(pgpids):
+        """Queue documents by PGPID to be reindexed when the current
+        transaction is committed. All changes within a single transaction
+        (e.g. saving a document with inlines in the admin) are reindexed
+        together in one deduplicated batch, and nothing is indexed if the
+        transaction is rolled back. Outside of a transaction, documents are
+        indexed immediately.
+
+        If **SOLR_INDEX_QUEUE** is enabled in settings, documents are added
+        to the :class:`IndexQueueItem` table instead, to be indexed in
+        the background by the ``index_worker`` manage command."""
+        if getattr(settings, "SOLR_INDEX_QUEUE", False):
+            IndexQueueItem.enqueue(pgpids)
+            return
+
+        pending = DocumentSignalHandlers.pending
+        callback = getattr(pending, "callback", None)
+        # django drops on-commit callbacks when the transaction (or the
+        # savepoint they were registered in) is rolled back, so the pending
+        # batch only belongs to the current transaction if its callback
+        # is still registered; otherwise queued documents are discarded
+        if callback is not None and any(
+            func is callback
+            for _sids, func in transaction.get_connection().run_on_commit
+        ):
+            pending.pgpids.update(pgpids)
+            return
+
+        def reindex():
+            DocumentSignalHandlers.reindex_pending()
+
+        pending.pgpids = set(pgpids)
+        pending.callback = reindex
+        transaction.on_commit(reindex)
+
+    @staticmethod
+    def queue_partial_update(pgpids, fields):
+        """Update the specified index data fields for documents by PGPID
+        with a Solr atomic update when the current transaction is committed;
+        see :meth:`Document.index_partial`. Partial updates are sent
+        directly; if **SOLR_INDEX_QUEUE** is enabled, documents are queued
+        for a full reindex instead, so that updates are applied in order."""
+        if getattr(settings, "SOLR_INDEX_QUEUE", False):
+            IndexQueueItem.enqueue(pgpids)
+            return
+        pgpids = list(pgpids)
+        transaction.on_commit(lambda: Document.index_partial(pgpids, fields))
+
+    @staticmethod
+    def reset_pending():
+        """Discard documents queued by :meth:`queue_reindex`."""
+        pending = DocumentSignalHandlers.pending
+        pending.pgpids = set()
+        pending.callback = None
+
+    @staticmethod
+    def reindex_pending():
+        """Reindex all documents queued by :meth:`queue_reindex`."""
+        pgpids = getattr(DocumentSignalHandlers.pending, "pgpids", None)
+        DocumentSignalHandlers.reset_pending()
+        if pgpids:
+            logger.debug("Reindexing %d document(s)", len(pgpids))
+            Document.index_items(Document.items_to_index().filter(pk__in=pgpids))
 
     @staticmethod
     def related_save(sender, instance=None, raw=False, **_kwargs):
@@ -457,6 +599,11 @@ class Document(ModelIndexable, DocumentDateMixin):
     notes = models.TextField(blank=True)
     created = models.DateTimeField(auto_now_add=True)
     last_modified = models.DateTimeField(auto_now=True)
+    content_modified = models.DateTimeField(
+        default=timezone.now,
+        editable=False,
+        help_text="Last change to this document or related records shown on its public pages",
+    )
     needs_review = models.TextField(
         blank=True,
         help_text="Enter text here if an administrator needs to review this document.",
@@ -507,6 +654,24 @@ class Document(ModelIndexable, DocumentDateMixin):
             # otherwise ignore (unsupported date format)
 
         super().save(*args, **kwargs)
+        # invalidate cached pages for this document and for documents on
+        # the same fragments, which display it as a related document
+        Document.mark_content_modified(self.same_fragment_pgpids())
+
+    @classmethod
+    def mark_content_modified(cls, pgpids):
+        """Update :attr:`content_modified` for documents by PGPID, so that
+        any cached pages for those documents are no longer used."""
+        cls.objects.filter(pk__in=pgpids).update(content_modified=timezone.now())
+
+    def same_fragment_pgpids(self):
+        """PGPIDs for this document and all documents that share any
+        fragments with it."""
+        return {self.pk} | set(
+            Document.objects.filter(fragments__documents=self).values_list(
+                "pk", flat=True
+            )
+        )
 
     # inherits clean method from DocumentDateMixin
     # make sure to call if extending!
@@ -583,6 +748,8 @@ class Document(ModelIndexable, DocumentDateMixin):
 
     def alphabetized_tags(self):
         """tags in alphabetical order, case-insensitive sorting"""
+        if self.is_prefetched("tags"):
+            return sorted(self.tags.all(), key=lambda tag: tag.name.lower())
         return self.tags.order_by(Lower("name"))
 
     def is_public(self):
@@ -613,11 +780,18 @@ class Document(ModelIndexable, DocumentDateMixin):
             )
         )
 
-    def iiif_images(self):
-        """List of IIIF images and labels for images of the Document's Fragments."""
+    def iiif_images(self, remote=True):
+        """List of IIIF images and labels for images of the Document's Fragments.
+        Specify `remote=False` to only use locally cached manifests.
+        When fragments have been prefetched, images are only loaded once."""
+        return self._prefetched_memo("_iiif_images", remote)
+
+    def _iiif_images(self, remote):
+        if remote:
+            Fragment.load_remote_manifests(b.fragment for b in self.textblock_set.all())
         iiif_images = []
         for b in self.textblock_set.all():
-            frag_images = b.fragment.iiif_images()
+            frag_images = b.fragment.iiif_images(remote=remote)
             if frag_images is not None:
                 images, labels = frag_images
                 iiif_images += [
@@ -626,6 +800,34 @@ class Document(ModelIndexable, DocumentDateMixin):
 
         return iiif_images
 
+    def iiif_manifests(self, remote=True):
+        """List of IIIF manifests for the Document's Fragments, one per
+        unique IIIF url, built from locally cached manifests when
+        available; see :meth:`Fragment.iiif_manifest`. Specify
+        `remote=False` to only use locally cached manifests. When
+        fragments have been prefetched, manifests are only loaded once."""
+        return self._prefetched_memo("_iiif_manifests", remote)
+
+    def _iiif_manifests(self, remote):
+        fragments = {}
+        for b in self.textblock_set.all():
+            if b.fragment.iiif_url:
+                fragments.setdefault(b.fragment.iiif_url, b.fragment)
+        if remote:
+            Fragment.load_remote_manifests(fragments.values())
+        manifests = [frag.iiif_manifest(remote=remote) for frag in fragments.values()]
+        return [manifest for manifest in manifests if manifest is not None]
+
+    def _prefetched_memo(self, method, remote):
+        # memoize on prefetched documents, so remote manifests for fragments
+        # without a cached manifest are not requested repeatedly
+        if self.is_prefetched("textblock_set"):
+            memo = self.__dict__.setdefault("%s_memo" % method, {})
+            if remote not in memo:
+                memo[remote] = getattr(self, method)(remote)
+            return memo[remote]
+        return getattr(self, method)(remote)
+
     def fragment_urls(self):
         """List of external URLs to view the Document's Fragments."""
         return list(
@@ -688,15 +890,31 @@ class Document(ModelIndexable, DocumentDateMixin):
 
     def digital_editions(self):
         """All footnotes for this document where the document relation includes
-        edition AND the footnote has content."""
+        edition AND the footnote has content. Returns a list when loaded
+        with :meth:`detail_queryset`."""
+        if hasattr(self, "prefetched_digital_editions"):
+            return self.prefetched_digital_editions
+        return self.digital_editions_queryset(self.footnotes.all())
+
+    @staticmethod
+    def digital_editions_queryset(footnotes):
+        """Filter and sort a footnote queryset to digital editions."""
         return (
-            self.footnotes.filter(doc_relation__contains=Footnote.EDITION)
+            footnotes.filter(doc_relation__contains=Footnote.EDITION)
             .filter(content__isnull=False)
             .order_by("content", "source")
         )
 
     def editors(self):
         """All unique authors of digital editions for this document."""
+        if hasattr(self, "prefetched_digital_editions"):
+            return list(
+                dict.fromkeys(
+                    authorship.creator
+                    for edition in self.prefetched_digital_editions
+                    for authorship in edition.source.authorship_set.all()
+                )
+            )
         return Creator.objects.filter(
             source__footnote__doc_relation__contains=Footnote.EDITION,
             source__footnote__content__isnull=False,
@@ -705,8 +923,15 @@ class Document(ModelIndexable, DocumentDateMixin):
 
     def sources(self):
         """All unique sources attached to footnotes on this document."""
+        if self.is_prefetched("footnotes"):
+            return list(dict.fromkeys(fn.source for fn in self.footnotes.all()))
         return Source.objects.filter(footnote__document=self).distinct()
 
+    def is_prefetched(self, lookup):
+        """Check if a related object lookup has been prefetched for this
+        document, so that derived values can be computed in memory."""
+        return lookup in getattr(self, "_prefetched_objects_cache", {})
+
     def attribution(self):
         """Generate a tuple of three attribution components for use in IIIF manifests
         or wherever images/transcriptions need attribution."""
@@ -715,14 +940,12 @@ class Document(ModelIndexable, DocumentDateMixin):
 
         # keep track of unique attributions so we can include them all
         extra_attrs_set = set()
-        for url in self.iiif_urls():
-            # NOTE: If this url fails, may raise IIIFException
-            remote_manifest = IIIFPresentation.from_url(url)
+        for manifest in self.iiif_manifests():
             # CUDL attribution has some variation in tags;
             # would be nice to preserve tagged version,
             # for now, ignore tags so we can easily de-dupe
             try:
-                extra_attrs_set.add(strip_tags(remote_manifest.attribution))
+                extra_attrs_set.add(strip_tags(manifest.attribution))
             except AttributeError:
                 # attribution is optional, so ignore if not present
                 pass
@@ -747,6 +970,51 @@ class Document(ModelIndexable, DocumentDateMixin):
         # quick count for parasolr indexing (don't do prefetching just to get the total!)
         return cls.objects.count()
 
+    #: whether to load IIIF manifests from remote urls when indexing
+    #: fragments that have no locally cached manifest; set to False to index
+    #: images from cached manifests only
+    index_remote_manifests = True
+
+    @classmethod
+    def fragments_without_manifest(cls, pgpids=None):
+        """Fragments with a IIIF url but no locally cached manifest,
+        optionally filtered to fragments on the specified documents."""
+        fragments = Fragment.objects.exclude(iiif_url="").filter(manifest__isnull=True)
+        if pgpids is not None:
+            fragments = fragments.filter(documents__pk__in=pgpids).distinct()
+        return fragments.order_by("shelfmark")
+
+    @classmethod
+    def detail_queryset(cls):
+        """Queryset for displaying a single document, with everything
+        needed by document detail pages loaded in a fixed number of
+        queries. Methods for derived values (:meth:`digital_editions`,
+        :meth:`editors`, :meth:`sources`, :meth:`alphabetized_tags`,
+        :meth:`iiif_images`) use the prefetched data."""
+        footnotes = Footnote.objects.select_related(
+            "source", "source__source_type"
+        ).prefetch_related("source__authorship_set__creator", "source__languages")
+        return Document.objects.select_related("doctype").prefetch_related(
+            "tags",
+            "languages",
+            "secondary_languages",
+            "log_entries",
+            Prefetch("footnotes", queryset=footnotes),
+            Prefetch(
+                "footnotes",
+                queryset=cls.digital_editions_queryset(footnotes),
+                to_attr="prefetched_digital_editions",
+            ),
+            Prefetch(
+                "textblock_set",
+                queryset=TextBlock.objects.select_related(
+                    "fragment", "fragment__collection", "fragment__manifest"
+                ),
+            ),
+            "textblock_set__fragment__manifest__canvases",
+            Prefetch("fragments", queryset=Fragment.objects.select_related("manifest")),
+        )
+
     @classmethod
     def items_to_index(cls):
         """Custom logic for finding items to be indexed when indexing in
@@ -766,13 +1034,280 @@ class Document(ModelIndexable, DocumentDateMixin):
                 Prefetch(
                     "textblock_set",
                     queryset=TextBlock.objects.select_related(
-                        "fragment", "fragment__collection"
+                        "fragment", "fragment__collection", "fragment__manifest"
                     ),
                 ),
+                "textblock_set__fragment__manifest__canvases",
             )
             .distinct()
         )
 
+    @classmethod
+    def index_items(cls, items, progbar=None):
+        """Extend :meth:`parasolr.indexing.Indexable.index_items` to index
+        transcription lines along with documents; see
+        :meth:`index_transcription_lines`. Documents are loaded and indexed
+        in chunks; see :meth:`index_chunks`.
+
+        NOTE: parasolr's ``index`` manage command does not use this method,
+        so it neither indexes nor clears transcription lines; use the
+        ``index_documents`` manage command to reindex instead."""
+        count = 0
+        for chunk in cls.index_chunks(items):
+            count += super().index_items(chunk)
+            cls.index_transcription_lines(chunk)
+            if progbar:
+                progbar.update(count)
+        mark_index_changed()
+        return count
+
+    @classmethod
+    def index_chunks(cls, items):
+        """Generator for lists of at most :attr:`index_chunk_size` items,
+        so that large querysets are not loaded into memory all at once.
+        Any prefetching on a queryset is applied to each chunk."""
+        prefetch_lookups = []
+        if isinstance(items, models.QuerySet):
+            # iterator does not prefetch in this version of django
+            prefetch_lookups = items._prefetch_related_lookups
+            items = items.iterator(chunk_size=cls.index_chunk_size)
+        items = iter(items)
+        chunk = list(islice(items, cls.index_chunk_size))
+        while chunk:
+            if prefetch_lookups:
+                prefetch_related_objects(chunk, *prefetch_lookups)
+            yield chunk
+            chunk = list(islice(items, cls.index_chunk_size))
+
+    #: item type for transcription lines, which are indexed as separate
+    #: Solr documents so that matching lines can be found without
+    #: highlighting full transcriptions
+    transcription_line_item_type = "transcription_line"
+
+    def transcription_line_index_data(self):
+        """Index data for each line of this document's digital editions,
+        with PGPID, edition footnote id, position, and line number."""
+        index_data = []
+        for fn in self.footnotes.all():
+            if Footnote.EDITION not in fn.doc_relation:
+                continue
+            for position, (number, text) in enumerate(fn.content_lines(), 1):
+                index_data.append(
+                    {
+                        "id": self.ID_SEPARATOR.join(
+                            [
+                                self.transcription_line_item_type,
+                                str(fn.pk),
+                                str(position),
+                            ]
+                        ),
+                        "item_type_s": self.transcription_line_item_type,
+                        "pgpid_i": self.id,
+                        "footnote_i": fn.pk,
+                        "line_i": position,
+                        "line_number_s": number or None,
+                        "text_t": text,
+                        # judaeo-arabic normalized text, as for description
+                        "text_ja_t": arabic_to_ja(text)
+                        if contains_arabic(text)
+                        else None,
+                    }
+                )
+        return index_data
+
+    @classmethod
+    def index_transcription_lines(cls, documents, solr=None):
+        """Index transcription lines for the specified documents, replacing
+        any lines previously indexed for them. Uses the Solr client for
+        the specified core if `solr` is set. Returns False if Solr
+        reported an error; see :meth:`send_index_data`."""
+        if not documents:
+            return True
+        cls._init_solr()
+        solr = solr or cls.solr
+        cls.remove_transcription_lines([doc.pk for doc in documents], solr)
+        index_data = list(
+            chain.from_iterable(
+                doc.transcription_line_index_data() for doc in documents
+            )
+        )
+        return cls.send_index_data(index_data, solr)
+
+    @classmethod
+    def send_index_data(cls, index_data, solr=None):
+        """Send index data to Solr, as :meth:`parasolr.solr.update.Update.index`
+        does, and return True if it was accepted. parasolr logs errors and
+        returns nothing, so this should be used when indexing must not
+        be considered done if Solr reports an error (e.g. by the
+        indexing queue worker)."""
+        if not index_data:
+            return True
+        cls._init_solr()
+        solr_update = (solr or cls.solr).update
+        response = solr_update.make_request(
+            "post",
+            urljoin(solr_update.url + "/", "json/docs"),
+            data=index_data,
+            params=solr_update.params.copy(),
+            headers=solr_update.headers,
+        )
+        mark_index_changed()
+        return response is not None
+
+    @classmethod
+    def remove_transcription_lines(cls, pgpids, solr=None):
+        """Remove indexed transcription lines for documents by PGPID."""
+        cls._init_solr()
+        solr = solr or cls.solr
+        pgpids = list(pgpids)
+        # delete in chunks to stay within the Solr boolean clause limit
+        for i in range(0, len(pgpids), cls.index_chunk_size):
+            solr.update.delete_by_query(
+                "item_type_s:%s AND pgpid_i:(%s)"
+                % (
+                    cls.transcription_line_item_type,
+                    " OR ".join(
+                        str(pgpid) for pgpid in pgpids[i : i + cls.index_chunk_size]
+                    ),
+                )
+            )
+
+    def remove_from_index(self):
+        """Extend to remove indexed transcription lines for this document."""
+        super().remove_from_index()
+        self.remove_transcription_lines([self.pk])
+        mark_index_changed()
+
+    def index(self):
+        """Queue this document to be reindexed when the current transaction
+        is committed, so that it is indexed once along with any related
+        changes; see :meth:`DocumentSignalHandlers.queue_reindex`.
+        If the only fields that have changed are in
+        :attr:`index_partial_fields`, the affected index fields are updated
+        with a partial update instead."""
+        # last modified is updated on every save but not indexed
+        changed = set(
+            field.attname
+            for field in self._meta.concrete_fields
+            if field.attname != "last_modified" and self.has_changed(field.attname)
+        )
+        if changed and changed.issubset(self.index_partial_fields):
+            DocumentSignalHandlers.queue_partial_update(
+                [self.pk],
+                set(chain(*(self.index_partial_fields[f] for f in changed))),
+            )
+        else:
+            DocumentSignalHandlers.queue_reindex([self.pk])
+
+    #: document fields that can be updated in Solr with an atomic (partial)
+    #: update, mapped to the index data fields that depend on them
+    index_partial_fields = {
+        "status": ["status_s"],
+        "needs_review": ["needs_review_t"],
+        "notes": ["notes_t"],
+        "doctype_id": ["type_s"],
+    }
+
+    #: Solr copy field destinations; these are stored, so they must be
+    #: cleared in partial updates to be copied again instead of duplicated
+    index_copy_fields = [
+        "shelfmark_t",
+        "shelfmark_textnum",
+        "tags_t",
+        "type_t",
+        "description_txt_ens",
+    ]
+
+    def simple_index_data(self):
+        """Index data based only on fields on this document, its type,
+        and its tags. These fields can be updated without regenerating
+        all index data; see :meth:`index_partial`."""
+        return {
+            "type_s": str(self.doctype) if self.doctype else _("Unknown type"),
+            "notes_t": self.notes or None,
+            "needs_review_t": self.needs_review or None,
+            # date range for filtering
+            "document_date_dr": self.solr_date_range(),
+            "tags_ss_lower": [t.name for t in self.tags.all()],
+            "status_s": self.get_status_display(),
+            # database last modified, for sorting in admin; solr
+            # last_modified is the time the document was indexed
+            "last_modified_dt": self.last_modified.isoformat().replace("+00:00", "Z")
+            if self.last_modified
+            else None,
+        }
+
+    def partial_index_data(self, fields):
+        """Solr atomic update to set the specified index data fields
+        (from :meth:`simple_index_data`) for this document."""
+        data = self.simple_index_data()
+        update = {
+            "id": self.index_id(),
+            # only update documents that are already in the index
+            "_version_": 1,
+            # date range is not stored, so it must always be sent
+            "document_date_dr": {"set": data["document_date_dr"]},
+            # document may have been saved
+            "last_modified_dt": {"set": data["last_modified_dt"]},
+            # stored hash no longer matches the full index data
+            "index_hash_s": {"set": None},
+            "last_modified": {"set": "NOW"},
+        }
+        update.update({field: {"set": data[field]} for field in fields})
+        update.update({field: {"set": None} for field in self.index_copy_fields})
+        return update
+
+    @classmethod
+    def index_partial(cls, pgpids, fields):
+        """Update the specified index data fields for documents by PGPID
+        using Solr atomic updates, rather than regenerating and sending
+        all index data. If the update fails (e.g. because a document
+        is not yet indexed), the documents are fully reindexed instead.
+        Returns the number of documents updated."""
+        docs = (
+            cls.objects.filter(pk__in=pgpids)
+            .select_related("doctype")
+            .prefetch_related("tags")
+        )
+        updates = [doc.partial_index_data(fields) for doc in docs]
+        if not updates:
+            return 0
+        cls._init_solr()
+        solr_update = cls.solr.update
+        # atomic updates must be sent to the main update handler
+        response = solr_update.make_request(
+            "post",
+            solr_update.url,
+            data=updates,
+            params=solr_update.params.copy(),
+            headers=solr_update.headers,
+        )
+        if response is None:
+            logger.warning(
+                "Partial index update failed; reindexing %d document(s)", len(updates)
+            )
+            cls.index_items(cls.items_to_index().filter(pk__in=pgpids))
+        mark_index_changed()
+        return len(updates)
+
+    @classmethod
+    def ids_changed_since(cls, timestamp):
+        """Set of PGPIDs for documents that need to be reindexed because
+        they or any of the related records indexed with them have changed
+        since the specified time. Uses :attr:`content_modified`, which the
+        signal handlers for :attr:`index_depends_on` and for tag and
+        language changes update whenever related records are saved or
+        deleted, whether in the admin, a script, an import, or the shell.
+
+        NOTE: changes made with bulk queryset updates or deletes, which do
+        not send signals, can not be found this way."""
+        return set(
+            cls.objects.filter(
+                models.Q(last_modified__gt=timestamp)
+                | models.Q(content_modified__gt=timestamp)
+            ).values_list("id", flat=True)
+        )
+
     def index_data(self):
         """data for indexing in Solr"""
         index_data = super().index_data()
@@ -780,23 +1315,25 @@ class Document(ModelIndexable, DocumentDateMixin):
         # get fragments via textblocks for correct order
         # and to take advantage of prefetching
         fragments = [tb.fragment for tb in self.textblock_set.all()]
-        images = self.iiif_images()
+        images = self.iiif_images(remote=self.index_remote_manifests)
+        # use english description for now
+        description = strip_tags(self.description_en)
+        index_data.update(self.simple_index_data())
         index_data.update(
             {
                 "pgpid_i": self.id,
-                "type_s": str(self.doctype) if self.doctype else _("Unknown type"),
-                # use english description for now
-                "description_t": strip_tags(self.description_en),
-                "notes_t": self.notes or None,
-                "needs_review_t": self.needs_review or None,
+                "description_t": description,
+                # description with arabic script converted to judaeo-arabic,
+                # so arabic search terms can be normalized the same way
+                "description_ja_t": arabic_to_ja(description)
+                if contains_arabic(description)
+                else None,
                 # index shelfmark label as a string (combined shelfmark OR shelfmark override)
                 "shelfmark_s": self.shelfmark_display,
                 # index individual shelfmarks for search (includes uncertain fragments)
                 "fragment_shelfmark_ss": [f.shelfmark for f in fragments],
                 # combined original/standard document date for display
                 "document_date_s": strip_tags(self.document_date) or None,
-                # date range for filtering
-                "document_date_dr": self.solr_date_range(),
                 # start/end of document date or date range
                 "start_date_i": self.start_date.numeric_format()
                 if self.start_date
@@ -806,8 +1343,6 @@ class Document(ModelIndexable, DocumentDateMixin):
                 else None,
                 # library/collection possibly redundant?
                 "collection_ss": [str(f.collection) for f in fragments],
-                "tags_ss_lower": [t.name for t in self.tags.all()],
-                "status_s": self.get_status_display(),
                 "old_pgpids_is": self.old_pgpids,
                 "language_code_ss": [lang.iso_code for lang in self.languages.all()],
                 # use image info link without trailing info.json to easily convert back to iiif image client
@@ -850,19 +1385,29 @@ class Document(ModelIndexable, DocumentDateMixin):
                 "num_translations_i": counts[Footnote.TRANSLATION],
                 "num_discussions_i": counts[Footnote.DISCUSSION],
                 # count each unique source as one scholarship record
-                "scholarship_count_i": self.sources().count(),
+                # (use sources from prefetched footnotes instead of querying)
+                "scholarship_count_i": len(source_relations),
                 # preliminary scholarship record indexing
                 # (may need splitting out and weighting based on type of scholarship)
                 "scholarship_t": [fn.display() for fn in self.footnotes.all()],
                 # text content of any transcriptions
                 "transcription_t": transcription_texts,
+                # transcription text with arabic script converted to judaeo-arabic
+                "transcription_ja_t": [
+                    arabic_to_ja(text)
+                    for text in transcription_texts
+                    if contains_arabic(text)
+                ],
                 "has_digital_edition_b": len(transcription_texts) > 0,
                 "has_translation_b": counts[Footnote.TRANSLATION] > 0,
                 "has_discussion_b": counts[Footnote.DISCUSSION] > 0,
             }
         )
 
-        last_log_entry = self.log_entries.last()
+        # use prefetched log entries; default order is most recent first,
+        # so the last entry is the earliest
+        log_entries = list(self.log_entries.all())
+        last_log_entry = log_entries[-1] if log_entries else None
         if last_log_entry:
             index_data["input_year_i"] = last_log_entry.action_time.year
             # TODO: would be nice to use full date to display year
@@ -873,8 +1418,26 @@ class Document(ModelIndexable, DocumentDateMixin):
                 "input_date_dt"
             ] = last_log_entry.action_time.isoformat().replace("+00:00", "Z")
 
+        # hash of all other index data, to detect when reindexing is needed
+        index_data["index_hash_s"] = self.index_data_hash(index_data)
         return index_data
 
+    @staticmethod
+    def index_data_hash(index_data):
+        """Stable hash of a dictionary of index data, used to skip sending
+        documents to Solr when their index data has not changed. Values of
+        multi-valued fields are sorted, since many come from unordered
+        many-to-many relationships."""
+        index_data = {
+            field: sorted(value, key=lambda val: json.dumps(val, default=str))
+            if isinstance(value, (list, tuple, set))
+            else value
+            for field, value in index_data.items()
+        }
+        return hashlib.sha1(
+            json.dumps(index_data, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
     # define signal handlers to update the index based on changes
     # to other models
     index_depends_on = {
@@ -1071,8 +1634,36 @@ def detach_document_logentries(sender, instance, **kwargs):
 
     To avoid deleting log entries caused by the generic relation
     from document to log entries, clear out object id
-    for associated log entries before deleting the document."""
+    for associated log entries before deleting the document.
+    Also invalidates cached pages for documents on the same fragments."""
     instance.log_entries.update(object_id=None)
+    Document.mark_content_modified(instance.same_fragment_pgpids() - {instance.pk})
+
+
+@receiver(m2m_changed, sender=Document.languages.through)
+@receiver(m2m_changed, sender=Document.secondary_languages.through)
+@receiver(m2m_changed, sender=Document.tags.through)
+def document_m2m_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """:class:`~Document` many-to-many changed signal handler for languages
+    and tags. Invalidates cached pages for affected documents."""
+    if isinstance(instance, Document):
+        if action in ["post_add", "post_remove", "post_clear"]:
+            Document.mark_content_modified([instance.pk])
+    elif model is Document:
+        if action in ["post_add", "post_remove"]:
+            Document.mark_content_modified(pk_set)
+        elif action == "pre_clear":
+            # affected documents are not known after a reverse clear
+            field = next(
+                field.name
+                for field in Document._meta.many_to_many
+                if field.remote_field.through is sender
+            )
+            Document.mark_content_modified(
+                Document.objects.filter(**{field: instance}).values_list(
+                    "pk", flat=True
+                )
+            )
 
 
 class TextBlock(models.Model):
@@ -1132,3 +1723,118 @@ class TextBlock(models.Model):
     def thumbnail(self):
         """iiif thumbnails for this fragment"""
         return self.fragment.iiif_thumbnails()
+
+
+class IndexWatermark(models.Model):
+    """Time of the last successful run of an incremental indexing process,
+    used to find records that have changed since then."""
+
+    name = models.CharField(max_length=255, unique=True)
+    timestamp = models.DateTimeField()
+
+    def __str__(self):
+        return "%s: %s" % (self.name, self.timestamp.isoformat())
+
+
+class IndexQueueItem(models.Model):
+    """A document waiting to be reindexed by the background indexing
+    worker. Each document is queued at most once; the queued time is
+    the time of the earliest change not yet indexed, and the version is
+    incremented for every change queued since then."""
+
+    pgpid = models.PositiveIntegerField("PGPID", unique=True)
+    queued = models.DateTimeField(auto_now_add=True)
+    version = models.PositiveIntegerField(default=1)
+    claimed = models.DateTimeField(
+        null=True, blank=True, help_text="Time a worker started indexing this item"
+    )
+
+    #: seconds after which items claimed by a worker that has not finished
+    #: indexing them (e.g. because it was stopped) can be claimed again
+    claim_timeout = 600
+
+    class Meta:
+        ordering = ["queued"]
+
+    def __str__(self):
+        return "PGPID %s (queued %s)" % (self.pgpid, self.queued.isoformat())
+
+    @classmethod
+    def enqueue(cls, pgpids):
+        """Add documents to the queue by PGPID. Documents that are already
+        queued keep their queued time, but their version is incremented,
+        so that a worker indexing an earlier version leaves them in the
+        queue; see :meth:`dequeue`. Since items are added in the current
+        transaction, nothing is queued if it is rolled back."""
+        pgpids = sorted(set(pgpids))
+        if not pgpids:
+            return
+        # insert or update in a single statement; bulk_create can only
+        # ignore conflicts in this version of django
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {table} (pgpid, queued, version) "
+                "SELECT pgpid, %s, 1 FROM unnest(%s::integer[]) AS pgpid "
+                "ON CONFLICT (pgpid) DO UPDATE "
+                "SET version = {table}.version + 1".format(
+                    table=connection.ops.quote_name(cls._meta.db_table)
+                ),
+                [timezone.now(), pgpids],
+            )
+
+    @classmethod
+    def claim(cls, batch_size):
+        """Claim up to `batch_size` of the oldest unclaimed items for
+        indexing, and return them. Rows are only locked (skipping rows
+        locked by other workers) while they are marked as claimed, in a
+        transaction of their own; documents can be queued again while
+        the claimed items are being indexed. Items claimed more than
+        :attr:`claim_timeout` seconds ago are claimed again."""
+        now = timezone.now()
+        with transaction.atomic():
+            items = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(
+                    models.Q(claimed__isnull=True)
+                    | models.Q(claimed__lt=now - timedelta(seconds=cls.claim_timeout))
+                )
+                .order_by("queued")[:batch_size]
+            )
+            cls.objects.filter(pk__in=[item.pk for item in items]).update(claimed=now)
+        return items
+
+    @classmethod
+    def release(cls, items):
+        """Release claimed items without removing them from the queue,
+        so that they are indexed again (e.g. when indexing failed)."""
+        cls.objects.filter(pk__in=[item.pk for item in items]).update(claimed=None)
+
+    @classmethod
+    def dequeue(cls, items):
+        """Remove queue items that have been indexed. Items that were
+        queued again since they were loaded (i.e., with a different
+        version) are released and left in the queue to be indexed again.
+        Returns the number of items removed."""
+        if not items:
+            return 0
+        matching = reduce(
+            operator.or_,
+            (models.Q(pk=item.pk, version=item.version) for item in items),
+        )
+        with transaction.atomic():
+            removed = cls.objects.filter(matching).delete()[0]
+            cls.release(items)
+        return removed
+
+    @classmethod
+    def stats(cls):
+        """Queue depth and lag: returns a dictionary with the number of
+        queued documents and the age of the oldest item in seconds
+        (zero if the queue is empty)."""
+        queue = cls.objects.aggregate(
+            depth=models.Count("pk"), oldest=models.Min("queued")
+        )
+        lag = 0
+        if queue["oldest"]:
+            lag = (timezone.now() - queue["oldest"]).total_seconds()
+        return {"depth": queue["depth"], "lag": lag}
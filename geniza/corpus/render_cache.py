@@ -0,0 +1,105 @@
+"""
+Cache for rendered blocks of document pages (document details and
+scholarship records), used via the ``documentcache`` template tag in
+:mod:`~geniza.corpus.templatetags.corpus_extras`.
+
+Rendered blocks are stored in the default Django cache, keyed on block
+name, PGPID, language, and the document's
+:attr:`~geniza.corpus.models.Document.content_modified` timestamp. That
+timestamp is stored in the database and updated when a document is saved,
+by the same signal handlers that reindex documents when related records
+change (see :attr:`~geniza.corpus.models.Document.index_depends_on`), and
+when languages or tags are added or removed, so edits only invalidate
+pages for the affected documents in every process. Content that comes
+from Solr, such as related documents, is not cached, since it is not
+updated until documents are reindexed.
+
+Blocks are cached for **DOCUMENT_RENDER_CACHE_TIMEOUT** seconds (default
+one day); set to 0 to disable. The render cache is only used when the
+default cache is shared between processes (e.g. database, memcached or
+redis), since a per-process local memory cache would mostly miss and
+duplicate rendered pages in every process.
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+#: cache key for a rendered block of a document page
+BLOCK_KEY = "document-render-%s-%d-%s-%s"
+
+
+def shared_cache():
+    """Check if the default cache is shared between processes."""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+class DocumentRenderCache:
+    """Cache for rendered blocks of document pages. Counts cache hits and
+    misses for this process for reporting."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get_timeout(self):
+        """Number of seconds to cache rendered blocks"""
+        return getattr(settings, "DOCUMENT_RENDER_CACHE_TIMEOUT", 60 * 60 * 24)
+
+    def enabled(self):
+        """Check if rendered blocks should be cached: requires a timeout
+        and a shared cache backend."""
+        return bool(self.get_timeout()) and shared_cache()
+
+    def get_or_render(self, name, document, language, render):
+        """Return the cached content for a block of a document page, or
+        call `render` to render it and add it to the cache."""
+        if not self.enabled():
+            return render()
+        key = BLOCK_KEY % (
+            name,
+            document.pk,
+            language,
+            document.content_modified.timestamp(),
+        )
+        content = cache.get(key)
+        with self.lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        logger.debug(
+            "Document render cache %s for %s (%d hits, %d misses)",
+            "miss" if content is None else "hit",
+            key,
+            self.hits,
+            self.misses,
+        )
+        if content is None:
+            content = render()
+            cache.set(key, content, self.get_timeout())
+        return content
+
+    def clear_stats(self):
+        """Reset hit and miss counts."""
+        with self.lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Return a dictionary with hit and miss counts and hit ratio."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0,
+        }
+
+
+#: render cache for the current process
+document_render_cache = DocumentRenderCache()
@@ -0,0 +1,174 @@
+"""
+Utilities for caching data derived from the Solr index.
+
+Cached values are keyed on the current Solr index version, which
+changes every time a commit modifies the index, so cached data is
+refreshed automatically after documents are indexed. To avoid an extra
+request to Solr on every page load, the index version is itself cached
+for **SOLR_INDEX_VERSION_TIMEOUT** seconds (default 30).
+
+Conditional requests for document pages are answered without querying
+Solr, so the indexing methods on :class:`~geniza.corpus.models.Document`
+record the time documents were last sent to Solr in the default cache;
+see :func:`index_changed`.
+
+Search results are cached in memory in each process, in a
+:class:`SearchResultCache` with at most **SEARCH_RESULT_CACHE_SIZE**
+entries (default 256). Hits and misses are reported for each request in
+the `Server-Timing` header and request log; see
+:class:`~geniza.common.middleware.ServerTimingMiddleware`.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from parasolr.django import SolrClient
+
+from geniza.common import timing
+from geniza.corpus.render_cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+#: cache key for the current Solr index version
+INDEX_VERSION_CACHE_KEY = "solr-index-version"
+
+
+def index_version():
+    """Return the current Solr index version, as reported by the Luke
+    request handler. Returns None if the version could not be determined."""
+    version = cache.get(INDEX_VERSION_CACHE_KEY)
+    if version is None:
+        solr = SolrClient()
+        response = solr.make_request(
+            "get",
+            solr.build_url(solr.solr_url, solr.collection, "admin/luke"),
+            params={"show": "index", "numTerms": 0},
+        )
+        # don't cache the version if Solr returned an error
+        if response is None:
+            return None
+        version = response.index.version
+        cache.set(
+            INDEX_VERSION_CACHE_KEY,
+            version,
+            getattr(settings, "SOLR_INDEX_VERSION_TIMEOUT", 30),
+        )
+    return version
+
+
+#: cache key for the time documents were last sent to Solr
+INDEX_CHANGED_CACHE_KEY = "solr-index-changed"
+
+
+def mark_index_changed():
+    """Record the current time as the time documents were last sent to
+    Solr; see :func:`index_changed`."""
+    cache.set(INDEX_CHANGED_CACHE_KEY, time.time(), None)
+
+
+def index_changed():
+    """Return the time documents were last sent to Solr, as recorded by
+    :func:`mark_index_changed`, for use as a version of indexed content
+    that can be checked without a Solr request. If no time has been
+    recorded (e.g. the cache was cleared), the current time is recorded.
+
+    Returns None when the time can't be relied on: if the default cache is
+    not shared between processes (see
+    :func:`~geniza.corpus.render_cache.shared_cache`), so that changes
+    indexed by other processes are not seen, or if documents were sent
+    to Solr less than the configured **COMMITWITHIN** ago, so that they
+    may not be searchable yet."""
+    if not shared_cache():
+        return None
+    changed = cache.get(INDEX_CHANGED_CACHE_KEY)
+    if changed is None:
+        changed = time.time()
+        # don't overwrite a time recorded by another process
+        if not cache.add(INDEX_CHANGED_CACHE_KEY, changed, None):
+            changed = cache.get(INDEX_CHANGED_CACHE_KEY, changed)
+    commit_within = (
+        getattr(settings, "SOLR_CONNECTIONS", {})
+        .get("default", {})
+        .get("COMMITWITHIN", 0)
+    )
+    if time.time() - changed < commit_within / 1000:
+        return None
+    return changed
+
+
+class SearchResultCache:
+    """Bounded in-memory cache for search results; when the cache is full,
+    the least recently used entry is evicted. Counts cache hits and
+    misses for reporting. Cached values are shared by all requests, and
+    should be plain data that does not hold connections or querysets,
+    and should not be modified."""
+
+    #: name of the cache for request timing
+    timing_name = "search_cache"
+
+    def __init__(self, max_size=None):
+        #: maximum number of entries; defaults to **SEARCH_RESULT_CACHE_SIZE**
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get_max_size(self):
+        """Maximum number of entries to keep in the cache."""
+        if self.max_size is not None:
+            return self.max_size
+        return getattr(settings, "SEARCH_RESULT_CACHE_SIZE", 256)
+
+    def get(self, key):
+        """Return the cached value for a key and mark it as recently used,
+        or None if the key is not in the cache."""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+        timing.record_cache(self.timing_name, value is not None)
+        logger.debug(
+            "Search result cache %s (%d hits, %d misses)",
+            "miss" if value is None else "hit",
+            self.hits,
+            self.misses,
+        )
+        return value
+
+    def set(self, key, value):
+        """Add a value to the cache, evicting the least recently used
+        entries if the cache is full."""
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.get_max_size():
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries and reset hit and miss counts."""
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Return a dictionary with hit and miss counts, hit ratio, and
+        current and maximum size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0,
+            "size": len(self.entries),
+            "max_size": self.get_max_size(),
+        }
+
+
+#: search result cache for the current process
+search_result_cache = SearchResultCache()
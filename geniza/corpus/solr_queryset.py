@@ -1,9 +1,11 @@
 import re
 
+from django.utils.html import escape
 from parasolr.django import AliasedSolrQuerySet
+from parasolr.solr.client import QueryResponse
 from piffle.image import IIIFImageClient
 
-from geniza.corpus.ja import arabic_or_ja
+from geniza.corpus.ja import arabic_to_ja, contains_arabic
 
 
 class DocumentSolrQuerySet(AliasedSolrQuerySet):
@@ -64,6 +66,10 @@ class DocumentSolrQuerySet(AliasedSolrQuerySet):
         flags=re.DOTALL,
     )
 
+    # regex for terms in a search string; field names and quoted phrases
+    # are kept together, so a term can be rewritten as a whole
+    re_search_terms = re.compile(r'[^\s"()]*"[^"]*"|[^\s"()]+')
+
     def _search_term_cleanup(self, search_term):
         # adjust user search string before sending to solr
 
@@ -78,7 +84,15 @@ class DocumentSolrQuerySet(AliasedSolrQuerySet):
                 lambda x: "%s:" % self.search_aliases[x.group(1)], search_term
             )
 
-        return arabic_or_ja(search_term)
+        # search for terms in arabic script in both arabic and judaeo-arabic,
+        # to match text indexed in both scripts via the judaeo-arabic
+        # normalized fields as well as arabic text in other fields
+        return self.re_search_terms.sub(
+            lambda m: "(%s OR %s)" % (m.group(0), arabic_to_ja(m.group(0)))
+            if contains_arabic(m.group(0))
+            else m.group(0),
+            search_term,
+        )
 
     # (adapted from mep)
     # edismax alias for searching on admin document pseudo-field
@@ -112,9 +126,102 @@ class DocumentSolrQuerySet(AliasedSolrQuerySet):
             )
         )
 
+    #: JSON Facet API results from the last query; see :meth:`get_json_facets`
+    _json_facets = None
+    #: next cursor mark from the last query; see :meth:`get_next_cursor_mark`
+    _next_cursor_mark = None
+
+    #: sort to break ties for cursor paging; Solr requires the unique key
+    #: field, and pgpid keeps ties in a stable, meaningful order
+    cursor_sort = ["pgpid_i asc", "id asc"]
+
+    def cursor(self, cursor_mark="*"):
+        """Return a copy of the queryset that uses Solr cursor paging,
+        starting from the specified cursor mark, so that deep pages are as
+        fast as the first page. Adds :attr:`cursor_sort` as tie-breakers
+        to the current sort. Use slicing only to set the number of rows;
+        the start must be zero when paging with a cursor."""
+        qs_copy = self.raw_query_parameters(cursorMark=cursor_mark)
+        sort_fields = [sort.split()[0] for sort in qs_copy.sort_options]
+        qs_copy.sort_options.extend(
+            sort for sort in self.cursor_sort if sort.split()[0] not in sort_fields
+        )
+        return qs_copy
+
+    def get_results(self, **kwargs):
+        """Extend :meth:`parasolr.query.queryset.SolrQuerySet.get_results`
+        to keep the JSON Facet API section and next cursor mark of the Solr
+        response, which are not included in parasolr's query response."""
+        query_opts = self.query_opts()
+        query_opts.update(**kwargs)
+        response = self.solr.query(wrap=False, **query_opts)
+        # if there is a query error, result will not be set
+        self._result_cache = QueryResponse(response) if response else None
+        self._json_facets = response.get("facets", {}) if response else {}
+        self._next_cursor_mark = response.get("nextCursorMark") if response else None
+        if self._result_cache:
+            return [self.get_result_document(doc) for doc in self._result_cache.docs]
+        return []
+
+    def get_json_facets(self):
+        """Return JSON Facet API results (i.e., for facets requested with
+        a ``json.facet`` raw query parameter) from the Solr response."""
+        if self._json_facets is None:
+            self.get_results()
+        return self._json_facets
+
+    def get_next_cursor_mark(self):
+        """Return the cursor mark for the next page of results when using
+        :meth:`cursor` paging, or None if there are no more results."""
+        # json facets are set when results have been retrieved
+        if self._json_facets is None:
+            self.get_results()
+        # solr returns the current cursor mark when there are no more results
+        if self._next_cursor_mark != self.raw_params.get("cursorMark"):
+            return self._next_cursor_mark
+
+    #: result field for the transcription lines that match a keyword
+    #: search; see :meth:`with_transcription_lines`
+    lines_field = "transcription_lines"
+
+    #: edismax query for transcription lines; search fields for line
+    #: records are configured in solrconfig
+    line_search_qf = "{!type=edismax qf=$line_qf pf=$line_pf v=$keyword_query}"
+
+    def with_transcription_lines(self, search_term, lines_per_document):
+        """Include up to `lines_per_document` transcription lines that best
+        match a keyword search with each document in the results. Lines are
+        indexed as separate records (see
+        :meth:`~geniza.corpus.models.Document.transcription_line_index_data`),
+        and are retrieved in the same Solr request with the subquery
+        document transformer, so that matching lines can be shown without
+        highlighting full transcriptions or making a separate request."""
+        prefix = self.lines_field
+        # pgpid field is requested without an alias, so it can be
+        # referenced by the subquery for each result
+        return self.also("pgpid_i", **{prefix: "[subquery]"}).raw_query_parameters(
+            **{
+                "%s.q" % prefix: self.line_search_qf,
+                "%s.keyword_query" % prefix: self._search_term_cleanup(search_term),
+                "%s.fq"
+                % prefix: [
+                    "item_type_s:transcription_line",
+                    "{!term f=pgpid_i v=$row.pgpid_i}",
+                ],
+                "%s.fl" % prefix: "line:line_i,line_number:line_number_s,text:text_t",
+                "%s.rows" % prefix: lines_per_document,
+            }
+        )
+
     def get_result_document(self, doc):
         # default implementation converts from attrdict to dict
         doc = super().get_result_document(doc)
+        # matching transcription lines, if requested, in line order
+        if self.lines_field in doc:
+            doc[self.lines_field] = sorted(
+                (dict(line) for line in doc[self.lines_field]["docs"]),
+                key=lambda line: line["line"],
+            )
         # convert indexed iiif image paths to IIIFImageClient objects
         images = doc.get("iiif_images", [])
         doc["iiif_images"] = [IIIFImageClient(*img.rsplit("/", 1)) for img in images]
@@ -122,3 +229,32 @@ class DocumentSolrQuerySet(AliasedSolrQuerySet):
         labels = doc.get("iiif_labels", [])
         doc["iiif_images"] = list(zip(doc["iiif_images"], labels))
         return doc
+
+
+#: regex for words in a keyword search, with an optional wildcard
+re_search_word = re.compile(r"(\w+)(\*)?")
+
+
+def highlight_search_terms(text, search_term):
+    """Escape text and mark words that match the terms of a keyword search
+    with ``<em>`` tags, as Solr highlighting does. Used for transcription
+    lines, which are returned without Solr highlighting; see
+    :meth:`DocumentSolrQuerySet.with_transcription_lines`. Arabic search
+    terms also match their Judaeo-Arabic equivalents."""
+    patterns = set()
+    for word, wildcard in re_search_word.findall(search_term):
+        if word in ["AND", "OR", "NOT"]:
+            continue
+        for term in {word, arabic_to_ja(word)}:
+            patterns.add(re.escape(term) + (r"\w*" if wildcard else ""))
+    text = escape(text)
+    if not patterns:
+        return text
+    # longest terms first, so that the longest match is highlighted;
+    # don't match inside escaped html entities
+    return re.sub(
+        r"(?<![\w&#])(%s)(?!\w)" % "|".join(sorted(patterns, key=len, reverse=True)),
+        r"<em>\1</em>",
+        text,
+        flags=re.IGNORECASE,
+    )
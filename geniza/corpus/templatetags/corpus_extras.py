@@ -5,10 +5,12 @@ from django import template
 from django.templatetags.static import static
 from django.urls import reverse
 from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
 from natsort import natsorted
 from piffle.iiif import IIIFImageClientException
 
 from geniza.common.utils import absolutize_url
+from geniza.corpus.render_cache import document_render_cache
 
 register = template.Library()
 
@@ -39,6 +41,48 @@ def dict_item(dictionary, key):
         return None
 
 
+@register.tag
+def documentcache(parser, token):
+    """Template tag to cache a rendered block of a document page for
+    anonymous users; see :mod:`geniza.corpus.render_cache`. Content is
+    rendered every time for logged-in users, since it may include
+    user-specific content such as edit links. Example use::
+
+        {% documentcache "detail" document %}
+            ...
+        {% enddocumentcache %}
+    """
+    try:
+        _tag, name, document = token.split_contents()
+    except ValueError:
+        raise template.TemplateSyntaxError(
+            "%r tag requires a block name and a document" % token.contents.split()[0]
+        )
+    nodelist = parser.parse(("enddocumentcache",))
+    parser.delete_first_token()
+    return DocumentCacheNode(
+        nodelist, parser.compile_filter(name), parser.compile_filter(document)
+    )
+
+
+class DocumentCacheNode(template.Node):
+    def __init__(self, nodelist, name, document):
+        self.nodelist = nodelist
+        self.name = name
+        self.document = document
+
+    def render(self, context):
+        request = context.get("request")
+        if request is None or request.user.is_authenticated:
+            return self.nodelist.render(context)
+        return document_render_cache.get_or_render(
+            self.name.resolve(context),
+            self.document.resolve(context),
+            get_language(),
+            lambda: self.nodelist.render(context),
+        )
+
+
 @register.simple_tag(takes_context=True)
 def querystring_replace(context, **kwargs):
     """Template tag to simplify retaining querystring parameters
@@ -46,6 +90,9 @@ def querystring_replace(context, **kwargs):
     Example use::
 
         <a href="?{% querystring_replace page=paginator.next_page_number %}">
+
+    Parameters passed in as None or empty (e.g. unset template
+    variables) are removed.
     """
     # borrowed as-is from derrida codebase
     # inspired by https://stackoverflow.com/questions/2047622/how-to-paginate-django-with-other-get-variables
@@ -56,7 +103,10 @@ def querystring_replace(context, **kwargs):
     # NOTE: needs to *set* fields rather than using update,
     # because QueryDict update appends to field rather than replacing
     for key, val in kwargs.items():
-        querystring[key] = val
+        if val is None or val == "":
+            querystring.pop(key, None)
+        else:
+            querystring[key] = val
     # return urlencoded query string
     return querystring.urlencode()
 
@@ -0,0 +1,110 @@
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from attrdict import AttrDict
+from django.core.management import call_command
+
+from geniza.corpus.management.commands import check_index
+
+
+def solr_page(docs, next_cursor):
+    # simulated solr response with cursor mark
+    return AttrDict({"response": {"docs": docs}, "nextCursorMark": next_cursor})
+
+
+def solr_doc(pgpid, index_hash="abc"):
+    return {"id": "document.%d" % pgpid, "pgpid_i": pgpid, "index_hash_s": index_hash}
+
+
+@patch("geniza.corpus.management.commands.check_index.SolrClient")
+def test_indexed_documents(mock_solrclient):
+    mock_solr = mock_solrclient.return_value
+    partial_update = solr_doc(3)
+    del partial_update["index_hash_s"]
+    mock_solr.query.side_effect = [
+        solr_page([solr_doc(1), solr_doc(2, "def")], "AoE1"),
+        solr_page([partial_update], "AoE2"),
+        solr_page([], "AoE2"),
+    ]
+    cmd = check_index.Command()
+    indexed = cmd.indexed_documents(mock_solr, 2)
+    assert indexed == {
+        1: ("document.1", "abc"),
+        2: ("document.2", "def"),
+        # no hash stored after a partial update
+        3: ("document.3", None),
+    }
+    assert mock_solr.query.call_count == 3
+    assert mock_solr.query.call_args_list[0][1]["fl"] == "id,pgpid_i,index_hash_s"
+    # cursor mark from previous response is passed on
+    assert mock_solr.query.call_args_list[0][1]["cursorMark"] == "*"
+    assert mock_solr.query.call_args_list[1][1]["cursorMark"] == "AoE1"
+    assert mock_solr.query.call_args_list[2][1]["rows"] == 2
+
+
+@pytest.mark.django_db
+def test_database_documents(document, join):
+    hashes = check_index.Command().database_documents()
+    assert hashes == {
+        document.pk: document.index_data()["index_hash_s"],
+        join.pk: join.index_data()["index_hash_s"],
+    }
+
+
+def test_compare():
+    documents = {1: "abc", 2: "def", 3: "ghi", 4: "jkl"}
+    indexed = {
+        1: ("document.1", "abc"),
+        2: ("document.2", "xyz"),
+        3: ("document.3", None),
+        5: ("document.5", "mno"),
+    }
+    assert check_index.Command().compare(documents, indexed) == {
+        "missing": [4],
+        "deleted": [5],
+        # 2 changed since indexed; 3 has no stored hash
+        "stale": [2, 3],
+    }
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.management.commands.check_index.Document.index_items")
+@patch("geniza.corpus.management.commands.check_index.SolrClient")
+def test_handle(mock_solrclient, mock_indexitems, document, join):
+    mock_solr = mock_solrclient.return_value
+    current_hash = document.index_data()["index_hash_s"]
+    mock_solr.query.side_effect = [
+        solr_page([solr_doc(document.pk, current_hash), solr_doc(12345)], "AoE1"),
+        solr_page([], "AoE1"),
+    ]
+    stdout = StringIO()
+    call_command("check_index", verbosity=2, stdout=stdout)
+    output = stdout.getvalue()
+    assert "Checked 2 documents in database and 2 in Solr" in output
+    assert "1 document missing from Solr\n  %d" % join.pk in output
+    assert "1 document in Solr but not in database\n  12345" in output
+    assert "0 documents changed since indexing" in output
+    # report only; no changes
+    mock_indexitems.assert_not_called()
+    mock_solr.update.delete_by_id.assert_not_called()
+
+    # related record changed without updating the document: stale
+    document.tags.add("marriage")
+    mock_solr.query.side_effect = [
+        solr_page([solr_doc(document.pk, current_hash), solr_doc(12345)], "AoE1"),
+        solr_page([], "AoE1"),
+    ]
+    stdout = StringIO()
+    call_command("check_index", repair=True, stdout=stdout)
+    assert set(doc.pk for doc in mock_indexitems.call_args[0][0]) == {
+        document.pk,
+        join.pk,
+    }
+    mock_solr.update.delete_by_id.assert_called_with(["document.12345"])
+    # transcription lines for deleted document are removed
+    mock_solr.update.delete_by_query.assert_called_with(
+        "item_type_s:transcription_line AND pgpid_i:(12345)"
+    )
+    mock_solr.update.index.assert_called_with([], commit=True)
+    assert "Reindexed 2 documents; removed 1 from Solr" in stdout.getvalue()
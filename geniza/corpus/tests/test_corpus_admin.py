@@ -21,11 +21,13 @@ from pytest_django.asserts import assertContains, assertNotContains
 
 from geniza.corpus.admin import (
     DocumentAdmin,
+    DocumentChangeList,
     DocumentForm,
     FragmentAdmin,
     FragmentTextBlockInline,
     HasTranscriptionListFilter,
     LanguageScriptAdmin,
+    SolrPagedResults,
 )
 from geniza.corpus.models import (
     Collection,
@@ -369,6 +371,97 @@ class TestDocumentAdmin:
         assert resp["location"] == reverse("admin:corpus_document_changelist")
 
 
+class TestSolrPagedResults:
+    def test_count(self):
+        mock_sqs = Mock()
+        results = SolrPagedResults(mock_sqs, Mock())
+        mock_sqs.only.assert_called_with("pgpid")
+        mock_sqs.only.return_value.count.return_value = 120
+        assert results.count() == 120
+        assert len(results) == 120
+
+    def test_getitem(self):
+        mock_sqs = Mock()
+        mock_sqs.only.return_value.__getitem__ = Mock(
+            return_value=[{"pgpid": 3}, {"pgpid": 1}, {"pgpid": 2}]
+        )
+        mock_queryset = Mock()
+        # pgpid 2 has been deleted from the database
+        docs = [Mock(pk=1), Mock(pk=3)]
+        mock_queryset.filter.return_value = docs
+        results = SolrPagedResults(mock_sqs, mock_queryset)
+        # returned in solr order
+        assert results[0:3] == [docs[1], docs[0]]
+        mock_sqs.only.return_value.__getitem__.assert_called_with(slice(0, 3))
+        mock_queryset.filter.assert_called_with(pk__in=[3, 1, 2])
+
+
+class TestDocumentChangeList:
+    def test_solr_paged_search(self, document, join, admin_client):
+        # index fixture data in solr
+        Document.index_items([document, join])
+        time.sleep(1)
+
+        url = reverse("admin:corpus_document_changelist")
+        response = admin_client.get(url, {"q": "deed of sale"})
+        cl = response.context["cl"]
+        assert isinstance(cl, DocumentChangeList)
+        assert cl.solr_queryset is not None
+        assert cl.result_count == 1
+        assert cl.full_result_count == 2
+        assert cl.result_list == [document]
+
+        # no search results
+        response = admin_client.get(url, {"q": "bogus"})
+        assert response.context["cl"].result_count == 0
+        assert response.context["cl"].result_list == []
+
+        # sort by pgpid, descending
+        cl_id_column = cl.list_display.index("id")
+        response = admin_client.get(url, {"q": "*", "o": "-%d" % cl_id_column})
+        cl = response.context["cl"]
+        assert cl.get_solr_sort() == ["-pgpid_i", "pgpid_i"]
+        assert cl.result_list == [join, document]
+
+        # sort by database last modified, not the time indexed
+        Document.objects.filter(pk=document.pk).update(
+            last_modified=timezone.now() - timedelta(days=1)
+        )
+        Document.index_items(Document.objects.filter(pk__in=[document.pk, join.pk]))
+        time.sleep(1)
+        modified_column = cl.list_display.index("last_modified")
+        response = admin_client.get(url, {"q": "*", "o": "-%d" % modified_column})
+        cl = response.context["cl"]
+        assert cl.get_solr_sort() == ["-last_modified_dt", "pgpid_i"]
+        assert cl.result_list == [join, document]
+
+    def test_database_search_fallback(self, document, join, admin_client):
+        Document.index_items([document, join])
+        time.sleep(1)
+
+        url = reverse("admin:corpus_document_changelist")
+        # no search term
+        response = admin_client.get(url)
+        assert response.context["cl"].solr_queryset is None
+        # list filters active
+        response = admin_client.get(
+            url, {"q": "deed of sale", "doctype__id__exact": document.doctype.pk}
+        )
+        cl = response.context["cl"]
+        assert cl.solr_queryset is None
+        assert list(cl.result_list) == [document]
+        # sorted by a column that is not in solr
+        description_column = cl.list_display.index("description")
+        response = admin_client.get(url, {"q": "deed of sale", "o": description_column})
+        cl = response.context["cl"]
+        assert cl.get_solr_sort() is None
+        assert cl.solr_queryset is None
+        assert list(cl.result_list) == [document]
+        # show all
+        response = admin_client.get(url, {"q": "deed of sale", "all": ""})
+        assert response.context["cl"].solr_queryset is None
+
+
 @pytest.mark.django_db
 class TestDocumentForm:
     def test_clean(self):
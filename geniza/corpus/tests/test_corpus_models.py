@@ -14,7 +14,7 @@ from django.utils import timezone
 from django.utils.html import strip_tags
 from django.utils.safestring import SafeString
 from django.utils.translation import activate, deactivate_all, get_language
-from djiffy.models import Canvas, IIIFException, IIIFImage, Manifest
+from djiffy.models import Canvas, IIIFImage, Manifest
 from modeltranslation.manager import MultilingualQuerySet
 from piffle.presentation import IIIFException as piffle_IIIFException
 
@@ -134,48 +134,50 @@ class TestFragment(TestCase):
         frag = Fragment.objects.create(shelfmark="TS 1")
         assert Fragment.objects.get_by_natural_key(frag.shelfmark) == frag
 
-    @patch("geniza.corpus.models.IIIFPresentation")
-    def test_iiif_thumbnails(self, mockiifpres):
+    @patch("geniza.corpus.models.fetch_manifests")
+    def test_iiif_thumbnails(self, mock_fetch_manifests):
         # no iiif
         frag = Fragment(shelfmark="TS 1")
         assert frag.iiif_thumbnails() == ""
 
         frag.iiif_url = "http://example.co/iiif/ts-1"
         # return simplified part of the manifest we need for this
-        mockiifpres.from_url.return_value = AttrDict(
-            {
-                "sequences": [
-                    {
-                        "canvases": [
-                            {
-                                "images": [
-                                    {
-                                        "resource": {
-                                            "service": {
-                                                "id": "http://example.co/iiif/ts-1/00001",
+        mock_fetch_manifests.return_value = {
+            frag.iiif_url: AttrDict(
+                {
+                    "sequences": [
+                        {
+                            "canvases": [
+                                {
+                                    "images": [
+                                        {
+                                            "resource": {
+                                                "service": {
+                                                    "id": "http://example.co/iiif/ts-1/00001",
+                                                }
                                             }
                                         }
-                                    }
-                                ],
-                                "label": "1r",
-                            },
-                            {
-                                "images": [
-                                    {
-                                        "resource": {
-                                            "service": {
-                                                "id": "http://example.co/iiif/ts-1/00002",
+                                    ],
+                                    "label": "1r",
+                                },
+                                {
+                                    "images": [
+                                        {
+                                            "resource": {
+                                                "service": {
+                                                    "id": "http://example.co/iiif/ts-1/00002",
+                                                }
                                             }
                                         }
-                                    }
-                                ],
-                                "label": "1v",
-                            },
-                        ]
-                    }
-                ]
-            }
-        )
+                                    ],
+                                    "label": "1v",
+                                },
+                            ]
+                        }
+                    ]
+                }
+            )
+        }
 
         thumbnails = frag.iiif_thumbnails()
         assert (
@@ -213,20 +215,93 @@ class TestFragment(TestCase):
 
     @pytest.mark.django_db
     @patch("geniza.corpus.models.ManifestImporter")
-    def test_iiif_images_iiifexception(self, mock_manifestimporter):
-        # patch IIIFPresentation.from_url to always raise IIIFException
-        with patch("geniza.corpus.models.IIIFPresentation") as mock_iiifpresentation:
-            mock_iiifpresentation.from_url = Mock()
-            mock_iiifpresentation.from_url.side_effect = IIIFException
+    def test_iiif_images_remote_error(self, mock_manifestimporter):
+        # remote manifest could not be loaded
+        with patch("geniza.corpus.models.fetch_manifests") as mock_fetch_manifests:
             mock_manifestimporter.return_value.import_paths.return_value = []
             frag = Fragment(shelfmark="TS 1")
             frag.iiif_url = "http://example.io/manifests/1"
             frag.save()
-            # should raise the exception
-            with self.assertRaises(IIIFException):
-                # should log at level WARN
-                with self.assertLogs(level="WARN"):
-                    frag.iiif_images()
+            mock_fetch_manifests.return_value = {frag.iiif_url: None}
+            # should log at level WARN and return no images
+            with self.assertLogs(level="WARN"):
+                assert frag.iiif_images() == ([], [])
+
+    @pytest.mark.django_db
+    @patch("geniza.corpus.models.ManifestImporter")
+    def test_iiif_images_no_remote(self, mock_manifestimporter):
+        mock_manifestimporter.return_value.import_paths.return_value = []
+        frag = Fragment.objects.create(
+            shelfmark="TS 1", iiif_url="http://example.io/manifests/1"
+        )
+        # manifest not cached; should not load remote manifest
+        with patch("geniza.corpus.models.fetch_manifests") as mock_fetch_manifests:
+            assert frag.iiif_images(remote=False) == ([], [])
+            mock_fetch_manifests.assert_not_called()
+
+    @pytest.mark.django_db
+    @patch("geniza.corpus.models.ManifestImporter")
+    def test_iiif_manifest(self, mock_manifestimporter):
+        # no iiif url
+        assert Fragment(shelfmark="TS 1").iiif_manifest() is None
+
+        # fragment with a locally cached manifest
+        frag = Fragment(shelfmark="TS 1", iiif_url="http://example.io/manifests/1")
+        frag.manifest = Manifest.objects.create(
+            uri=frag.iiif_url, short_id="m", label="Cached content"
+        )
+        mock_manifestimporter.return_value.import_paths.return_value = [frag.manifest]
+        frag.save()
+        with patch("geniza.corpus.models.fetch_manifests") as mock_fetch_manifests:
+            manifest = frag.iiif_manifest()
+            mock_fetch_manifests.assert_not_called()
+        assert manifest.id == frag.iiif_url
+        assert manifest.label == "Cached content"
+
+        # not cached; loads remote manifest and logs a warning, unless disabled
+        frag.manifest = None
+        with patch("geniza.corpus.models.fetch_manifests") as mock_fetch_manifests:
+            remote_manifest = Mock()
+            mock_fetch_manifests.return_value = {frag.iiif_url: remote_manifest}
+            assert frag.iiif_manifest(remote=False) is None
+            mock_fetch_manifests.assert_not_called()
+            with self.assertLogs(level="WARN"):
+                assert frag.iiif_manifest() == remote_manifest
+            assert list(mock_fetch_manifests.call_args.args[0]) == [frag.iiif_url]
+            # only loaded once per fragment instance
+            assert frag.iiif_manifest() == remote_manifest
+            assert mock_fetch_manifests.call_count == 1
+
+    @patch("geniza.corpus.models.fetch_manifests")
+    def test_load_remote_manifests(self, mock_fetch_manifests):
+        manifests = {"http://example.io/manifests/1": Mock()}
+        mock_fetch_manifests.return_value = manifests
+        cached = Fragment(shelfmark="TS 1", iiif_url="http://example.io/manifests/2")
+        cached.manifest = Manifest(uri=cached.iiif_url)
+        fragments = [
+            Fragment(shelfmark="TS 2", iiif_url="http://example.io/manifests/1"),
+            Fragment(shelfmark="TS 3", iiif_url="http://example.io/manifests/1"),
+            Fragment(shelfmark="TS 4"),
+            cached,
+        ]
+        with self.assertLogs(level="WARN"):
+            Fragment.load_remote_manifests(fragments)
+        # one request for all fragments without a cached manifest
+        assert mock_fetch_manifests.call_count == 1
+        assert list(mock_fetch_manifests.call_args.args[0]) == [
+            "http://example.io/manifests/1"
+        ]
+        assert (
+            fragments[0].remote_manifest == manifests["http://example.io/manifests/1"]
+        )
+        assert (
+            fragments[1].remote_manifest == manifests["http://example.io/manifests/1"]
+        )
+        assert not hasattr(fragments[2], "remote_manifest")
+        assert not hasattr(cached, "remote_manifest")
+        # already loaded; no new request
+        Fragment.load_remote_manifests(fragments)
+        assert mock_fetch_manifests.call_count == 1
 
     @pytest.mark.django_db
     @patch("geniza.corpus.models.ManifestImporter")
@@ -594,8 +669,8 @@ class TestDocument:
         # reactivate previous default (in case it matters for other tests)
         activate(current_lang)
 
-    @patch("geniza.corpus.models.IIIFPresentation")
-    def test_iiif_urls(self, mock_pres):
+    @patch("geniza.corpus.models.fetch_manifests")
+    def test_iiif_urls(self, mock_fetch_manifests):
         # create example doc with two fragments with URLs
         doc = Document.objects.create()
         frag = Fragment.objects.create(shelfmark="s1", iiif_url="foo")
@@ -637,6 +712,46 @@ class TestDocument:
             # dicts should contain the image objects and labels via the mocks
             assert (images[0]["image"], images[0]["label"]) == (img1, "label1")
             assert (images[1]["image"], images[1]["label"]) == (img2, "label2")
+            assert mock_frag_iiif.call_args.kwargs == {"remote": True}
+            # pass through remote option
+            doc.iiif_images(remote=False)
+            assert mock_frag_iiif.call_args.kwargs == {"remote": False}
+
+    def test_iiif_manifests(self):
+        doc = Document.objects.create()
+        frag = Fragment.objects.create(shelfmark="s1", iiif_url="foo")
+        frag2 = Fragment.objects.create(shelfmark="s2", iiif_url="bar")
+        frag3 = Fragment.objects.create(shelfmark="s3")
+        TextBlock.objects.create(document=doc, fragment=frag, order=1)
+        TextBlock.objects.create(document=doc, fragment=frag, order=2)
+        TextBlock.objects.create(document=doc, fragment=frag2, order=3)
+        TextBlock.objects.create(document=doc, fragment=frag3, order=4)
+        with patch.object(
+            Fragment, "iiif_manifest", side_effect=["manifest1", None]
+        ) as mock_frag_manifest:
+            # one manifest per iiif url; skips manifests that failed to load
+            assert doc.iiif_manifests(remote=False) == ["manifest1"]
+            assert mock_frag_manifest.call_count == 2
+            assert mock_frag_manifest.call_args.kwargs == {"remote": False}
+
+        # only loaded once for prefetched documents
+        doc = Document.detail_queryset().get(pk=doc.pk)
+        with patch.object(
+            Fragment, "iiif_manifest", return_value="manifest"
+        ) as mock_frag_manifest:
+            assert doc.iiif_manifests() == ["manifest", "manifest"]
+            assert doc.iiif_manifests() == ["manifest", "manifest"]
+            assert mock_frag_manifest.call_count == 2
+
+    def test_attribution(self, document, fragment):
+        fragment.manifest.extra_data = {"attribution": "<p>From a library</p>"}
+        fragment.manifest.save()
+        with patch("geniza.corpus.models.fetch_manifests") as mock_fetch_manifests:
+            attribution, additional_restrictions, extra = document.attribution()
+            # uses locally cached manifest
+            mock_fetch_manifests.assert_not_called()
+        assert attribution == "Compilation by Princeton Geniza Project."
+        assert extra == {"From a library"}
 
     def test_fragment_urls(self):
         # create example doc with two fragments with URLs
@@ -724,6 +839,9 @@ class TestDocument:
             assert tag.name in index_data["tags_ss_lower"]
         assert index_data["status_s"] == "Public"
         assert not index_data["old_pgpids_is"]
+        assert index_data["last_modified_dt"] == (
+            document.last_modified.isoformat().replace("+00:00", "Z")
+        )
 
         # test with notes and review notes
         document.notes = "FGP stub"
@@ -805,6 +923,23 @@ class TestDocument:
         for note in [edition, edition2, translation]:
             assert note.display() in index_data["scholarship_t"]
 
+    def test_index_data_judaeo_arabic(self, document, source):
+        # no arabic script, no normalized text
+        index_data = document.index_data()
+        assert index_data["description_ja_t"] is None
+        assert index_data["transcription_ja_t"] == []
+        # arabic script converted to judaeo-arabic for search
+        document.description = "Receipt for 5 دينار"
+        Footnote.objects.create(
+            content_object=document,
+            source=source,
+            doc_relation=Footnote.EDITION,
+            content={"text": "مصحف"},
+        )
+        index_data = document.index_data()
+        assert index_data["description_ja_t"] == "Receipt for 5 דינאר"
+        assert index_data["transcription_ja_t"] == ["מצחף"]
+
     def test_index_data_document_date(self):
         document = Document(
             id=123,
@@ -1206,3 +1341,226 @@ def test_items_to_index(document, footnote):
     docs = Document.items_to_index()
     assert docs
     assert type(docs) is MultilingualQuerySet
+
+
+@pytest.mark.django_db
+def test_ids_changed_since(document, join, footnote):
+    timestamp = timezone.now()
+    # nothing changed yet
+    assert Document.ids_changed_since(timestamp) == set()
+
+    # document modified directly
+    document.save()
+    assert Document.ids_changed_since(timestamp) == {document.pk}
+
+    # fragment modified: all associated documents
+    later = timezone.now()
+    join.fragments.last().save()
+    assert Document.ids_changed_since(later) == {join.pk}
+
+    # footnote edited outside the admin (e.g. in a script), without a log entry
+    later = timezone.now()
+    assert Document.ids_changed_since(later) == set()
+    footnote.save()
+    assert Document.ids_changed_since(later) == {document.pk}
+
+    # tag added
+    later = timezone.now()
+    join.tags.add("marriage")
+    assert Document.ids_changed_since(later) == {join.pk}
+
+    # related record deleted
+    later = timezone.now()
+    footnote.delete()
+    assert Document.ids_changed_since(later) == {document.pk}
+
+
+@pytest.mark.django_db
+def test_fragments_without_manifest(fragment_no_manifest):
+    # fragment with no iiif url is not included
+    doc = Document.objects.create()
+    TextBlock.objects.create(
+        document=doc, fragment=Fragment.objects.create(shelfmark="T-S 1")
+    )
+    assert not Document.fragments_without_manifest([doc.pk]).exists()
+    # fragment with iiif url and no cached manifest
+    doc2 = Document.objects.create()
+    TextBlock.objects.create(document=doc2, fragment=fragment_no_manifest)
+    assert list(Document.fragments_without_manifest()) == [fragment_no_manifest]
+    assert list(Document.fragments_without_manifest([doc2.pk])) == [
+        fragment_no_manifest
+    ]
+
+
+@pytest.mark.django_db
+def test_index_data_hash(document):
+    index_data = document.index_data()
+    index_hash = index_data.pop("index_hash_s")
+    # stable across calls and independent of key order
+    assert Document.index_data_hash(index_data) == index_hash
+    assert Document.index_data_hash(dict(reversed(index_data.items()))) == index_hash
+    assert document.index_data()["index_hash_s"] == index_hash
+    # changes when index data changes
+    document.description_en = "a new description"
+    assert document.index_data()["index_hash_s"] != index_hash
+
+
+@pytest.mark.django_db
+def test_index_data_hash_multivalued(document):
+    document.tags.add("marriage", "bill of sale")
+    document.languages.add(
+        LanguageScript.objects.create(
+            language="Judaeo-Arabic", script="Hebrew", iso_code="jrb"
+        ),
+        LanguageScript.objects.create(
+            language="Arabic", script="Arabic", iso_code="ar"
+        ),
+    )
+    index_data = document.index_data()
+    index_hash = index_data.pop("index_hash_s")
+    assert len(index_data["tags_ss_lower"]) == 2
+    assert len(index_data["language_code_ss"]) == 2
+    # many-to-many values returned in a different order hash the same
+    index_data["tags_ss_lower"].reverse()
+    index_data["language_code_ss"].reverse()
+    assert Document.index_data_hash(index_data) == index_hash
+    # but a changed value does not
+    index_data["tags_ss_lower"][0] = "contract"
+    assert Document.index_data_hash(index_data) != index_hash
+
+
+@pytest.mark.django_db
+def test_partial_index_data(document):
+    document.status = Document.SUPPRESSED
+    update = document.partial_index_data(["status_s"])
+    assert update["id"] == document.index_id()
+    assert update["_version_"] == 1
+    assert update["status_s"] == {"set": "Suppressed"}
+    # other simple fields not included, except unstored date range
+    assert "tags_ss_lower" not in update
+    assert "document_date_dr" in update
+    assert update["last_modified_dt"] == {
+        "set": document.last_modified.isoformat().replace("+00:00", "Z")
+    }
+    # hash and copy fields are cleared
+    assert update["index_hash_s"] == {"set": None}
+    for field in Document.index_copy_fields:
+        assert update[field] == {"set": None}
+
+
+@pytest.mark.django_db
+@patch.object(Document, "solr")
+@patch("geniza.corpus.models.Document.index_items")
+def test_index_partial(mock_indexitems, mock_solr, document, join):
+    mock_update = mock_solr.update
+    assert Document.index_partial([document.pk, join.pk], ["status_s"]) == 2
+    mock_update.make_request.assert_called_once()
+    args, kwargs = mock_update.make_request.call_args
+    assert args == ("post", mock_update.url)
+    assert set(update["id"] for update in kwargs["data"]) == {
+        document.index_id(),
+        join.index_id(),
+    }
+    mock_indexitems.assert_not_called()
+
+    # request failed: fall back to full reindex
+    mock_update.make_request.return_value = None
+    Document.index_partial([document.pk], ["status_s"])
+    mock_indexitems.assert_called_once()
+
+    # no matching documents
+    mock_update.reset_mock()
+    assert Document.index_partial([0], ["status_s"]) == 0
+    mock_update.make_request.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_transcription_line_index_data(document, source):
+    # no editions, no lines
+    assert document.transcription_line_index_data() == []
+    edition = Footnote.objects.create(
+        content_object=document,
+        source=source,
+        doc_relation=Footnote.EDITION,
+        content={
+            "html": "<section> <ul>\n <li value='1'>first line</li>"
+            + "\n <li value='2'>مصحف</li></ul></section>"
+        },
+    )
+    # translations are not indexed as lines
+    Footnote.objects.create(
+        content_object=document,
+        source=source,
+        doc_relation=Footnote.TRANSLATION,
+        content={"html": "<ul><li value='1'>translated line</li></ul>"},
+    )
+    lines = document.transcription_line_index_data()
+    assert len(lines) == 2
+    assert lines[0] == {
+        "id": "transcription_line.%d.1" % edition.pk,
+        "item_type_s": "transcription_line",
+        "pgpid_i": document.pk,
+        "footnote_i": edition.pk,
+        "line_i": 1,
+        "line_number_s": "1",
+        "text_t": "first line",
+        "text_ja_t": None,
+    }
+    assert lines[1]["text_t"] == "مصحف"
+    assert lines[1]["text_ja_t"] == "מצחף"
+
+
+@pytest.mark.django_db
+@patch.object(Document, "solr")
+def test_index_items(mock_solr, document, join):
+    with patch.object(
+        Document, "transcription_line_index_data", return_value=[{"id": "line"}]
+    ):
+        assert Document.index_items(Document.objects.filter(pk=document.pk)) == 1
+    mock_update = mock_solr.update
+    # document indexed, then lines replaced
+    assert mock_update.index.call_args_list[0][0][0][0]["id"] == document.index_id()
+    mock_update.delete_by_query.assert_called_with(
+        "item_type_s:transcription_line AND pgpid_i:(%d)" % document.pk
+    )
+    assert mock_update.make_request.call_args[1]["data"] == [{"id": "line"}]
+
+    # documents and lines are indexed in chunks
+    mock_update.reset_mock()
+    with patch.object(Document, "index_chunk_size", 1):
+        assert Document.index_items(Document.items_to_index()) == 2
+    assert mock_update.index.call_count == 2
+    assert mock_update.delete_by_query.call_count == 2
+
+    # remove lines in chunks
+    mock_update.reset_mock()
+    with patch.object(Document, "index_chunk_size", 1):
+        Document.remove_transcription_lines([document.pk, join.pk])
+    assert mock_update.delete_by_query.call_count == 2
+
+
+@patch.object(Document, "solr")
+def test_send_index_data(mock_solr):
+    mock_update = mock_solr.update
+    mock_update.url = "http://localhost:8983/solr/geniza/update"
+    assert Document.send_index_data([{"id": "doc"}])
+    args, kwargs = mock_update.make_request.call_args
+    assert args == ("post", "http://localhost:8983/solr/geniza/update/json/docs")
+    assert kwargs["data"] == [{"id": "doc"}]
+    # parasolr returns None when solr reports an error
+    mock_update.make_request.return_value = None
+    assert not Document.send_index_data([{"id": "doc"}])
+    # nothing to send
+    mock_update.reset_mock()
+    assert Document.send_index_data([])
+    mock_update.make_request.assert_not_called()
+
+
+@pytest.mark.django_db
+@patch.object(Document, "solr")
+def test_remove_from_index(mock_solr, document):
+    document.remove_from_index()
+    mock_solr.update.delete_by_id.assert_called_with([document.index_id()])
+    mock_solr.update.delete_by_query.assert_called_with(
+        "item_type_s:transcription_line AND pgpid_i:(%d)" % document.pk
+    )
@@ -1,86 +1,225 @@
 from unittest.mock import patch
 
 import pytest
-from parasolr.django.indexing import ModelIndexable
+from django.db import IntegrityError, transaction
 
 from geniza.corpus.models import (
     Document,
     DocumentSignalHandlers,
     DocumentType,
     Fragment,
+    LanguageScript,
 )
 
 
+def indexed_ids(mock_indexitems):
+    # ids for documents passed to the most recent index_items call
+    return set(doc.pk for doc in mock_indexitems.call_args[0][0])
+
+
 @pytest.mark.django_db
-@patch.object(ModelIndexable, "index_items")
-def test_related_save(mock_indexitems, document, join, footnote):
+@patch.object(Document, "index_items")
+def test_related_save(
+    mock_indexitems, document, join, footnote, django_capture_on_commit_callbacks
+):
+    # discard anything queued for reindexing when creating fixtures
+    DocumentSignalHandlers.reset_pending()
     # unsaved fragment should be ignored
     frag = Fragment(shelfmark="T-S 123")
 
-    # unsaved - ignore
-    DocumentSignalHandlers.related_save(Fragment, frag)
-    mock_indexitems.assert_not_called()
-    # raw - ignore
-    DocumentSignalHandlers.related_save(Fragment, frag, raw=True)
-    mock_indexitems.assert_not_called()
-    # saved but no associated documents
-    frag.save()
-    DocumentSignalHandlers.related_save(Fragment, frag)
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        # unsaved - ignore
+        DocumentSignalHandlers.related_save(Fragment, frag)
+        # raw - ignore
+        DocumentSignalHandlers.related_save(Fragment, frag, raw=True)
+        # saved but no associated documents
+        frag.save()
+        DocumentSignalHandlers.related_save(Fragment, frag)
+    assert not callbacks
     mock_indexitems.assert_not_called()
 
     # fragment associated with a document
-    DocumentSignalHandlers.related_save(Fragment, document.fragments.first())
+    with django_capture_on_commit_callbacks(execute=True):
+        DocumentSignalHandlers.related_save(Fragment, document.fragments.first())
     assert mock_indexitems.call_count == 1
-    assert document in mock_indexitems.call_args[0][0]
-    assert join in mock_indexitems.call_args[0][0]
+    assert indexed_ids(mock_indexitems) == {document.pk, join.pk}
 
-    # doctype
+    # doctype: partial update instead of full reindex
     mock_indexitems.reset_mock()
-    DocumentSignalHandlers.related_save(DocumentType, document.doctype)
-    assert mock_indexitems.call_count == 1
-    assert document in mock_indexitems.call_args[0][0]
-    assert join not in mock_indexitems.call_args[0][0]
+    with patch.object(Document, "index_partial") as mock_index_partial:
+        with django_capture_on_commit_callbacks(execute=True):
+            DocumentSignalHandlers.related_save(DocumentType, document.doctype)
+        mock_indexitems.assert_not_called()
+        mock_index_partial.assert_called_once_with([document.pk], ["type_s"])
 
     # footnote
     mock_indexitems.reset_mock()
-    DocumentSignalHandlers.related_save(DocumentType, document.footnotes.first())
+    with django_capture_on_commit_callbacks(execute=True):
+        DocumentSignalHandlers.related_save(DocumentType, document.footnotes.first())
     assert mock_indexitems.call_count == 1
-    assert document in mock_indexitems.call_args[0][0]
+    assert indexed_ids(mock_indexitems) == {document.pk}
 
     # source
     mock_indexitems.reset_mock()
-    DocumentSignalHandlers.related_save(DocumentType, document.footnotes.first().source)
+    with django_capture_on_commit_callbacks(execute=True):
+        DocumentSignalHandlers.related_save(
+            DocumentType, document.footnotes.first().source
+        )
     assert mock_indexitems.call_count == 1
-    assert document in mock_indexitems.call_args[0][0]
+    assert indexed_ids(mock_indexitems) == {document.pk}
 
     # creator
     mock_indexitems.reset_mock()
-    DocumentSignalHandlers.related_save(
-        DocumentType, document.footnotes.first().source.authorship_set.first().creator
-    )
+    with django_capture_on_commit_callbacks(execute=True):
+        DocumentSignalHandlers.related_save(
+            DocumentType,
+            document.footnotes.first().source.authorship_set.first().creator,
+        )
     assert mock_indexitems.call_count == 1
-    assert document in mock_indexitems.call_args[0][0]
+    assert indexed_ids(mock_indexitems) == {document.pk}
 
     # unhandled model should be ignored, no error
     mock_indexitems.reset_mock()
-    DocumentSignalHandlers.related_save(Document, document)
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        DocumentSignalHandlers.related_save(Document, document)
+    assert not callbacks
     mock_indexitems.assert_not_called()
 
 
 @pytest.mark.django_db
-@patch.object(ModelIndexable, "index_items")
-def test_related_delete(mock_indexitems, document, join):
+@patch.object(Document, "index_items")
+@patch.object(Document, "mark_content_modified")
+def test_related_save_content_modified(mock_modified, mock_indexitems, document, join):
+    # cached pages are invalidated for the same documents that are reindexed
+    DocumentSignalHandlers.related_save(Fragment, document.fragments.first())
+    mock_modified.assert_called_with({document.pk, join.pk})
+
+    # document save invalidates documents on the same fragments
+    mock_modified.reset_mock()
+    document.save()
+    mock_modified.assert_called_with({document.pk, join.pk})
+
+
+@pytest.mark.django_db
+@patch.object(Document, "index_items")
+def test_m2m_changed_content_modified(mock_indexitems, document, join):
+    arabic = LanguageScript.objects.create(language="Arabic", script="Arabic")
+    content_modified = Document.objects.get(pk=document.pk).content_modified
+    document.languages.add(arabic)
+    assert Document.objects.get(pk=document.pk).content_modified > content_modified
+
+    # reverse relation
+    content_modified = Document.objects.get(pk=join.pk).content_modified
+    arabic.secondary_document.add(join)
+    assert Document.objects.get(pk=join.pk).content_modified > content_modified
+
+    content_modified = Document.objects.get(pk=join.pk).content_modified
+    arabic.secondary_document.clear()
+    assert Document.objects.get(pk=join.pk).content_modified > content_modified
+
+    content_modified = Document.objects.get(pk=document.pk).content_modified
+    document.tags.add("marriage")
+    assert Document.objects.get(pk=document.pk).content_modified > content_modified
+
+
+@pytest.mark.django_db
+@patch.object(Document, "index_items")
+def test_related_delete(
+    mock_indexitems, document, join, django_capture_on_commit_callbacks
+):
     # delegates to same method as save, just check a few cases
+    # discard anything queued for reindexing when creating fixtures
+    DocumentSignalHandlers.reset_pending()
 
     # fragment associated with a document
-    DocumentSignalHandlers.related_delete(Fragment, document.fragments.first())
+    with django_capture_on_commit_callbacks(execute=True):
+        DocumentSignalHandlers.related_delete(Fragment, document.fragments.first())
     assert mock_indexitems.call_count == 1
-    assert document in mock_indexitems.call_args[0][0]
-    assert join in mock_indexitems.call_args[0][0]
+    assert indexed_ids(mock_indexitems) == {document.pk, join.pk}
 
     # doctype
     mock_indexitems.reset_mock()
-    DocumentSignalHandlers.related_delete(DocumentType, document.doctype)
+    with django_capture_on_commit_callbacks(execute=True):
+        DocumentSignalHandlers.related_delete(DocumentType, document.doctype)
     assert mock_indexitems.call_count == 1
-    assert document in mock_indexitems.call_args[0][0]
-    assert join not in mock_indexitems.call_args[0][0]
+    assert indexed_ids(mock_indexitems) == {document.pk}
+
+
+@pytest.mark.django_db
+@patch.object(Document, "index_items")
+def test_queue_reindex_coalesced(
+    mock_indexitems, document, join, footnote, django_capture_on_commit_callbacks
+):
+    # discard anything queued for reindexing when creating fixtures
+    DocumentSignalHandlers.reset_pending()
+    # multiple changes in one transaction are indexed once, deduplicated
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        document.save()
+        footnote.save()
+        DocumentSignalHandlers.related_save(Fragment, document.fragments.first())
+        # not indexed until the transaction is committed
+        mock_indexitems.assert_not_called()
+    assert len(callbacks) == 1
+    assert mock_indexitems.call_count == 1
+    assert indexed_ids(mock_indexitems) == {document.pk, join.pk}
+
+
+@pytest.mark.django_db
+@patch.object(Document, "index_items")
+def test_queue_reindex_rollback(
+    mock_indexitems, document, join, django_capture_on_commit_callbacks
+):
+    # discard anything queued for reindexing when creating fixtures
+    DocumentSignalHandlers.reset_pending()
+    # nothing is indexed when the transaction is rolled back
+    with pytest.raises(IntegrityError):
+        with transaction.atomic():
+            document.save()
+            # rollback is detected even if the callback is still referenced
+            callback = DocumentSignalHandlers.pending.callback
+            raise IntegrityError
+    mock_indexitems.assert_not_called()
+    assert callback is not None
+
+    # ids from the rolled back transaction are not included later
+    with django_capture_on_commit_callbacks(execute=True):
+        join.save()
+    assert indexed_ids(mock_indexitems) == {join.pk}
+
+
+@pytest.mark.django_db
+@patch.object(Document, "index_partial")
+@patch.object(Document, "index_items")
+def test_document_index_partial(
+    mock_indexitems, mock_index_partial, document, django_capture_on_commit_callbacks
+):
+    # discard anything queued for reindexing when creating fixtures
+    DocumentSignalHandlers.reset_pending()
+    # only status and notes changed: partial update
+    with django_capture_on_commit_callbacks(execute=True):
+        document.status = Document.SUPPRESSED
+        document.notes = "a note"
+        document.save()
+    mock_indexitems.assert_not_called()
+    mock_index_partial.assert_called_once()
+    pgpids, fields = mock_index_partial.call_args[0]
+    assert pgpids == [document.pk]
+    assert fields == {"status_s", "notes_t"}
+
+    # other fields changed: full reindex
+    mock_index_partial.reset_mock()
+    with django_capture_on_commit_callbacks(execute=True):
+        document.status = Document.PUBLIC
+        document.description_en = "new description"
+        document.save()
+    mock_index_partial.assert_not_called()
+    assert indexed_ids(mock_indexitems) == {document.pk}
+
+    # tag saved: partial update for tagged documents
+    mock_indexitems.reset_mock()
+    with django_capture_on_commit_callbacks(execute=True):
+        tag = document.tags.first()
+        tag.name = "renamed"
+        tag.save()
+    mock_indexitems.assert_not_called()
+    mock_index_partial.assert_called_once_with([document.pk], ["tags_ss_lower"])
@@ -4,7 +4,7 @@ from parasolr.django import AliasedSolrQuerySet, SolrClient
 from piffle.image import IIIFImageClient
 
 from geniza.corpus.models import Document, DocumentType, TextBlock
-from geniza.corpus.solr_queryset import DocumentSolrQuerySet
+from geniza.corpus.solr_queryset import DocumentSolrQuerySet, highlight_search_terms
 
 
 class TestDocumentSolrQuerySet:
@@ -66,10 +66,116 @@ class TestDocumentSolrQuerySet:
             )
             assert result_imgs[0][1] == "1r"
 
+    def test_with_transcription_lines(self):
+        dqs = DocumentSolrQuerySet().with_transcription_lines("دينار", 3)
+        assert "transcription_lines:[subquery]" in dqs.field_list
+        assert "pgpid_i:pgpid_i" in dqs.field_list
+        assert dqs.raw_params["transcription_lines.q"] == dqs.line_search_qf
+        assert dqs.raw_params["transcription_lines.keyword_query"] == (
+            dqs._search_term_cleanup("دينار")
+        )
+        assert "{!term f=pgpid_i v=$row.pgpid_i}" in (
+            dqs.raw_params["transcription_lines.fq"]
+        )
+        assert dqs.raw_params["transcription_lines.rows"] == 3
+
+    def test_get_result_document_lines(self):
+        dqs = DocumentSolrQuerySet()
+        mock_doc = {
+            "transcription_lines": {
+                "numFound": 2,
+                "docs": [{"line": 5, "text": "five"}, {"line": 2, "text": "two"}],
+            }
+        }
+        with patch.object(
+            AliasedSolrQuerySet, "get_result_document", return_value=mock_doc
+        ):
+            result_doc = dqs.get_result_document(mock_doc)
+        # lines are sorted in line order
+        assert [line["text"] for line in result_doc["transcription_lines"]] == [
+            "two",
+            "five",
+        ]
+
+    def test_get_results_json_facets(self):
+        dqs = DocumentSolrQuerySet()
+        with patch.object(dqs, "solr") as mocksolr:
+            mocksolr.query.return_value = {
+                "responseHeader": {"params": {}},
+                "response": {"numFound": 1, "start": 0, "docs": [{"id": "doc.1"}]},
+                "facets": {"count": 1, "all": {"count": 5}},
+            }
+            results = dqs.get_results(rows=1)
+            assert results == [{"id": "doc.1", "iiif_images": []}]
+            assert mocksolr.query.call_args[1]["wrap"] is False
+            assert mocksolr.query.call_args[1]["rows"] == 1
+            assert dqs.count() == 1
+            assert dqs.get_json_facets() == {"count": 1, "all": {"count": 5}}
+
+            # query error
+            mocksolr.query.return_value = None
+            assert dqs.get_results() == []
+            assert dqs.get_json_facets() == {}
+
+    def test_get_json_facets(self):
+        dqs = DocumentSolrQuerySet()
+        with patch.object(dqs, "get_results") as mock_get_results:
+            # queries solr if results have not been retrieved
+            assert dqs.get_json_facets() is None
+            mock_get_results.assert_called_with()
+
+    def test_cursor(self):
+        dqs = DocumentSolrQuerySet()
+        cursor_qs = dqs.order_by("-scholarship_count_i").cursor()
+        assert cursor_qs.raw_params["cursorMark"] == "*"
+        # tie-breakers added to existing sort
+        assert cursor_qs.sort_options == [
+            "scholarship_count_i desc",
+            "pgpid_i asc",
+            "id asc",
+        ]
+        # original queryset is unchanged
+        assert "cursorMark" not in dqs.raw_params
+
+        # tie-breakers not duplicated if already sorting on them
+        cursor_qs = dqs.order_by("-pgpid_i").cursor("AoE1")
+        assert cursor_qs.raw_params["cursorMark"] == "AoE1"
+        assert cursor_qs.sort_options == ["pgpid_i desc", "id asc"]
+
+    def test_get_next_cursor_mark(self):
+        dqs = DocumentSolrQuerySet().cursor()[:2]
+        response = {
+            "responseHeader": {"params": {}},
+            "response": {"numFound": 3, "start": 0, "docs": [{"id": "doc.1"}]},
+            "nextCursorMark": "AoE1",
+        }
+        with patch.object(dqs, "solr") as mocksolr:
+            mocksolr.query.return_value = response
+            # queries solr if needed
+            assert dqs.get_next_cursor_mark() == "AoE1"
+            assert mocksolr.query.call_args[1]["cursorMark"] == "*"
+            assert mocksolr.query.call_args[1]["start"] == 0
+            assert mocksolr.query.call_args[1]["rows"] == 2
+
+            # no more results when solr returns the same cursor mark
+            last_qs = dqs.cursor("AoE1")
+            last_qs.solr = mocksolr
+            assert last_qs.get_next_cursor_mark() is None
+
     def test_search_term_cleanup__arabic_to_ja(self):
         dqs = DocumentSolrQuerySet()
-        # confirm arabic to judaeo-arabic runs here
-        dqs._search_term_cleanup("دينار") == "(دينار|דיהאר)"
+        # arabic terms are searched in arabic or judaeo-arabic
+        assert dqs._search_term_cleanup("دينار") == "(دينار OR דינאר)"
+        assert dqs._search_term_cleanup("description:دينار") == (
+            "(description_txt_ens:دينار OR description_txt_ens:דינאר)"
+        )
+        assert dqs._search_term_cleanup('"دينار ذهب"') == (
+            '("دينار ذهب" OR "דינאר דֹהב")'
+        )
+        # hebrew and latin terms in mixed queries are left as is
+        assert dqs._search_term_cleanup("מכתב letter (دينار)") == (
+            "מכתב letter ((دينار OR דינאר))"
+        )
 
     def test_related_to(self, document, join, fragment, empty_solr):
         """should give filtered result: public documents with any shared shelfmarks"""
@@ -94,3 +200,35 @@ class TestDocumentSolrQuerySet:
 
         # should include related
         assert related_docs.filter(pgpid=join.id).count() == 1
+
+    def test_keyword_search_arabic(self, document, join, empty_solr):
+        # arabic text in a field without a judaeo-arabic copy
+        document.tags.add("دينار")
+        join.description = "Letter mentioning a دينار"
+        join.save()
+        Document.index_items([document, join])
+        SolrClient().update.index([], commit=True)
+
+        results = DocumentSolrQuerySet().keyword_search("دينار").get_results()
+        assert set(doc["pgpid"] for doc in results) == {document.pk, join.pk}
+
+
+def test_highlight_search_terms():
+    assert (
+        highlight_search_terms("a deed of sale", "deed sale")
+        == "a <em>deed</em> of <em>sale</em>"
+    )
+    # case insensitive; operators and field names are ignored; wildcards
+    assert (
+        highlight_search_terms("Deeds and sale", "transcription:deed* AND sale")
+        == "<em>Deeds</em> and <em>sale</em>"
+    )
+    # partial words are not highlighted
+    assert highlight_search_terms("saleable", "sale") == "saleable"
+    # text is escaped; entities are not highlighted
+    assert (
+        highlight_search_terms("<b> & amp", "lt amp") == "&lt;b&gt; &amp; <em>amp</em>"
+    )
+    # arabic search terms match judaeo-arabic text
+    assert highlight_search_terms("מן דינאר", "دينار") == "מן <em>דינאר</em>"
+    assert highlight_search_terms("text", "") == "text"
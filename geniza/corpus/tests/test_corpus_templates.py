@@ -619,6 +619,13 @@ class TestSearchPagination:
             in result
         )
 
+    def test_random_seed(self):
+        paginator = Paginator(range(20), per_page=1)
+        ctx = {"page_obj": paginator.page(1), "request": HttpRequest(), "seed": 5}
+        result = self.template.render(ctx)
+        # seed for random sort is added to page links
+        assert '<a title="page 2" class="pagelink" href="?page=2&amp;seed=5">' in result
+
     def test_tenth_of_twenty_pages(self):
         paginator = Paginator(range(20), per_page=1)
         ctx = {"page_obj": paginator.page(10), "request": HttpRequest()}
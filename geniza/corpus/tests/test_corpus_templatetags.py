@@ -1,10 +1,15 @@
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 import pytest
+from django.core.cache import cache
 from django.http.request import QueryDict
+from django.template import Context, Template, TemplateSyntaxError
+from django.test import override_settings
+from django.utils import timezone
 from piffle.iiif import IIIFImageClient
 
 from geniza.common.utils import absolutize_url
+from geniza.corpus.render_cache import document_render_cache
 from geniza.corpus.templatetags import corpus_extras
 
 
@@ -76,6 +81,14 @@ def test_querystring_replace():
     assert "sort=relevance" in args
     assert "page=10" in args
 
+    # removes args passed as None
+    mockrequest.GET = QueryDict("?q=contract&page=2&seed=5")
+    args = corpus_extras.querystring_replace(context, page=3, seed=None)
+    assert "seed" not in args
+    assert "page=3" in args
+    args = corpus_extras.querystring_replace(context, seed="")
+    assert "seed" not in args
+
 
 def test_iiif_image():
     # copied from mep_django
@@ -152,3 +165,39 @@ def test_shelfmark_wrap():
         corpus_extras.shelfmark_wrap("foo + bar + baz")
         == "<span>foo</span> + <span>bar</span> + <span>baz</span>"
     )
+
+
+@override_settings(DOCUMENT_RENDER_CACHE_TIMEOUT=60)
+@patch("geniza.corpus.render_cache.shared_cache", Mock(return_value=True))
+def test_documentcache():
+    cache.clear()
+    document_render_cache.clear_stats()
+    template = Template(
+        "{% load corpus_extras %}"
+        '{% documentcache "detail" document %}{{ document.title }}{% enddocumentcache %}'
+    )
+    document = Mock(pk=123, title="Letter", content_modified=timezone.now())
+    request = Mock()
+    request.user.is_authenticated = False
+    assert template.render(Context({"document": document, "request": request})) == (
+        "Letter"
+    )
+    # cached for anonymous users
+    document.title = "Legal"
+    assert template.render(Context({"document": document, "request": request})) == (
+        "Letter"
+    )
+    assert document_render_cache.stats()["hits"] == 1
+    # always rendered for logged-in users
+    request.user.is_authenticated = True
+    assert template.render(Context({"document": document, "request": request})) == (
+        "Legal"
+    )
+    # rendered without caching when there is no request
+    assert template.render(Context({"document": document})) == "Legal"
+    assert document_render_cache.stats()["hits"] == 1
+
+    with pytest.raises(TemplateSyntaxError):
+        Template(
+            "{% load corpus_extras %}{% documentcache document %}{% enddocumentcache %}"
+        )
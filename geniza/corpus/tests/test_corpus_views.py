@@ -1,22 +1,35 @@
+import json
 from datetime import datetime
 from time import sleep
-from unittest.mock import ANY, Mock, patch
+from unittest.mock import ANY, MagicMock, Mock, patch
 
 import pytest
 from django.conf import settings
 from django.contrib.admin.models import ADDITION, LogEntry
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
-from django.test import TestCase
+from django.db import connection
+from django.http import Http404
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import resolve, reverse
 from django.utils.text import Truncator, slugify
 from django.utils.timezone import get_current_timezone, make_aware
+from djiffy.models import Canvas
 from parasolr.django import SolrClient
+from parasolr.solr.client import ParasolrDict
 from pytest_django.asserts import assertContains, assertNotContains
 
 from geniza.common.utils import absolutize_url
 from geniza.corpus.iiif_utils import EMPTY_CANVAS_ID, new_iiif_canvas
-from geniza.corpus.models import Document, DocumentType, Fragment, TextBlock
+from geniza.corpus.models import (
+    Document,
+    DocumentType,
+    Fragment,
+    LanguageScript,
+    TextBlock,
+)
+from geniza.corpus.solr_cache import search_result_cache
 from geniza.corpus.solr_queryset import DocumentSolrQuerySet
 from geniza.corpus.views import (
     DocumentAnnotationListView,
@@ -24,6 +37,7 @@ from geniza.corpus.views import (
     DocumentManifestView,
     DocumentMerge,
     DocumentScholarshipView,
+    DocumentSearchAPIView,
     DocumentSearchView,
     DocumentTranscriptionText,
     old_pgp_edition,
@@ -86,6 +100,58 @@ class TestDocumentDetailView:
         response_404_partialmatch = client.get(reverse("corpus:document", args=(7,)))
         assert response_404_partialmatch.status_code == 404
 
+    def test_query_count(self, document, source, twoauthor_source, client):
+        """detail page queries should not depend on the amount of related data"""
+        Footnote.objects.create(
+            doc_relation=[Footnote.EDITION],
+            source=source,
+            content_object=document,
+            content={"html": "<ol><li>line one</li></ol>", "text": "line one"},
+        )
+        url = reverse("corpus:document", args=(document.id,))
+        # request once to populate site and content type caches
+        client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        assert response.status_code == 200
+        # document is only loaded once
+        assert len([q for q in queries if 'FROM "corpus_document" ' in q["sql"]]) == 1
+
+        # add more editions, editors, languages, tags, and fragments
+        Footnote.objects.create(
+            doc_relation=[Footnote.EDITION],
+            source=twoauthor_source,
+            content_object=document,
+            content={"html": "<ol><li>line two</li></ol>", "text": "line two"},
+        )
+        document.languages.add(
+            LanguageScript.objects.create(language="Judaeo-Arabic", script="Hebrew"),
+            LanguageScript.objects.create(language="Arabic", script="Arabic"),
+        )
+        document.tags.add("marriage", "dowry")
+        TextBlock.objects.create(
+            document=document,
+            fragment=Fragment.objects.create(shelfmark="T-S 12.34"),
+            order=2,
+        )
+        with CaptureQueriesContext(connection) as more_queries:
+            response = client.get(url)
+        assertContains(response, "Kernighan")
+        assertContains(response, "dowry")
+        assert len(more_queries) == len(queries)
+
+    def test_get_object(self, document):
+        """document should be loaded once and reused"""
+        view = DocumentDetailView()
+        view.kwargs = {"pk": document.pk}
+        view.request = Mock()
+        doc = view.get_object()
+        assert doc == document
+        assert view.object is doc
+        assert doc.is_prefetched("footnotes")
+        assert view.get_object() is doc
+        assert view.page_title() == document.title
+
     def test_get_absolute_url(self, document):
         """should return doc permalink"""
         doc_detail_view = DocumentDetailView()
@@ -95,6 +161,64 @@ class TestDocumentDetailView:
             document.get_absolute_url()
         )
 
+    @patch("geniza.corpus.views.index_changed")
+    def test_get_etag(self, mock_index_changed, rf, document, join):
+        mock_index_changed.return_value = 101.0
+        view = DocumentDetailView()
+        view.setup(rf.get(document.get_absolute_url()), pk=document.pk)
+        view.request.user = Mock(pk=None)
+        etag = view.get_etag()
+        assert etag
+        assert view.get_etag() == etag
+        # different for other documents, pages, and users
+        view.kwargs = {"pk": join.pk}
+        assert view.get_etag() != etag
+        view.kwargs = {"pk": document.pk}
+        view.request.user = Mock(pk=1)
+        assert view.get_etag() != etag
+        view.request.user = Mock(pk=None)
+        view.request.path = "%sscholarship/" % document.get_absolute_url()
+        assert view.get_etag() != etag
+        view.request.path = document.get_absolute_url()
+        # changes when the document or related records are modified
+        document.save()
+        assert view.get_etag() != etag
+        etag = view.get_etag()
+        document.languages.add(
+            LanguageScript.objects.create(language="Arabic", script="Arabic")
+        )
+        assert view.get_etag() != etag
+        # changes when documents are reindexed
+        etag = view.get_etag()
+        mock_index_changed.return_value = 102.0
+        assert view.get_etag() != etag
+        # none if the index time is unknown
+        mock_index_changed.return_value = None
+        assert view.get_etag() is None
+        mock_index_changed.return_value = 102.0
+        # none for suppressed or missing documents
+        document.status = Document.SUPPRESSED
+        document.save()
+        assert view.get_etag() is None
+        view.kwargs = {"pk": 123456}
+        assert view.get_etag() is None
+
+    @patch("geniza.corpus.views.index_changed", Mock(return_value=101.0))
+    def test_etag_not_modified(self, client, document):
+        response = client.get(document.get_absolute_url())
+        assert response.status_code == 200
+        etag = response["ETag"]
+        # not modified when etag matches; document is not loaded
+        with patch.object(DocumentDetailView, "get_object") as mock_get_object:
+            response = client.get(document.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == 304
+            mock_get_object.assert_not_called()
+        # not modified response is not returned after the document changes
+        document.save()
+        response = client.get(document.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response["ETag"] != etag
+
     def test_last_modified(self, client, document, join):
         """Ensure that the last modified header is set in the HEAD response"""
         SolrClient().update.index([document.index_data()], commit=True)
@@ -248,7 +372,6 @@ class TestDocumentSearchView:
     def test_get_form_kwargs(self):
         docsearch_view = DocumentSearchView()
         docsearch_view.request = Mock()
-        docsearch_view.get_range_stats = Mock(return_value={})
         # no params
         docsearch_view.request.GET = {}
         assert docsearch_view.get_form_kwargs() == {
@@ -257,7 +380,6 @@ class TestDocumentSearchView:
             },
             "prefix": None,
             "data": {"sort": "random"},
-            "range_minmax": {},
         }
 
         # keyword search param
@@ -269,7 +391,6 @@ class TestDocumentSearchView:
                 "q": "contract",
                 "sort": "relevance",
             },
-            "range_minmax": {},
         }
 
         # sort search param
@@ -282,7 +403,6 @@ class TestDocumentSearchView:
             "data": {
                 "sort": "scholarship_desc",
             },
-            "range_minmax": {},
         }
 
         # keyword and sort search params
@@ -296,7 +416,6 @@ class TestDocumentSearchView:
                 "q": "contract",
                 "sort": "scholarship_desc",
             },
-            "range_minmax": {},
         }
 
     @pytest.mark.usefixtures("mock_solr_queryset")
@@ -304,7 +423,12 @@ class TestDocumentSearchView:
         with patch(
             "geniza.corpus.views.DocumentSolrQuerySet",
             new=self.mock_solr_queryset(
-                DocumentSolrQuerySet, extra_methods=["admin_search", "keyword_search"]
+                DocumentSolrQuerySet,
+                extra_methods=[
+                    "admin_search",
+                    "keyword_search",
+                    "with_transcription_lines",
+                ],
             ),
         ) as mock_queryset_cls:
 
@@ -313,7 +437,6 @@ class TestDocumentSearchView:
 
             # keyword search param
             docsearch_view.request.GET = {"q": "six apartments"}
-            docsearch_view.get_range_stats = Mock(return_value={})
             qs = docsearch_view.get_queryset()
 
             mock_queryset_cls.assert_called_with()
@@ -322,8 +445,16 @@ class TestDocumentSearchView:
             mock_sqs.keyword_search.return_value.highlight.assert_any_call(
                 "description", snippets=3, method="unified", requireFieldMatch=True
             )
+            # matching transcription lines requested with results
+            mock_sqs.with_transcription_lines.assert_called_with(
+                "six apartments", docsearch_view.transcription_lines_per_document
+            )
             mock_sqs.also.assert_called_with("score")
             mock_sqs.also.return_value.order_by.assert_called_with("-score")
+            # date range and last modified requested with results
+            mock_sqs.raw_query_parameters.assert_any_call(
+                **{"json.facet": json.dumps(DocumentSearchView.all_documents_facet)}
+            )
 
             # sort search param
             mock_sqs.reset_mock()
@@ -395,52 +526,56 @@ class TestDocumentSearchView:
             args = mock_sqs.order_by.call_args[0]
             assert args[0].startswith("random_")
 
-    @pytest.mark.usefixtures("mock_solr_queryset")
-    def test_get_range_stats(self, mock_solr_queryset):
-        with patch(
-            "geniza.corpus.views.DocumentSolrQuerySet",
-            new=self.mock_solr_queryset(
-                DocumentSolrQuerySet, extra_methods=["admin_search", "keyword_search"]
-            ),
-        ) as mock_queryset_cls:
-            # stats = DocumentSolrQuerySet().stats("start_date_i", "end_date_i").get_stats()
-            # mock_queryset_cls.return_value.stats.return_value.get_stats.return_value = {
-            mock_queryset_cls.return_value.get_stats.return_value = {
-                "stats_fields": {
-                    "start_date_i": {"min": None},
-                    "end_date_i": {"max": None},
-                }
+    def test_get_range_stats(self):
+        docsearch_view = DocumentSearchView()
+        # no facets returned
+        assert docsearch_view.get_range_stats({}) == {}
+        # should not error if solr returns no values
+        json_facets = {"all_documents": {"count": 0}}
+        assert docsearch_view.get_range_stats(json_facets) == {"docdate": (None, None)}
+        # convert integer date to year
+        json_facets = {
+            "all_documents": {
+                "count": 10,
+                "start_date_min": 10380101,
+                "end_date_max": 10421231,
             }
-            docsearch_view = DocumentSearchView()
-            docsearch_view.request = Mock()
-
-            # should not error if solr returns none
-            stats = docsearch_view.get_range_stats()
-            assert stats == {"docdate": (None, None)}
-            mock_queryset_cls.return_value.stats.assert_called_with(
-                "start_date_i", "end_date_i"
-            )
+        }
+        assert docsearch_view.get_range_stats(json_facets) == {"docdate": (1038, 1042)}
+        # three-digit year
+        json_facets["all_documents"]["start_date_min"] = 8430101.0
+        assert docsearch_view.get_range_stats(json_facets) == {"docdate": (843, 1042)}
 
-            # convert integer date to year
-            mock_queryset_cls.return_value.get_stats.return_value = {
-                "stats_fields": {
-                    "start_date_i": {"min": 10380101.0},
-                    "end_date_i": {"max": 10421231.0},
-                }
+    def test_get_last_modified(self):
+        docsearch_view = DocumentSearchView()
+        assert docsearch_view.get_last_modified({}) is None
+        json_facets = {
+            "all_documents": {
+                "count": 10,
+                "last_modified": {
+                    "buckets": [{"val": "2022-03-04T15:27:50.123Z", "count": 1}]
+                },
             }
-            stats = docsearch_view.get_range_stats()
-            assert stats == {"docdate": (1038, 1042)}
+        }
+        last_modified = docsearch_view.get_last_modified(json_facets)
+        assert last_modified.year == 2022
+        assert last_modified.month == 3
+        assert last_modified.second == 50
 
-            # test three-digit year
-            mock_queryset_cls.return_value.get_stats.return_value["stats_fields"][
-                "start_date_i"
-            ]["min"] = 8430101.0
-            stats = docsearch_view.get_range_stats()
-            assert stats == {"docdate": (843, 1042)}
+    def test_last_modified_from_search_results(self, rf):
+        docsearch_view = DocumentSearchView()
+        docsearch_view.request = rf.get("/documents/", {"sort": "shelfmark"})
+        docsearch_view.search_results = {"last_modified": datetime(2022, 3, 4)}
+        # uses search results instead of querying solr
+        with patch("parasolr.django.views.SolrQuerySet") as mock_sqs:
+            assert docsearch_view.last_modified() == datetime(2022, 3, 4)
+            mock_sqs.assert_not_called()
 
     @pytest.mark.usefixtures("mock_solr_queryset")
+    @patch("geniza.corpus.views.index_version", Mock(return_value=101))
     @patch("geniza.corpus.views.DocumentSearchView.get_queryset")
     def test_get_context_data(self, mock_get_queryset, rf, mock_solr_queryset):
+        search_result_cache.clear()
         with patch(
             "geniza.corpus.views.DocumentSolrQuerySet",
             new=mock_solr_queryset(
@@ -449,9 +584,13 @@ class TestDocumentSearchView:
         ) as mock_queryset_cls:
 
             mock_qs = mock_queryset_cls.return_value
-            mock_qs.count.return_value = 22
-            mock_qs.get_facets.return_value.facet_fields = {}
-            # mock_qs.__getitem__.return_value = docsearch_view.queryset
+            # paged result
+            mock_paged_qs = mock_qs.__getitem__.return_value
+            mock_paged_qs.count.return_value = 22
+            mock_paged_qs.get_facets.return_value.facet_fields = {}
+            mock_paged_qs.get_json_facets.return_value = {
+                "all_documents": {"start_date_min": 10380101, "end_date_max": 10421231}
+            }
 
             mock_get_queryset.return_value = mock_qs
 
@@ -459,16 +598,196 @@ class TestDocumentSearchView:
             docsearch_view.queryset = mock_qs
             docsearch_view.object_list = mock_qs
             docsearch_view.request = rf.get("/documents/")
-            docsearch_view.get_range_stats = Mock(return_value={})
 
             context_data = docsearch_view.get_context_data()
+            # random sort by default, with the current seed
+            assert context_data["seed"] == docsearch_view.random_seed
+            # results, highlighting, and facets all from paged result
             assert (
                 context_data["highlighting"]
-                == context_data["page_obj"].object_list.get_highlighting.return_value
+                == mock_paged_qs.get_highlighting.return_value
+            )
+            assert (
+                context_data["documents"]
+                == context_data["page_obj"].object_list
+                == mock_paged_qs.get_results.return_value
             )
-            assert context_data["page_obj"].start_index() == 0
-            # NOTE: test paginator isn't initialized properly from queryset count
-            # assert context_data["paginator"].count == 22
+            mock_qs.get_facets.assert_not_called()
+            # total from the same response; no separate count query
+            mock_qs.count.assert_not_called()
+            assert context_data["paginator"].count == 22
+            assert context_data["page_obj"].start_index() == 1
+            # date range set on form from the same response
+            docdate_widget = context_data["form"].fields["docdate"].widget
+            assert docdate_widget.attrs["min"] == 1038
+            assert docdate_widget.attrs["max"] == 1042
+
+    @patch("geniza.corpus.views.index_version")
+    def test_get_result_cache_key(self, mock_index_version, rf):
+        mock_index_version.return_value = 101
+        docsearch_view = DocumentSearchView(kwargs={})
+
+        # random sort is cached with the current seed
+        docsearch_view.request = rf.get("/documents/")
+        with patch.object(DocumentSearchView, "random_seed", 1234):
+            key = docsearch_view.get_result_cache_key(50)
+        assert ("sort", "random") in key[0]
+        assert ("seed", 1234) in key[0]
+        # same seed specified in the request has the same key
+        docsearch_view.request = rf.get("/documents/", {"sort": "random", "seed": 1234})
+        assert docsearch_view.get_result_cache_key(50) == key
+        docsearch_view.request = rf.get("/documents/", {"sort": "random", "seed": 1235})
+        assert docsearch_view.get_result_cache_key(50) != key
+        # seed is ignored for other sorts
+        docsearch_view.request = rf.get("/documents/", {"sort": "shelfmark", "seed": 5})
+        assert ("seed", None) in docsearch_view.get_result_cache_key(50)[0]
+
+        docsearch_view.request = rf.get(
+            "/documents/", {"q": " deed  of sale", "sort": "relevance", "page": 2}
+        )
+        key = docsearch_view.get_result_cache_key(50)
+        assert ("q", "deed of sale") in key[0]
+        assert ("sort", "relevance") in key[0]
+        assert key[1:] == (("page", "2"), 50, 101)
+        # same search with different whitespace has the same key
+        docsearch_view.request = rf.get(
+            "/documents/", {"q": "deed of sale ", "sort": "relevance", "page": 2}
+        )
+        assert docsearch_view.get_result_cache_key(50) == key
+        # different page size or index version does not
+        assert docsearch_view.get_result_cache_key(10) != key
+        mock_index_version.return_value = 102
+        assert docsearch_view.get_result_cache_key(50) != key
+        # not cached when the index version is unknown
+        mock_index_version.return_value = None
+        assert docsearch_view.get_result_cache_key(50) is None
+
+    @pytest.mark.usefixtures("mock_solr_queryset")
+    @patch("geniza.corpus.views.index_version")
+    def test_paginate_queryset_cached(self, mock_index_version, rf, mock_solr_queryset):
+        mock_index_version.return_value = 101
+        search_result_cache.clear()
+        mock_qs = mock_solr_queryset(DocumentSolrQuerySet).return_value
+        mock_paged_qs = mock_qs.__getitem__.return_value
+        mock_paged_qs.count.return_value = 22
+        mock_paged_qs.get_json_facets.return_value = {}
+
+        docsearch_view = DocumentSearchView(kwargs={})
+        docsearch_view.request = rf.get("/documents/", {"sort": "shelfmark"})
+        paginator, page, documents, is_paginated = docsearch_view.paginate_queryset(
+            mock_qs, 50
+        )
+        assert documents == mock_paged_qs.get_results.return_value
+        assert page.object_list == documents
+        assert search_result_cache.stats()["misses"] == 1
+        assert search_result_cache.stats()["size"] == 1
+
+        # only plain result data is cached, not the queryset or paginator
+        cached_results = list(search_result_cache.entries.values())[0]
+        assert cached_results["count"] == 22
+        assert cached_results["page_number"] == 1
+        assert "paginator" not in cached_results
+        assert "page" not in cached_results
+
+        # same search again uses cached results, highlighting, and facets
+        mock_paged_qs.reset_mock()
+        (
+            cached_paginator,
+            cached_page,
+            cached_documents,
+            _,
+        ) = docsearch_view.paginate_queryset(mock_qs, 50)
+        assert cached_documents == documents
+        assert cached_paginator.count == paginator.count == 22
+        assert cached_page.number == page.number == 1
+        assert cached_page.object_list == documents
+        mock_paged_qs.get_results.assert_not_called()
+        mock_paged_qs.get_facets.assert_not_called()
+        assert search_result_cache.stats()["hits"] == 1
+
+        # invalid page
+        docsearch_view.request = rf.get("/documents/", {"sort": "shelfmark", "page": 4})
+        with pytest.raises(Http404):
+            docsearch_view.paginate_queryset(mock_qs, 50)
+        mock_paged_qs.reset_mock()
+
+        # seeded random sort is cached
+        docsearch_view.request = rf.get("/documents/", {"sort": "random", "seed": 5})
+        docsearch_view.paginate_queryset(mock_qs, 50)
+        docsearch_view.paginate_queryset(mock_qs, 50)
+        assert mock_paged_qs.get_results.call_count == 1
+        assert search_result_cache.stats()["size"] == 2
+
+    def test_get_transcription_highlights(self, rf):
+        docsearch_view = DocumentSearchView(kwargs={})
+        documents = [
+            {
+                "id": "document.1",
+                "pgpid": 1,
+                "transcription_lines": [
+                    {"line": 2, "text": "first deed"},
+                    {"line": 5, "text": "second deed"},
+                ],
+            },
+            {"id": "document.2", "pgpid": 2, "transcription_lines": []},
+        ]
+        # no keyword search: no lines
+        docsearch_view.request = rf.get("/documents/", {"sort": "shelfmark"})
+        assert docsearch_view.get_transcription_highlights(documents) == {}
+
+        docsearch_view.request = rf.get("/documents/", {"q": "deed"})
+        assert docsearch_view.get_transcription_highlights(documents) == {
+            "document.1": {
+                "transcription": ["first <em>deed</em>\nsecond <em>deed</em>"]
+            }
+        }
+        # no documents: no lines
+        assert docsearch_view.get_transcription_highlights([]) == {}
+
+    def test_get_cursor_mark(self, rf):
+        docsearch_view = DocumentSearchView(kwargs={})
+        docsearch_view.request = rf.get("/documents/", {"sort": "shelfmark"})
+        assert docsearch_view.get_cursor_mark() is None
+        docsearch_view.request = rf.get(
+            "/documents/", {"sort": "shelfmark", "cursor": "*"}
+        )
+        assert docsearch_view.get_cursor_mark() == "*"
+        # not supported for random sort
+        docsearch_view.request = rf.get("/documents/", {"cursor": "AoE1"})
+        assert docsearch_view.get_cursor_mark() is None
+
+    @pytest.mark.usefixtures("mock_solr_queryset")
+    @patch("geniza.corpus.views.index_version")
+    def test_get_search_results_cursor(
+        self, mock_index_version, rf, mock_solr_queryset
+    ):
+        search_result_cache.clear()
+        mock_qs = mock_solr_queryset(DocumentSolrQuerySet).return_value
+        mock_cursor_qs = mock_qs.cursor.return_value.__getitem__.return_value
+        mock_cursor_qs.count.return_value = 220
+        mock_cursor_qs.get_json_facets.return_value = {}
+        mock_cursor_qs.get_next_cursor_mark.return_value = "AoE2"
+
+        docsearch_view = DocumentSearchView(kwargs={})
+        docsearch_view.request = rf.get(
+            "/documents/", {"sort": "shelfmark", "cursor": "AoE1"}
+        )
+        results = docsearch_view.get_search_results(mock_qs, 50)
+        mock_qs.cursor.assert_called_with("AoE1")
+        mock_qs.cursor.return_value.__getitem__.assert_called_with(slice(None, 50))
+        # no offset query or numbered page
+        mock_qs.__getitem__.assert_not_called()
+        assert results["page_number"] is None
+        assert results["count"] == 220
+        assert results["documents"] == mock_cursor_qs.get_results.return_value
+        assert results["next_page_token"] == "AoE2"
+        paginator, page = docsearch_view.get_results_page(results, 50)
+        assert page is None
+        assert paginator.count == 220
+
+        # cached separately from numbered pages
+        key = docsearch_view.get_result_cache_key(50)
+        assert key[1] == ("cursor", "AoE1")
 
     def test_scholarship_sort(
         self,
@@ -771,17 +1090,58 @@ class TestDocumentSearchView:
         )
         # random, no seed set
         random_sort = docsearch_view.get_solr_sort("random")
-        assert random_sort.startswith("random_")
-        assert int(random_sort.split("_")[1])
+        assert random_sort == "random_%s" % docsearch_view.random_seed
+        # random with seed
+        assert docsearch_view.get_solr_sort("random", 1234) == "random_1234"
+
+    @override_settings(RANDOM_SORT_SEED_INTERVAL=3600)
+    @patch("geniza.corpus.views.time")
+    def test_random_seed(self, mock_time):
+        mock_time.time.return_value = 7200.5
+        assert DocumentSearchView().random_seed == 2
+        # seed changes after the interval
+        mock_time.time.return_value = 10800
+        assert DocumentSearchView().random_seed == 3
+
+    @patch.object(DocumentSearchView, "random_seed", 1234)
+    def test_get_seed(self, rf):
+        docsearch_view = DocumentSearchView(kwargs={})
+        # current seed for random sort without a seed
+        docsearch_view.request = rf.get("/documents/", {"sort": "random"})
+        assert docsearch_view.get_seed() == 1234
+        # seed from the request
+        docsearch_view.request = rf.get("/documents/", {"sort": "random", "seed": 5})
+        assert docsearch_view.get_seed() == 5
+        # no seed for other sorts
+        docsearch_view.request = rf.get("/documents/", {"sort": "shelfmark", "seed": 5})
+        assert docsearch_view.get_seed() is None
+
+    def test_is_later_page(self):
+        assert DocumentSearchView.is_later_page("2")
+        # compared as numbers, not strings
+        assert DocumentSearchView.is_later_page("10")
+        assert not DocumentSearchView.is_later_page("1")
+        assert not DocumentSearchView.is_later_page("01")
+        assert DocumentSearchView.is_later_page("last")
+        assert not DocumentSearchView.is_later_page("abc")
+        assert not DocumentSearchView.is_later_page("")
+        assert not DocumentSearchView.is_later_page(None)
 
     def test_random_page_redirect(self, client):
-        # any page of results other than one should redirect to the first page
+        # any page of results other than one without a seed should
+        # redirect to the same page with the current seed
         docsearch_url = reverse("corpus:document-search")
-        response = client.get(docsearch_url, {"sort": "random", "page": 2, "q": "test"})
+        with patch.object(DocumentSearchView, "random_seed", 1234):
+            response = client.get(
+                docsearch_url, {"sort": "random", "page": 2, "q": "test"}
+            )
         # should redirect
         assert response.status_code == 302
         # should preserve any query parameters
-        assert response["Location"] == "%s?sort=random&q=test" % docsearch_url
+        assert (
+            response["Location"]
+            == "%s?sort=random&page=2&q=test&seed=1234" % docsearch_url
+        )
 
     @pytest.mark.django_db
     def test_dispatch(self, client):
@@ -802,6 +1162,12 @@ class TestDocumentSearchView:
         response = client.head(reverse("corpus:document-search"), {"sort": "random"})
         assert "Last-Modified" not in response
 
+        # last-modified if random sort is requested with a seed
+        response = client.head(
+            reverse("corpus:document-search"), {"sort": "random", "seed": 1234}
+        )
+        assert response["Last-Modified"]
+
         # last-modified if random sort is requested
         response = client.head(
             reverse("corpus:document-search"), {"sort": "scholarship_desc"}
@@ -823,6 +1189,144 @@ class TestDocumentSearchView:
         assert new_last_modified != init_last_modified
 
 
+class TestDocumentSearchAPIView:
+    def test_get_solr_sort(self):
+        api_view = DocumentSearchAPIView()
+        # random sort not supported; sort by pgpid
+        assert api_view.get_solr_sort("random") == "pgpid_i"
+        assert api_view.get_solr_sort("shelfmark") == "shelfmark_s"
+
+    def test_get_fields(self, rf):
+        api_view = DocumentSearchAPIView()
+        api_view.request = rf.get("/api/documents/")
+        assert api_view.get_fields() == DocumentSearchAPIView.public_fields
+        # public fields are all valid field aliases
+        assert set(api_view.get_fields()) <= set(DocumentSolrQuerySet.field_aliases)
+        api_view.request = rf.get("/api/documents/", {"fields": "pgpid, shelfmark"})
+        assert api_view.get_fields() == ["pgpid", "shelfmark"]
+        api_view.request = rf.get("/api/documents/", {"fields": "pgpid,bogus"})
+        with pytest.raises(ValueError, match="Unknown fields: bogus"):
+            api_view.get_fields()
+
+    @patch("geniza.corpus.views.index_version", Mock(return_value=101))
+    def test_internal_fields(self, client):
+        api_url = reverse("document-search-api")
+        # internal fields are not included by default
+        with patch.object(DocumentSearchAPIView, "stream_results") as mock_stream:
+            mock_stream.return_value = iter(['{"count": 0, "documents": []}'])
+            response = client.get(api_url)
+            assert response.status_code == 200
+            fields = mock_stream.call_args.args[1]
+            for internal_field in ["notes", "needs_review", "status"]:
+                assert internal_field not in fields
+        # and can't be requested
+        for internal_field in ["notes", "needs_review"]:
+            response = client.get(api_url, {"fields": "pgpid,%s" % internal_field})
+            assert response.status_code == 400
+            assert internal_field in response.json()["errors"]["fields"][0]["message"]
+        # not included in output even if present in search results
+        output = DocumentSearchAPIView().api_result(
+            {"pgpid": 1, "notes": "internal", "needs_review": "check"},
+            DocumentSearchAPIView.public_fields,
+        )
+        assert output == {"pgpid": 1}
+
+    @patch("geniza.corpus.views.index_version")
+    def test_get_etag(self, mock_index_version, rf):
+        mock_index_version.return_value = 101
+        api_view = DocumentSearchAPIView()
+        api_view.request = rf.get("/api/documents/", {"q": "deed", "fields": "pgpid"})
+        etag = api_view.get_etag()
+        # same parameters in a different order
+        api_view.request = rf.get("/api/documents/", {"fields": "pgpid", "q": "deed"})
+        assert api_view.get_etag() == etag
+        # different parameters or index version
+        api_view.request = rf.get("/api/documents/", {"q": "sale", "fields": "pgpid"})
+        assert api_view.get_etag() != etag
+        mock_index_version.return_value = 102
+        api_view.request = rf.get("/api/documents/", {"q": "deed", "fields": "pgpid"})
+        assert api_view.get_etag() != etag
+        # no etag when the index version is unknown
+        mock_index_version.return_value = None
+        assert api_view.get_etag() is None
+
+    def test_stream_results(self):
+        api_view = DocumentSearchAPIView()
+        api_view.chunk_size = 2
+        mock_qs = MagicMock()
+        chunk = mock_qs.cursor.return_value.__getitem__.return_value
+        chunk.count.return_value = 3
+        chunk.get_results.side_effect = [
+            [{"pgpid": 1, "type": "Letter"}, {"pgpid": 2}],
+            [{"pgpid": 3}],
+        ]
+        chunk.get_next_cursor_mark.return_value = "AoE2"
+        output = "".join(api_view.stream_results(mock_qs, ["pgpid"]))
+        assert json.loads(output) == {
+            "count": 3,
+            "documents": [{"pgpid": 1}, {"pgpid": 2}, {"pgpid": 3}],
+        }
+        assert mock_qs.cursor.call_args_list[0].args == ("*",)
+        assert mock_qs.cursor.call_args_list[1].args == ("AoE2",)
+        # no extra request after partial chunk
+        assert mock_qs.cursor.call_count == 2
+
+    def test_stream_results_empty(self):
+        api_view = DocumentSearchAPIView()
+        mock_qs = MagicMock()
+        chunk = mock_qs.cursor.return_value.__getitem__.return_value
+        chunk.count.return_value = 0
+        chunk.get_results.return_value = []
+        output = "".join(api_view.stream_results(mock_qs, ["pgpid"]))
+        assert json.loads(output) == {"count": 0, "documents": []}
+
+    def test_api_result(self):
+        api_view = DocumentSearchAPIView()
+        doc = DocumentSolrQuerySet().get_result_document(
+            ParasolrDict(
+                {
+                    "pgpid": 1,
+                    "shelfmark": "T-S 1",
+                    "iiif_images": ["https://iiif.example.com/images/1"],
+                    "iiif_labels": ["1r"],
+                }
+            )
+        )
+        assert api_view.api_result(doc, ["pgpid", "iiif_images"]) == {
+            "pgpid": 1,
+            "iiif_images": ["https://iiif.example.com/images/1"],
+        }
+
+    @patch("geniza.corpus.views.index_version", Mock(return_value=101))
+    def test_get(self, client):
+        api_url = reverse("document-search-api")
+        # invalid field
+        response = client.get(api_url, {"fields": "bogus"})
+        assert response.status_code == 400
+        assert "Unknown fields" in response.json()["errors"]["fields"][0]["message"]
+        # invalid form
+        response = client.get(api_url, {"sort": "bogus"})
+        assert response.status_code == 400
+        assert "sort" in response.json()["errors"]
+
+        with patch.object(DocumentSearchAPIView, "stream_results") as mock_stream:
+            mock_stream.return_value = iter(['{"count": 0, "documents": []}'])
+            response = client.get(
+                api_url, {"fields": "pgpid"}, HTTP_ACCEPT_ENCODING="gzip"
+            )
+            assert response.status_code == 200
+            assert response.streaming
+            assert response["Content-Type"] == "application/json"
+            assert response["Content-Encoding"] == "gzip"
+            etag = response["ETag"]
+
+            # not modified when etag matches; no search
+            mock_stream.reset_mock()
+            response = client.get(api_url, {"fields": "pgpid"}, HTTP_IF_NONE_MATCH=etag)
+            assert response.status_code == 304
+            mock_stream.assert_not_called()
+
+
 class TestDocumentScholarshipView:
     def test_page_title(self, document, client, source):
         """should incorporate doc title into scholarship page title"""
@@ -893,15 +1397,13 @@ class TestDocumentScholarshipView:
         assert docsearch_view.get_paginate_by(qs) == 2
 
 
-@patch("geniza.corpus.views.IIIFPresentation")
-@patch("geniza.corpus.models.IIIFPresentation")
+@patch("geniza.corpus.models.fetch_manifests")
 class TestDocumentManifestView:
     view_name = "corpus:document-manifest"
 
     def test_no_images_no_transcription(
         self,
-        mock_view_iiifpres,
-        mock_model_iiifpres,
+        mock_fetch_manifests,
         client,
         document,
         source,
@@ -916,18 +1418,18 @@ class TestDocumentManifestView:
 
     def test_images_no_transcription(
         self,
-        mock_view_iiifpres,
-        mock_model_iiifpres,
+        mock_fetch_manifests,
         client,
         document,
         source,
         fragment,
     ):
         # document fragment has iiif, but no transcription; should return a manifest
+        # remove locally cached manifest to test loading the remote manifest
+        Fragment.objects.filter(pk=fragment.pk).update(manifest=None)
 
-        mock_manifest = (
-            mock_view_iiifpres.from_url.return_value
-        ) = mock_model_iiifpres.from_url.return_value
+        mock_manifest = Mock()
+        mock_fetch_manifests.return_value = {fragment.iiif_url: mock_manifest}
         mock_manifest.label = "Remote content"
         mock_manifest.id = "http://example.io/manifest/1"
         mock_manifest.attribution = (
@@ -940,7 +1442,7 @@ class TestDocumentManifestView:
         response = client.get(reverse(self.view_name, args=[document.pk]))
         assert response.status_code == 200
 
-        assert mock_view_iiifpres.from_url.called_with(fragment.iiif_url)
+        mock_fetch_manifests.assert_called_once()
 
         # should not contain annotation list, since there is no transcription
         assertNotContains(response, "otherContent")
@@ -960,12 +1462,43 @@ class TestDocumentManifestView:
             == "original source: %s" % mock_manifest.label
         )
 
-    def test_images_no_attribution(
-        self, mock_view_iiifpres, mock_model_iiifpres, client, document
+    def test_images_local_manifest(
+        self, mock_fetch_manifests, client, document, fragment
     ):
-        # manifest has no attribution
-        mock_manifest = mock_view_iiifpres.from_url.return_value
-        del mock_manifest.attribution  # remove attribution key
+        # locally cached manifest with attribution and a canvas
+        fragment.manifest.label = "Cached content"
+        fragment.manifest.extra_data = {"attribution": "<p>From a library</p>"}
+        fragment.manifest.save()
+        Canvas.objects.create(
+            manifest=fragment.manifest,
+            label="1r",
+            uri="urn:m1/c1",
+            iiif_image_id="http://example.co/iiif/ts-1/00001",
+            short_id="c",
+            order=1,
+            extra_data={"width": 300, "height": 250},
+        )
+        response = client.get(reverse(self.view_name, args=[document.pk]))
+        assert response.status_code == 200
+        # should not load any remote manifests
+        assert mock_fetch_manifests.call_count == 0
+        result = response.json()
+        assert "From a library" in result["attribution"]
+        canvas_1 = result["sequences"][0]["canvases"][0]
+        assert canvas_1["@id"] == "urn:m1/c1"
+        assert canvas_1["label"] == "1r"
+        assert canvas_1["width"] == 300
+        assert (
+            canvas_1["images"][0]["resource"]["service"]["@id"]
+            == "http://example.co/iiif/ts-1/00001"
+        )
+        assert canvas_1["partOf"][0]["@id"] == fragment.manifest.uri
+        assert canvas_1["partOf"][0]["label"]["en"] == [
+            "original source: Cached content"
+        ]
+
+    def test_images_no_attribution(self, mock_fetch_manifests, client, document):
+        # locally cached manifest has no attribution
 
         # should only have the default attribution content
         response = client.get(reverse(self.view_name, args=[document.pk]))
@@ -977,8 +1510,7 @@ class TestDocumentManifestView:
 
     def test_no_images_transcription(
         self,
-        mock_view_iiifpres,
-        mock_model_iiifpres,
+        mock_fetch_manifests,
         client,
         document,
         source,
@@ -998,7 +1530,7 @@ class TestDocumentManifestView:
         assert response.status_code == 200
 
         # should not load any remote manifests
-        assert mock_view_iiifpres.from_url.call_count == 0
+        assert mock_fetch_manifests.call_count == 0
         # should use empty canvas id
         assertContains(response, EMPTY_CANVAS_ID)
         # should include annotations
@@ -1009,9 +1541,27 @@ class TestDocumentManifestView:
             response, reverse("corpus:document-annotations", args=[document.pk])
         )
 
-    def test_get_absolute_url(
-        self, mock_view_iiifpres, mock_model_iiifpres, document, source
+    @patch("geniza.corpus.views.index_changed")
+    def test_etag_not_modified(
+        self, mock_index_changed, mock_fetch_manifests, client, document, fragment
     ):
+        # remove locally cached manifest to test loading the remote manifest
+        Fragment.objects.filter(pk=fragment.pk).update(manifest=None)
+        mock_fetch_manifests.return_value = {
+            fragment.iiif_url: Mock(sequences=[Mock(canvases=[])])
+        }
+        manifest_url = reverse(self.view_name, args=[document.pk])
+        response = client.get(manifest_url)
+        assert response.status_code == 200
+        assert mock_fetch_manifests.call_count == 1
+        # not modified when etag matches; remote manifest is not loaded
+        response = client.get(manifest_url, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert response.status_code == 304
+        assert mock_fetch_manifests.call_count == 1
+        # manifest content does not come from solr
+        mock_index_changed.assert_not_called()
+
+    def test_get_absolute_url(self, mock_fetch_manifests, document, source):
         """should return manifest permalink"""
 
         view = DocumentManifestView()
@@ -1022,17 +1572,17 @@ class TestDocumentManifestView:
         )
 
 
-@patch("geniza.corpus.views.IIIFPresentation")
+@patch("geniza.corpus.models.fetch_manifests")
 class TestDocumentAnnotationListView:
     view_name = DocumentAnnotationListView.viewname
 
-    def test_no_transcription(self, mockiifpres, client, document):
+    def test_no_transcription(self, mock_fetch_manifests, client, document):
         # no iiif or transcription; should 404
         response = client.get(reverse(self.view_name, args=[document.pk]))
         assert response.status_code == 404
 
     def test_images_transcription(
-        self, mockiifpres, client, document, source, fragment
+        self, mock_fetch_manifests, client, document, source, fragment
     ):
         # add a footnote with transcription content
         transcription = Footnote.objects.create(
@@ -1041,7 +1591,10 @@ class TestDocumentAnnotationListView:
             content={"html": "text"},
             doc_relation=Footnote.EDITION,
         )
-        mock_manifest = mockiifpres.from_url.return_value
+        # remove locally cached manifest to test loading the remote manifest
+        Fragment.objects.filter(pk=fragment.pk).update(manifest=None)
+        mock_manifest = Mock()
+        mock_fetch_manifests.return_value = {fragment.iiif_url: mock_manifest}
         test_canvas = new_iiif_canvas()
         test_canvas.id = "urn:m1/c1"
         test_canvas.width = 300
@@ -1060,8 +1613,32 @@ class TestDocumentAnnotationListView:
             data["resources"][0]["resource"] == transcription.iiif_annotation_content()
         )
 
+    def test_images_local_manifest(
+        self, mock_fetch_manifests, client, document, source, fragment
+    ):
+        Footnote.objects.create(
+            content_object=document,
+            source=source,
+            content={"html": "text"},
+            doc_relation=Footnote.EDITION,
+        )
+        Canvas.objects.create(
+            manifest=fragment.manifest,
+            label="1r",
+            uri="urn:m1/c1",
+            iiif_image_id="http://example.co/iiif/ts-1/00001",
+            short_id="c",
+            order=1,
+            extra_data={"width": 300, "height": 250},
+        )
+        response = client.get(reverse(self.view_name, args=[document.pk]))
+        assert response.status_code == 200
+        # should annotate the locally cached canvas without loading remote manifests
+        assert mock_fetch_manifests.call_count == 0
+        assert response.json()["resources"][0]["on"] == "urn:m1/c1#xywh=0,0,300,250"
+
     def test_no_images_transcription(
-        self, mockiifpres, client, document, source, fragment
+        self, mock_fetch_manifests, client, document, source, fragment
     ):
         # remove iiif url from fixture document fragment has iiif
         fragment.iiif_url = ""
@@ -1077,14 +1654,14 @@ class TestDocumentAnnotationListView:
         assert response.status_code == 200
 
         # should not load any remote manifests
-        assert mockiifpres.from_url.call_count == 0
+        assert mock_fetch_manifests.call_count == 0
         # should use empty canvas id
         assertContains(response, EMPTY_CANVAS_ID)
         # should include transcription content
         assertContains(response, "here is my transcription text")
 
     def test_no_shared_resources(
-        self, mockiifpres, client, document, source, fragment, join
+        self, mock_fetch_manifests, client, document, source, fragment, join
     ):
         # a list object initialized once in iiif_utils.base_annotation_list
         # was getting reused, resulting in annotations being aggregated
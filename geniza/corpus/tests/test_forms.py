@@ -130,6 +130,9 @@ class TestDocumentSearchForm:
         # no filters should return false
         form = DocumentSearchForm(data={"q": "test", "sort": "scholarship_desc"})
         assert not form.filters_active()
+        # random sort seed is not a filter
+        form = DocumentSearchForm(data={"sort": "random", "seed": 1234})
+        assert not form.filters_active()
         # errors should return false
         form = DocumentSearchForm(
             data={"q": "", "sort": "relevance", "has_transcription": True}
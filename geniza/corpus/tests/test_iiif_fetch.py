@@ -0,0 +1,123 @@
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+from django.test import override_settings
+from piffle.presentation import IIIFException
+
+from geniza.common.timing import RequestTiming, current_timing
+from geniza.corpus.iiif_fetch import ManifestFetcher, fetch_manifests
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = ManifestFetcher()
+    fetcher._session = Mock()
+    yield fetcher
+    if fetcher._executor is not None:
+        fetcher._executor.shutdown()
+
+
+def manifest_response(url, **kwargs):
+    return Mock(status_code=200, json=Mock(return_value={"@id": url}))
+
+
+class TestManifestFetcher:
+    @override_settings(IIIF_FETCH_TIMEOUT=5)
+    def test_fetch_all(self, fetcher):
+        fetcher.session.get.side_effect = manifest_response
+        urls = ["https://iiif.example.com/1", "https://iiif.example.org/2"]
+        # duplicate urls are only requested once
+        manifests = fetcher.fetch_all(urls + urls[:1])
+        assert list(manifests) == urls
+        assert manifests[urls[0]].id == urls[0]
+        assert manifests[urls[1]].id == urls[1]
+        assert fetcher.session.get.call_count == 2
+        assert fetcher.session.get.call_args.kwargs["timeout"] == 5
+        # nothing left in flight
+        assert not fetcher.in_flight
+
+    def test_fetch_all_errors(self, fetcher):
+        fetcher.session.get.side_effect = [
+            Mock(status_code=404, reason="Not Found"),
+            requests.exceptions.ReadTimeout("timed out"),
+            Mock(status_code=200, json=Mock(side_effect=ValueError("bad json"))),
+        ]
+        urls = ["https://iiif.example.com/%d" % i for i in range(3)]
+        # use a single worker so responses are returned in order
+        with override_settings(IIIF_FETCH_MAX_WORKERS=1):
+            with patch("geniza.corpus.iiif_fetch.logger") as mock_logger:
+                assert fetcher.fetch_all(urls) == {url: None for url in urls}
+        assert mock_logger.warning.call_count == 3
+
+    def test_load(self, fetcher):
+        fetcher.session.get.return_value = Mock(status_code=500, reason="Error")
+        with pytest.raises(IIIFException, match="500 Error"):
+            fetcher.load("https://iiif.example.com/1")
+        fetcher.session.get.side_effect = requests.exceptions.ConnectionError
+        with pytest.raises(IIIFException, match="Error retrieving manifest"):
+            fetcher.load("https://iiif.example.com/1")
+
+    def test_load_timing(self, fetcher):
+        fetcher.session.get.side_effect = manifest_response
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+        try:
+            fetcher.fetch_all(["https://iiif.example.com/1"])
+        finally:
+            current_timing.reset(token)
+        # recorded for the request that started the load
+        assert timing.counts["iiif"] == 1
+
+    def test_submit_in_flight(self, fetcher):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_response(url, **kwargs):
+            started.set()
+            release.wait(5)
+            return manifest_response(url)
+
+        fetcher.session.get.side_effect = slow_response
+        url = "https://iiif.example.com/1"
+        future = fetcher.submit(url)
+        started.wait(5)
+        # requests for the same url in progress share a single request
+        assert fetcher.submit(url) is future
+        release.set()
+        assert future.result().id == url
+        assert fetcher.session.get.call_count == 1
+        assert url not in fetcher.in_flight
+
+    @override_settings(IIIF_FETCH_PER_HOST=2)
+    def test_host_limit(self, fetcher):
+        limit = fetcher.host_limit("https://iiif.example.com/1")
+        assert fetcher.host_limit("https://iiif.example.com/2") is limit
+        assert fetcher.host_limit("https://iiif.example.org/1") is not limit
+        assert limit.acquire(blocking=False)
+        assert limit.acquire(blocking=False)
+        assert not limit.acquire(blocking=False)
+
+    @override_settings(DJIFFY_AUTH_TOKENS={"iiif.example.com": "secret"})
+    def test_request_params(self, fetcher):
+        assert fetcher.request_params("https://iiif.example.com/1") == {
+            "auth_token": "secret"
+        }
+        assert fetcher.request_params("https://iiif.example.org/1") == {}
+
+    def test_session(self):
+        fetcher = ManifestFetcher()
+        with override_settings(IIIF_FETCH_MAX_WORKERS=3):
+            session = fetcher.session
+        assert isinstance(session, requests.Session)
+        # connection pool sized for all workers
+        assert session.get_adapter("https://iiif.example.com/")._pool_maxsize == 3
+        assert fetcher.session is session
+
+
+@patch("geniza.corpus.iiif_fetch.manifest_fetcher")
+def test_fetch_manifests(mock_fetcher):
+    urls = ["https://iiif.example.com/1"]
+    assert fetch_manifests(urls) == mock_fetcher.fetch_all.return_value
+    mock_fetcher.fetch_all.assert_called_with(urls)
@@ -1,6 +1,12 @@
+from unittest.mock import Mock
+
 from django.utils.translation import activate
 
-from geniza.corpus.iiif_utils import get_iiif_string
+from geniza.corpus.iiif_utils import (
+    canvas_from_djiffy,
+    get_iiif_string,
+    manifest_from_djiffy,
+)
 
 
 def test_get_iiif_string():
@@ -25,3 +31,43 @@ def test_get_iiif_string():
 
     # list of strings, should return first string
     assert get_iiif_string(["text", "test"]) == "text"
+
+
+def test_canvas_from_djiffy():
+    canvas = Mock(
+        uri="urn:m1/c1",
+        label="1r",
+        width=300,
+        height=250,
+        iiif_image_id="http://example.co/iiif/ts-1/00001",
+    )
+    canvas.image.__str__ = Mock(return_value="http://example.co/iiif/ts-1/00001/full")
+    data = canvas_from_djiffy(canvas)
+    assert data["@id"] == "urn:m1/c1"
+    assert data["@type"] == "sc:Canvas"
+    assert data["label"] == "1r"
+    assert (data["width"], data["height"]) == (300, 250)
+    image = data["images"][0]
+    assert image["on"] == "urn:m1/c1"
+    assert image["resource"]["@id"] == "http://example.co/iiif/ts-1/00001/full"
+    assert image["resource"]["service"]["@id"] == "http://example.co/iiif/ts-1/00001"
+
+
+def test_manifest_from_djiffy():
+    canvas = Mock(uri="urn:m1/c1", iiif_image_id="http://example.co/iiif/ts-1/00001")
+    manifest = Mock(
+        uri="http://example.io/manifests/1",
+        label="Remote content",
+        extra_data={"attribution": "From a library"},
+    )
+    manifest.canvases.all.return_value = [canvas]
+    iiif_manifest = manifest_from_djiffy(manifest)
+    # supports the same access as remote manifests
+    assert iiif_manifest.id == "http://example.io/manifests/1"
+    assert iiif_manifest.label == "Remote content"
+    assert iiif_manifest.attribution == "From a library"
+    assert iiif_manifest.sequences[0].canvases[0].id == "urn:m1/c1"
+
+    # attribution is omitted when not present
+    manifest.extra_data = {}
+    assert "attribution" not in manifest_from_djiffy(manifest)
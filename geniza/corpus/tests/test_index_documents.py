@@ -0,0 +1,229 @@
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from geniza.corpus.management.commands import index_documents
+from geniza.corpus.models import Document, IndexWatermark, TextBlock
+
+
+def test_pgpid_batches():
+    assert index_documents.pgpid_batches([], 10) == []
+    assert index_documents.pgpid_batches([1, 2, 5], 10) == [[1, 2, 5]]
+    assert index_documents.pgpid_batches([1, 2, 5, 8, 13], 2) == [
+        [1, 2],
+        [5, 8],
+        [13],
+    ]
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.management.commands.index_documents.SolrClient")
+def test_index_pgpids(mock_solrclient, document, join):
+    index_documents.init_worker()
+    pid, count, skipped, elapsed = index_documents.index_pgpids([document.pk, join.pk])
+    assert count == 2
+    mock_update = mock_solrclient.return_value.update
+    mock_update.index.assert_called_once()
+    indexed_ids = [d["pgpid_i"] for d in mock_update.index.call_args[0][0]]
+    assert sorted(indexed_ids) == sorted([document.pk, join.pk])
+
+    # no matching documents: nothing sent to solr
+    mock_update.reset_mock()
+    pid, count, skipped, elapsed = index_documents.index_pgpids([0])
+    assert count == 0
+    mock_update.index.assert_not_called()
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.management.commands.index_documents.SolrQuerySet")
+@patch("geniza.corpus.management.commands.index_documents.SolrClient")
+def test_index_pgpids_changed_only(mock_solrclient, mock_solrqueryset, document, join):
+    index_documents.init_worker()
+    # document hash matches what is in solr; join hash does not
+    mock_solrqueryset.return_value.filter.return_value.only.return_value.get_results.return_value = [
+        {
+            "id": document.index_id(),
+            "index_hash_s": document.index_data()["index_hash_s"],
+        },
+        {"id": join.index_id(), "index_hash_s": "outdated"},
+    ]
+    pid, count, skipped, elapsed = index_documents.index_pgpids(
+        [document.pk, join.pk], changed_only=True
+    )
+    assert count == 1
+    assert skipped == 1
+    mock_solrqueryset.return_value.filter.assert_called_with(
+        item_type_s="document", pgpid_i__in=[str(document.pk), str(join.pk)]
+    )
+    mock_update = mock_solrclient.return_value.update
+    indexed = mock_update.index.call_args[0][0]
+    assert [d["pgpid_i"] for d in indexed] == [join.pk]
+
+    # nothing changed: nothing sent to solr
+    mock_update.reset_mock()
+    pid, count, skipped, elapsed = index_documents.index_pgpids(
+        [document.pk], changed_only=True
+    )
+    assert (count, skipped) == (0, 1)
+    mock_update.index.assert_not_called()
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.management.commands.index_documents.SolrClient")
+def test_handle_single_worker(mock_solrclient, document, join):
+    stdout = StringIO()
+    call_command("index_documents", workers=1, batch_size=1, stdout=stdout)
+    output = stdout.getvalue()
+    assert "Indexing 2 documents in 2 batches with 1 worker" in output
+    assert "Worker 1: 2 documents" in output
+    assert "Indexed 2 documents in" in output
+    mock_update = mock_solrclient.return_value.update
+    # one update per batch, plus the final commit
+    assert mock_update.index.call_count == 3
+    mock_update.index.assert_called_with([], commit=True)
+
+
+@pytest.mark.django_db
+def test_handle_invalid_options():
+    with pytest.raises(CommandError):
+        call_command("index_documents", workers=0, stdout=StringIO())
+    with pytest.raises(CommandError):
+        call_command("index_documents", batch_size=0, stdout=StringIO())
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.management.commands.index_documents.SolrClient")
+def test_handle_delta(mock_solrclient, document, join):
+    stdout = StringIO()
+    # no watermark: index everything, then record the watermark
+    call_command("index_documents", workers=1, delta=True, stdout=stdout)
+    assert "Indexing 2 documents" in stdout.getvalue()
+    watermark = IndexWatermark.objects.get(name=index_documents.Command.watermark_name)
+    first_run = watermark.timestamp
+    assert first_run <= timezone.now()
+
+    # modify one document; only that document is indexed
+    document.save()
+    stdout = StringIO()
+    call_command("index_documents", workers=1, delta=True, stdout=stdout)
+    output = stdout.getvalue()
+    assert "Found documents changed since" in output
+    assert "Indexing 1 document in 1 batch" in output
+    mock_update = mock_solrclient.return_value.update
+    indexed = mock_update.index.call_args_list[-2][0][0]
+    assert [d["pgpid_i"] for d in indexed] == [document.pk]
+    watermark.refresh_from_db()
+    assert watermark.timestamp > first_run
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.management.commands.index_documents.SolrClient")
+def test_handle_delta_error(mock_solrclient, document):
+    mock_solrclient.return_value.update.index.side_effect = (
+        index_documents.requests.exceptions.ConnectionError
+    )
+    with pytest.raises(CommandError):
+        call_command("index_documents", workers=1, delta=True, stdout=StringIO())
+    # watermark not updated when indexing fails
+    assert not IndexWatermark.objects.exists()
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.models.fetch_manifests")
+@patch("geniza.corpus.management.commands.index_documents.SolrClient")
+def test_handle_offline(mock_solrclient, mock_fetch_manifests, fragment_no_manifest):
+    doc = Document.objects.create()
+    TextBlock.objects.create(document=doc, fragment=fragment_no_manifest)
+    stdout = StringIO()
+    call_command("index_documents", workers=1, offline=True, stdout=stdout)
+    # remote manifest not loaded
+    mock_fetch_manifests.assert_not_called()
+    indexed = mock_solrclient.return_value.update.index.call_args_list[0][0][0]
+    assert indexed[0]["has_image_b"] is False
+    # fragment included in the report
+    output = stdout.getvalue()
+    assert "1 fragment with no cached IIIF manifest" in output
+    assert fragment_no_manifest.iiif_url in output
+    # default behavior restored after indexing
+    assert Document.index_remote_manifests
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.management.commands.index_documents.SolrQuerySet")
+@patch("geniza.corpus.management.commands.index_documents.BaseSolrClient")
+@patch("geniza.corpus.management.commands.index_documents.SolrClient")
+def test_handle_shadow(
+    mock_solrclient, mock_basesolrclient, mock_solrqueryset, document, join
+):
+    mock_solr = mock_solrclient.return_value
+    mock_solr.collection = "geniza"
+    # shadow core does not exist yet, then exists once created
+    mock_solr.core_admin.ping.side_effect = [False, True]
+    mock_solrqueryset.return_value.filter.return_value.count.return_value = 2
+    stdout = StringIO()
+    call_command("index_documents", workers=1, shadow=True, stdout=stdout)
+
+    mock_solr.core_admin.unload.assert_not_called()
+    mock_solr.core_admin.create.assert_called_with(
+        "geniza_shadow", configSet=settings.SOLR_CONNECTIONS["default"]["CONFIGSET"]
+    )
+    # documents indexed and committed in the shadow core, not the live core
+    mock_basesolrclient.assert_called_with(
+        mock_solr.solr_url, "geniza_shadow", commitWithin=mock_solr.commitWithin
+    )
+    shadow_update = mock_basesolrclient.return_value.update
+    assert shadow_update.index.call_count == 2
+    shadow_update.index.assert_called_with([], commit=True)
+    mock_solr.update.index.assert_not_called()
+    # cores swapped
+    mock_solr.core_admin.make_request.assert_called_once()
+    assert mock_solr.core_admin.make_request.call_args[1]["params"] == {
+        "action": "SWAP",
+        "core": "geniza",
+        "other": "geniza_shadow",
+    }
+    assert "Swapped shadow core into geniza" in stdout.getvalue()
+
+    # existing shadow core is removed; count mismatch prevents swap
+    mock_solr.core_admin.reset_mock()
+    mock_solr.core_admin.ping.side_effect = [True, True]
+    mock_solrqueryset.return_value.filter.return_value.count.return_value = 1
+    with pytest.raises(CommandError, match="expected 2"):
+        call_command("index_documents", workers=1, shadow=True, stdout=StringIO())
+    mock_solr.core_admin.unload.assert_called_once()
+    mock_solr.core_admin.make_request.assert_not_called()
+
+    # shadow is always a full rebuild
+    with pytest.raises(CommandError):
+        call_command("index_documents", shadow=True, delta=True, stdout=StringIO())
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.management.commands.index_documents.SolrClient")
+def test_handle_rollback(mock_solrclient):
+    mock_solr = mock_solrclient.return_value
+    mock_solr.collection = "geniza"
+    mock_solr.core_admin.ping.return_value = True
+    stdout = StringIO()
+    call_command("index_documents", rollback=True, stdout=stdout)
+    assert mock_solr.core_admin.make_request.call_args[1]["params"] == {
+        "action": "SWAP",
+        "core": "geniza",
+        "other": "geniza_shadow",
+    }
+    assert "Restored previous index" in stdout.getvalue()
+
+    # swap failed
+    mock_solr.core_admin.make_request.return_value = None
+    with pytest.raises(CommandError, match="Failed to swap"):
+        call_command("index_documents", rollback=True, stdout=StringIO())
+
+    # no shadow core to roll back to
+    mock_solr.core_admin.ping.return_value = False
+    with pytest.raises(CommandError, match="No shadow core"):
+        call_command("index_documents", rollback=True, stdout=StringIO())
@@ -0,0 +1,121 @@
+from unittest.mock import patch
+
+import pytest
+from django.conf import settings
+from django.contrib.admin.models import ADDITION, CHANGE, LogEntry
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from djiffy.models import Canvas, Manifest
+
+from geniza.corpus.models import (
+    Document,
+    DocumentType,
+    Fragment,
+    LanguageScript,
+    TextBlock,
+)
+from geniza.footnotes.models import (
+    Creator,
+    Footnote,
+    Source,
+    SourceLanguage,
+    SourceType,
+)
+
+
+def make_corpus(num_docs):
+    """Create a synthetic corpus of documents with the related records
+    that are included in index data: fragments with cached IIIF manifests,
+    tags, languages, log entries, and footnotes on sources with multiple
+    authors and languages."""
+    doctype = DocumentType.objects.create(name_en="Letter")
+    lang = LanguageScript.objects.create(language="Judaeo-Arabic", script="Hebrew")
+    book = SourceType.objects.get_or_create(type="Book")[0]
+    hebrew = SourceLanguage.objects.get_or_create(name="Hebrew", code="he")[0]
+    english = SourceLanguage.objects.get_or_create(name="English", code="en")[0]
+    authors = [
+        Creator.objects.create(last_name_en="Goitein", first_name_en="S. D."),
+        Creator.objects.create(last_name_en="Friedman", first_name_en="Mordechai"),
+    ]
+    doc_contenttype = ContentType.objects.get_for_model(Document)
+    script_user = User.objects.get(username=settings.SCRIPT_USERNAME)
+
+    docs = []
+    for i in range(num_docs):
+        doc = Document.objects.create(
+            description_en="Letter number %d" % i,
+            doctype=doctype,
+            doc_date_standard="1100-01-0%d" % (i % 9 + 1),
+        )
+        # fragment with a locally cached manifest and two canvases
+        manifest = Manifest.objects.create(
+            uri="https://iiif.example.com/%d" % i, short_id="m%d" % i
+        )
+        for order in range(2):
+            Canvas.objects.create(
+                manifest=manifest,
+                label="%d%s" % (i, "rv"[order]),
+                iiif_image_id="https://iiif.example.com/image/%d/%d" % (i, order),
+                short_id="c%d" % order,
+                order=order,
+            )
+        fragment = Fragment.objects.create(
+            shelfmark="T-S %d.1" % i, iiif_url=manifest.uri, manifest=manifest
+        )
+        TextBlock.objects.create(document=doc, fragment=fragment, side="r")
+        doc.tags.add("letter", "tag %d" % i)
+        doc.languages.add(lang)
+        for j in range(2):
+            source = Source.objects.create(
+                title_en="Source %d.%d" % (i, j), source_type=book
+            )
+            source.languages.add(hebrew, english)
+            for author in authors:
+                source.authors.add(author)
+            Footnote.objects.create(
+                source=source,
+                content_object=doc,
+                doc_relation=[Footnote.EDITION, Footnote.TRANSLATION],
+                content={"text": "transcription %d" % i},
+                notes="note",
+            )
+        for flag in [ADDITION, CHANGE]:
+            LogEntry.objects.create(
+                user=script_user,
+                object_id=str(doc.pk),
+                object_repr=str(doc)[:200],
+                content_type=doc_contenttype,
+                action_flag=flag,
+            )
+        docs.append(doc)
+    return docs
+
+
+def count_index_queries(pgpids):
+    """Number of queries used to generate index data for a batch of
+    documents as loaded by :meth:`Document.items_to_index`."""
+    # no remote manifests should be loaded
+    with CaptureQueriesContext(connection) as context, patch(
+        "geniza.corpus.models.fetch_manifests"
+    ) as mock_fetch_manifests:
+        index_data = [
+            doc.index_data() for doc in Document.items_to_index().filter(pk__in=pgpids)
+        ]
+    assert len(index_data) == len(pgpids)
+    assert all(data["has_image_b"] for data in index_data)
+    mock_fetch_manifests.assert_not_called()
+    return len(context.captured_queries)
+
+
+@pytest.mark.django_db
+def test_index_data_query_budget():
+    # queries to index a batch of documents should not depend on batch size
+    pgpids = [doc.pk for doc in make_corpus(12)]
+    queries_per_batch = [
+        count_index_queries(pgpids[:batch_size]) for batch_size in [1, 4, 12]
+    ]
+    assert len(set(queries_per_batch)) == 1, (
+        "Queries per batch grow with batch size: %s" % queries_per_batch
+    )
@@ -0,0 +1,195 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+import requests
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.utils import timezone
+
+from geniza.corpus.models import DocumentSignalHandlers, IndexQueueItem
+
+
+@pytest.mark.django_db
+def test_enqueue_and_stats():
+    assert IndexQueueItem.stats() == {"depth": 0, "lag": 0}
+    IndexQueueItem.enqueue([1, 2])
+    first_queued = IndexQueueItem.objects.get(pgpid=1).queued
+    # already queued documents are not duplicated, but the version changes
+    IndexQueueItem.enqueue([1, 3])
+    assert IndexQueueItem.objects.count() == 3
+    assert IndexQueueItem.objects.get(pgpid=1).queued == first_queued
+    assert IndexQueueItem.objects.get(pgpid=1).version == 2
+    assert IndexQueueItem.objects.get(pgpid=2).version == 1
+    # nothing to queue
+    IndexQueueItem.enqueue([])
+    assert IndexQueueItem.objects.count() == 3
+
+    IndexQueueItem.objects.filter(pgpid=1).update(
+        queued=timezone.now() - timedelta(minutes=5)
+    )
+    stats = IndexQueueItem.stats()
+    assert stats["depth"] == 3
+    assert stats["lag"] >= 300
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.models.Document.index_items")
+def test_queue_reindex_setting(mock_indexitems, settings, document):
+    settings.SOLR_INDEX_QUEUE = True
+    DocumentSignalHandlers.queue_reindex([document.pk])
+    # added to the queue table instead of indexed
+    mock_indexitems.assert_not_called()
+    assert IndexQueueItem.objects.filter(pgpid=document.pk).exists()
+
+
+@pytest.mark.django_db
+def test_dequeue():
+    IndexQueueItem.enqueue([1, 2])
+    items = list(IndexQueueItem.objects.all())
+    # document 2 is changed again after the items were loaded
+    IndexQueueItem.enqueue([2])
+    IndexQueueItem.objects.update(claimed=timezone.now())
+    assert IndexQueueItem.dequeue(items) == 1
+    assert list(IndexQueueItem.objects.values_list("pgpid", flat=True)) == [2]
+    # the item left in the queue is released to be indexed again
+    assert IndexQueueItem.objects.get(pgpid=2).claimed is None
+    assert IndexQueueItem.dequeue([]) == 0
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.models.Document.index_partial")
+def test_queue_partial_update_setting(mock_index_partial, settings, document):
+    settings.SOLR_INDEX_QUEUE = True
+    DocumentSignalHandlers.queue_partial_update([document.pk], ["status_s"])
+    # queued for a full reindex instead of sent directly
+    mock_index_partial.assert_not_called()
+    assert IndexQueueItem.objects.filter(pgpid=document.pk).exists()
+
+
+@pytest.mark.django_db
+def test_claim_and_release():
+    IndexQueueItem.enqueue([1, 2, 3])
+    IndexQueueItem.objects.filter(pgpid=3).update(
+        queued=timezone.now() - timedelta(minutes=5)
+    )
+    # oldest items are claimed first
+    items = IndexQueueItem.claim(2)
+    assert len(items) == 2
+    assert items[0].pgpid == 3
+    assert IndexQueueItem.objects.filter(claimed__isnull=False).count() == 2
+    # claimed items are not claimed again by another worker
+    assert len(IndexQueueItem.claim(10)) == 1
+    assert IndexQueueItem.claim(10) == []
+    # unless the claim has expired
+    IndexQueueItem.objects.filter(pgpid=3).update(
+        claimed=timezone.now() - timedelta(seconds=IndexQueueItem.claim_timeout + 1)
+    )
+    assert [item.pgpid for item in IndexQueueItem.claim(10)] == [3]
+    # released items can be claimed again
+    IndexQueueItem.release(items)
+    assert len(IndexQueueItem.claim(10)) == 2
+
+
+@pytest.mark.django_db(transaction=True)
+@patch(
+    "geniza.corpus.management.commands.index_worker.Document.index_transcription_lines"
+)
+@patch("geniza.corpus.management.commands.index_worker.Document.send_index_data")
+def test_index_worker_requeued(mock_send_index_data, mock_index_lines, document):
+    IndexQueueItem.enqueue([document.pk])
+    mock_index_lines.return_value = True
+
+    def enqueue():
+        try:
+            IndexQueueItem.enqueue([document.pk])
+        finally:
+            connection.close()
+
+    def send_index_data(index_data):
+        # document is changed again while the first batch is being indexed,
+        # from another request with its own database connection
+        if mock_send_index_data.call_count == 1:
+            thread = threading.Thread(target=enqueue)
+            thread.start()
+            thread.join(timeout=10)
+            # queueing is not blocked by the batch being indexed
+            assert not thread.is_alive()
+            item = IndexQueueItem.objects.get(pgpid=document.pk)
+            assert item.version == 2
+        return True
+
+    mock_send_index_data.side_effect = send_index_data
+    call_command("index_worker", once=True, batch_size=1, stdout=StringIO())
+    # requeued item is indexed again in the next batch, then removed
+    assert mock_send_index_data.call_count == 2
+    assert not IndexQueueItem.objects.exists()
+
+
+@pytest.mark.django_db
+@patch(
+    "geniza.corpus.management.commands.index_worker.Document.index_transcription_lines"
+)
+@patch("geniza.corpus.management.commands.index_worker.Document.send_index_data")
+def test_index_worker_once(mock_send_index_data, mock_index_lines, document, join):
+    IndexQueueItem.enqueue([document.pk, join.pk, 0])
+    mock_send_index_data.return_value = True
+    mock_index_lines.return_value = True
+    stdout = StringIO()
+    call_command("index_worker", once=True, batch_size=10, stdout=stdout)
+    assert mock_send_index_data.call_count == 1
+    indexed_ids = set(doc["id"] for doc in mock_send_index_data.call_args[0][0])
+    # nonexistent document is skipped, but still removed from the queue
+    assert indexed_ids == {document.index_id(), join.index_id()}
+    assert set(doc.pk for doc in mock_index_lines.call_args[0][0]) == {
+        document.pk,
+        join.pk,
+    }
+    assert not IndexQueueItem.objects.exists()
+    assert "Indexed 2 documents; 0 queued" in stdout.getvalue()
+
+    # empty queue: nothing to index
+    mock_send_index_data.reset_mock()
+    call_command("index_worker", once=True, stdout=StringIO())
+    mock_send_index_data.assert_not_called()
+
+
+@pytest.mark.django_db
+@patch(
+    "geniza.corpus.management.commands.index_worker.Document.index_transcription_lines"
+)
+@patch("geniza.corpus.management.commands.index_worker.Document.send_index_data")
+def test_index_worker_solr_error(mock_send_index_data, mock_index_lines, document):
+    IndexQueueItem.enqueue([document.pk])
+    # solr reports an error for the documents or for transcription lines
+    for documents_ok in [False, True]:
+        mock_send_index_data.return_value = documents_ok
+        mock_index_lines.return_value = False
+        stderr = StringIO()
+        call_command("index_worker", once=True, stdout=StringIO(), stderr=stderr)
+        assert "Error indexing 1 document; left in the queue" in stderr.getvalue()
+        # item is left in the queue and released to retry
+        item = IndexQueueItem.objects.get(pgpid=document.pk)
+        assert item.claimed is None
+
+
+@pytest.mark.django_db
+@patch("geniza.corpus.management.commands.index_worker.Document.send_index_data")
+def test_index_worker_error(mock_send_index_data, document):
+    IndexQueueItem.enqueue([document.pk])
+    mock_send_index_data.side_effect = requests.exceptions.ConnectionError
+    with pytest.raises(CommandError):
+        call_command("index_worker", once=True, stdout=StringIO())
+    # item is left in the queue and released to retry
+    assert IndexQueueItem.objects.get(pgpid=document.pk).claimed is None
+
+
+@pytest.mark.django_db
+def test_index_worker_status():
+    IndexQueueItem.enqueue([1, 2])
+    stdout = StringIO()
+    call_command("index_worker", status=True, stdout=stdout)
+    assert "2 documents queued, lag" in stdout.getvalue()
@@ -1,6 +1,6 @@
 from operator import contains
 
-from geniza.corpus.ja import arabic_or_ja, arabic_to_ja, contains_arabic
+from geniza.corpus.ja import arabic_to_ja, contains_arabic
 
 
 def test_contains_arabic():
@@ -17,18 +17,6 @@ def test_arabic_to_ja():
     assert arabic_to_ja("طباخ") == "טבאךֹ"
     assert arabic_to_ja("") == ""
     assert arabic_to_ja("english text") == "english text"
-
-
-def test_arabic_or_ja__no_arabic():
-    txt = "my keyword search"
-    # should be unchanged
-    assert arabic_or_ja(txt) == txt
-
-
-def test_arabic_or_ja__arabic():
-    # single word — should return match for arabic or judaeo-arabic
-    assert arabic_or_ja("دينار") == "(دينار|דינאר)"
-    # multiple words — should return match for arabic or judaeo-arabic
-    assert arabic_or_ja("دينار مصحف") == "(دينار|דינאר) (مصحف|מצחף)"
-    # mixed english and arabic
-    assert arabic_or_ja("help مصحف") == "help (مصحف|מצחף)"
+    # multiple words, mixed with english
+    assert arabic_to_ja("دينار مصحف") == "דינאר מצחף"
+    assert arabic_to_ja("help مصحف") == "help מצחף"
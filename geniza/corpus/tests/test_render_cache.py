@@ -0,0 +1,68 @@
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+
+from geniza.corpus.render_cache import DocumentRenderCache, shared_cache
+
+
+def test_shared_cache():
+    # default local memory cache is not shared between processes
+    assert not shared_cache()
+    with override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache"}}
+    ):
+        assert shared_cache()
+
+
+@patch("geniza.corpus.render_cache.shared_cache", Mock(return_value=True))
+class TestDocumentRenderCache:
+    @override_settings(DOCUMENT_RENDER_CACHE_TIMEOUT=60)
+    def test_get_or_render(self):
+        cache.clear()
+        render_cache = DocumentRenderCache()
+        render = Mock(return_value="<p>rendered</p>")
+        document = Mock(pk=123, content_modified=timezone.now())
+        assert render_cache.get_or_render("detail", document, "en", render) == (
+            "<p>rendered</p>"
+        )
+        assert render_cache.get_or_render("detail", document, "en", render) == (
+            "<p>rendered</p>"
+        )
+        assert render.call_count == 1
+        # different language or block is cached separately
+        render_cache.get_or_render("detail", document, "he", render)
+        render_cache.get_or_render("scholarship", document, "en", render)
+        assert render.call_count == 3
+        assert render_cache.stats() == {"hits": 1, "misses": 3, "hit_ratio": 0.25}
+
+        # rendered again when document content is modified
+        document.content_modified += timedelta(seconds=1)
+        render_cache.get_or_render("detail", document, "en", render)
+        assert render.call_count == 4
+
+        render_cache.clear_stats()
+        assert render_cache.stats() == {"hits": 0, "misses": 0, "hit_ratio": 0}
+
+    def test_timeout_setting(self):
+        render_cache = DocumentRenderCache()
+        render = Mock(return_value="content")
+        document = Mock(pk=123, content_modified=timezone.now())
+        with override_settings(DOCUMENT_RENDER_CACHE_TIMEOUT=0):
+            assert render_cache.get_timeout() == 0
+            assert not render_cache.enabled()
+            # nothing is cached
+            render_cache.get_or_render("detail", document, "en", render)
+            render_cache.get_or_render("detail", document, "en", render)
+        assert render.call_count == 2
+        assert render_cache.stats()["misses"] == 0
+
+    @override_settings(DOCUMENT_RENDER_CACHE_TIMEOUT=60)
+    def test_not_shared(self):
+        render_cache = DocumentRenderCache()
+        assert render_cache.enabled()
+        # not used with a cache that is local to each process
+        with patch("geniza.corpus.render_cache.shared_cache", return_value=False):
+            assert not render_cache.enabled()
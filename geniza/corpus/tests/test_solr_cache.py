@@ -0,0 +1,112 @@
+from unittest.mock import Mock, patch
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from geniza.corpus.solr_cache import (
+    INDEX_CHANGED_CACHE_KEY,
+    SearchResultCache,
+    index_changed,
+    index_version,
+    mark_index_changed,
+)
+
+
+@patch("geniza.corpus.solr_cache.SolrClient")
+def test_index_version(mock_solrclient):
+    cache.clear()
+    mock_solr = mock_solrclient.return_value
+    mock_solr.make_request.return_value.index.version = 1234
+    with override_settings(SOLR_INDEX_VERSION_TIMEOUT=30):
+        assert index_version() == 1234
+        mock_solr.make_request.assert_called_with(
+            "get",
+            mock_solr.build_url.return_value,
+            params={"show": "index", "numTerms": 0},
+        )
+        mock_solr.build_url.assert_called_with(
+            mock_solr.solr_url, mock_solr.collection, "admin/luke"
+        )
+        # cached; solr is not queried again
+        mock_solr.make_request.return_value.index.version = 1235
+        assert index_version() == 1234
+        assert mock_solr.make_request.call_count == 1
+
+
+@patch("geniza.corpus.solr_cache.shared_cache", Mock(return_value=True))
+@patch("geniza.corpus.solr_cache.time")
+def test_index_changed(mock_time, settings):
+    cache.clear()
+    settings.SOLR_CONNECTIONS = {"default": {"COMMITWITHIN": 1000}}
+    mock_time.time.return_value = 100.0
+    # nothing recorded yet: current time is recorded
+    assert index_changed() is None
+    assert cache.get(INDEX_CHANGED_CACHE_KEY) == 100.0
+    mock_time.time.return_value = 102.0
+    assert index_changed() == 100.0
+    # recorded by the indexer
+    mark_index_changed()
+    assert cache.get(INDEX_CHANGED_CACHE_KEY) == 102.0
+    # not returned until changes are committed
+    mock_time.time.return_value = 102.5
+    assert index_changed() is None
+    mock_time.time.return_value = 103.0
+    assert index_changed() == 102.0
+    # not used when the cache is not shared between processes
+    with patch("geniza.corpus.solr_cache.shared_cache", return_value=False):
+        assert index_changed() is None
+
+
+@patch("geniza.corpus.solr_cache.SolrClient")
+def test_index_version_error(mock_solrclient):
+    cache.clear()
+    mock_solrclient.return_value.make_request.return_value = None
+    assert index_version() is None
+    # error is not cached; checks solr again
+    mock_solrclient.return_value.make_request.return_value = Mock(
+        index=Mock(version=1234)
+    )
+    assert index_version() == 1234
+
+
+class TestSearchResultCache:
+    def test_get_set(self):
+        result_cache = SearchResultCache(max_size=5)
+        assert result_cache.get("a") is None
+        result_cache.set("a", {"documents": []})
+        assert result_cache.get("a") == {"documents": []}
+        assert result_cache.stats() == {
+            "hits": 1,
+            "misses": 1,
+            "hit_ratio": 0.5,
+            "size": 1,
+            "max_size": 5,
+        }
+
+    def test_lru_eviction(self):
+        result_cache = SearchResultCache(max_size=2)
+        result_cache.set("a", 1)
+        result_cache.set("b", 2)
+        # use a, so b is least recently used
+        result_cache.get("a")
+        result_cache.set("c", 3)
+        assert result_cache.get("b") is None
+        assert result_cache.get("a") == 1
+        assert result_cache.get("c") == 3
+        assert result_cache.stats()["size"] == 2
+
+    def test_max_size_setting(self):
+        result_cache = SearchResultCache()
+        with override_settings(SEARCH_RESULT_CACHE_SIZE=0):
+            assert result_cache.get_max_size() == 0
+            # nothing is cached
+            result_cache.set("a", 1)
+            assert result_cache.get("a") is None
+
+    def test_clear(self):
+        result_cache = SearchResultCache()
+        result_cache.set("a", 1)
+        result_cache.get("a")
+        result_cache.clear()
+        assert result_cache.stats()["size"] == 0
+        assert result_cache.stats()["hits"] == 0
@@ -1,45 +1,50 @@
+import hashlib
+import json
+import time
 from ast import literal_eval
-from random import randint
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.core.paginator import InvalidPage
 from django.db.models.query import Prefetch
-from django.http import Http404, HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.http.response import HttpResponsePermanentRedirect, HttpResponseRedirect
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
 from django.utils.html import strip_tags
+from django.utils.http import quote_etag
 from django.utils.safestring import mark_safe
 from django.utils.text import Truncator, slugify
+from django.utils.translation import get_language
 from django.utils.translation import gettext as _
 from django.utils.translation import ngettext
-from django.views.generic import DetailView, FormView, ListView
+from django.views.decorators.gzip import gzip_page
+from django.views.generic import DetailView, FormView, ListView, View
 from django.views.generic.edit import FormMixin
 from parasolr.django.views import SolrLastModifiedMixin
-from piffle.presentation import IIIFPresentation
+from parasolr.utils import solr_timestamp_to_datetime
 from tabular_export.admin import export_to_csv_response
 
+from geniza import __version__
 from geniza.common.utils import absolutize_url
 from geniza.corpus import iiif_utils
 from geniza.corpus.forms import DocumentMergeForm, DocumentSearchForm
 from geniza.corpus.models import Document, TextBlock
-from geniza.corpus.solr_queryset import DocumentSolrQuerySet
+from geniza.corpus.solr_cache import index_changed, index_version, search_result_cache
+from geniza.corpus.solr_queryset import DocumentSolrQuerySet, highlight_search_terms
 from geniza.corpus.templatetags import corpus_extras
 from geniza.footnotes.models import Footnote
 
 
-class DocumentSearchView(ListView, FormMixin, SolrLastModifiedMixin):
-    model = Document
+class DocumentSearchMixin(FormMixin):
+    """View mixin to search documents in Solr based on
+    :class:`~geniza.corpus.forms.DocumentSearchForm` parameters."""
+
     form_class = DocumentSearchForm
-    context_object_name = "documents"
-    template_name = "corpus/document_list.html"
-    # Translators: title of document search page
-    page_title = _("Search Documents")
-    # Translators: description of document search page, for search engines
-    page_description = _("Search and browse Geniza documents.")
-    paginate_by = 50
     initial = {"sort": "random"}
-    # NOTE: does not filter on status, since changing status could modify the page
-    solr_lastmodified_filters = {"item_type_s": "document"}
 
     # map form sort to solr sort field
     solr_sort = {
@@ -53,57 +58,26 @@ class DocumentSearchView(ListView, FormMixin, SolrLastModifiedMixin):
         "docdate_desc": "-end_date_i",
     }
 
-    def dispatch(self, request, *args, **kwargs):
-        # special case: for random sort we only show the first page of results
-        # if any other page is requested, redirect to first page
-        if request.GET.get("sort") == "random" and request.GET.get("page", "") > "1":
-            queryargs = request.GET.copy()
-            del queryargs["page"]
-            return HttpResponseRedirect(
-                "?".join([reverse("corpus:document-search"), queryargs.urlencode()])
-            )
-        return super().dispatch(request, *args, **kwargs)
-
-    def last_modified(self):
-        """override last modified from solr mixin to not return a value when
-        sorting by random"""
-        if self.request.GET.get("sort") in [None, "random"]:
-            return None
-        return super().last_modified()
+    @cached_property
+    def random_seed(self):
+        """Current seed for random sort, used when no seed is specified in
+        the request. Changes every **RANDOM_SORT_SEED_INTERVAL** seconds
+        (default one hour), so that random results are the same for all
+        requests in that period and can be paged and cached."""
+        interval = getattr(settings, "RANDOM_SORT_SEED_INTERVAL", 3600)
+        return int(time.time() // interval)
 
-    def get_solr_sort(self, sort_option):
+    def get_solr_sort(self, sort_option, seed=None):
         """Return solr sort field for user-seleted sort option;
-        generates random sort field using solr random dynamic field;
+        generates random sort field using solr random dynamic field
+        and the specified seed or current :attr:`random_seed`;
         otherwise uses solr sort field from :attr:`solr_sort`"""
         if sort_option == "random":
-            # use solr's random dynamic field to sort randomly
-            return "random_%s" % randint(1000, 9999)
+            # use solr's random dynamic field to sort randomly;
+            # the same seed gives the same order until the index changes
+            return "random_%s" % (self.random_seed if seed is None else seed)
         return self.solr_sort[sort_option]
 
-    # NOTE: should cache this, shouldn't really change that frequently
-    def get_range_stats(self):
-        """Return the min and max for range fields based on Solr stats.
-
-        :returns: Dictionary keyed on form field name with a tuple of
-            (min, max) as integers. If stats are not returned from the field,
-            the key is not added to a dictionary.
-        :rtype: dict
-        """
-        stats = DocumentSolrQuerySet().stats("start_date_i", "end_date_i").get_stats()
-        if stats.get("stats_fields"):
-            # use minimum from start date and max from end date
-            # - we're storing YYYYMMDD as 8-digit number for this we only want year
-            # convert to str, take first 4 digits, then convert back to int
-            min_val = stats["stats_fields"]["start_date_i"]["min"]
-            max_val = stats["stats_fields"]["end_date_i"]["max"]
-
-            # trim from the end to handle 3-digit years; includes .0 at end
-            min_year = int(str(min_val)[:-6]) if min_val else None
-            max_year = int(str(max_val)[:-6]) if max_val else None
-            return {"docdate": (min_year, max_year)}
-
-        return {}
-
     def get_form_kwargs(self):
         """get form arguments from request and configured defaults"""
         kwargs = super().get_form_kwargs()
@@ -126,11 +100,156 @@ class DocumentSearchView(ListView, FormMixin, SolrLastModifiedMixin):
             form_data["sort"] = self.initial["sort"]
 
         kwargs["data"] = form_data
-        # get min/max configuration for document date range field
-        kwargs["range_minmax"] = self.get_range_stats()
 
         return kwargs
 
+    def search_documents(self, documents, search_opts):
+        """Apply keyword search, sort, and filters from cleaned search form
+        data to a :class:`~geniza.corpus.solr_queryset.DocumentSolrQuerySet`."""
+        if search_opts["q"]:
+            # include relevance score in results
+            documents = documents.keyword_search(search_opts["q"]).also("score")
+
+        # order by sort option
+        documents = documents.order_by(
+            self.get_solr_sort(search_opts["sort"], search_opts.get("seed"))
+        )
+
+        # filter by type if specified
+        if search_opts["doctype"]:
+            typelist = literal_eval(search_opts["doctype"])
+            quoted_typelist = ['"%s"' % doctype for doctype in typelist]
+            documents = documents.filter(type__in=quoted_typelist, tag="type")
+
+        # image filter
+        if search_opts["has_image"] == True:
+            documents = documents.filter(has_image=True)
+
+        # scholarship filters
+        if search_opts["has_transcription"] == True:
+            documents = documents.filter(has_digital_edition=True)
+        if search_opts["has_discussion"] == True:
+            documents = documents.filter(has_discussion=True)
+        if search_opts["has_translation"] == True:
+            documents = documents.filter(has_translation=True)
+        if search_opts["docdate"]:
+            # date range filter; returns tuple of value or None for open-ended range
+            start, end = search_opts["docdate"]
+            documents = documents.filter(
+                document_date_dr="[%s TO %s]" % (start or "*", end or "*")
+            )
+
+        return documents
+
+
+class DocumentSearchView(ListView, DocumentSearchMixin, SolrLastModifiedMixin):
+    model = Document
+    context_object_name = "documents"
+    template_name = "corpus/document_list.html"
+    # Translators: title of document search page
+    page_title = _("Search Documents")
+    # Translators: description of document search page, for search engines
+    page_description = _("Search and browse Geniza documents.")
+    paginate_by = 50
+    # NOTE: does not filter on status, since changing status could modify the page
+    solr_lastmodified_filters = {"item_type_s": "document"}
+
+    def dispatch(self, request, *args, **kwargs):
+        # special case: random sort is only consistent across pages with the
+        # same seed; if any other page is requested without a seed,
+        # redirect to the same page with the current seed
+        if (
+            request.GET.get("sort") in [None, "", "random"]
+            and self.is_later_page(request.GET.get(self.page_kwarg))
+            and not request.GET.get("seed")
+        ):
+            form = self.get_form()
+            if form.is_valid() and form.cleaned_data["sort"] == "random":
+                queryargs = request.GET.copy()
+                queryargs["seed"] = self.random_seed
+                return HttpResponseRedirect(
+                    "?".join([reverse("corpus:document-search"), queryargs.urlencode()])
+                )
+        return super().dispatch(request, *args, **kwargs)
+
+    @staticmethod
+    def is_later_page(page):
+        """Check if a requested page number is a page after the first,
+        including the "last" page supported by Django pagination."""
+        if page == "last":
+            return True
+        try:
+            return int(page) > 1
+        except (TypeError, ValueError):
+            return False
+
+    def last_modified(self):
+        """override last modified from solr mixin to not return a value when
+        sorting by random without a seed, since results change when the
+        seed changes; uses last modified from the search response
+        when available, to avoid a separate request to Solr"""
+        if self.request.GET.get("sort") in [None, "random"] and not (
+            self.request.GET.get("seed")
+        ):
+            return None
+        search_results = getattr(self, "search_results", None)
+        if search_results is not None:
+            return search_results["last_modified"]
+        return super().last_modified()
+
+    #: JSON Facet API request for date range and last modified across all
+    #: documents, independent of search terms and filters, so they can be
+    #: retrieved in the same Solr request as search results
+    all_documents_facet = {
+        "all_documents": {
+            "type": "query",
+            "q": "*:*",
+            # NOTE: does not filter on status, to match last modified filters
+            "domain": {"query": "item_type_s:document"},
+            "facet": {
+                "start_date_min": "min(start_date_i)",
+                "end_date_max": "max(end_date_i)",
+                "last_modified": {
+                    "type": "terms",
+                    "field": "last_modified",
+                    "sort": "index desc",
+                    "limit": 1,
+                },
+            },
+        }
+    }
+
+    def get_range_stats(self, json_facets):
+        """Return the min and max for range fields based on
+        :attr:`all_documents_facet` results.
+
+        :returns: Dictionary keyed on form field name with a tuple of
+            (min, max) as integers. If stats are not returned from the field,
+            the key is not added to a dictionary.
+        :rtype: dict
+        """
+        all_documents = json_facets.get("all_documents")
+        if all_documents:
+            # use minimum from start date and max from end date
+            # - we're storing YYYYMMDD as 8-digit number for this we only want year
+            min_val = all_documents.get("start_date_min")
+            max_val = all_documents.get("end_date_max")
+            # integer division handles 3-digit years
+            min_year = int(min_val) // 10000 if min_val else None
+            max_year = int(max_val) // 10000 if max_val else None
+            return {"docdate": (min_year, max_year)}
+
+        return {}
+
+    def get_last_modified(self, json_facets):
+        """Return the most recent last modified date for all documents
+        based on :attr:`all_documents_facet` results, or None."""
+        buckets = (
+            json_facets.get("all_documents", {}).get("last_modified", {}).get("buckets")
+        )
+        if buckets:
+            return solr_timestamp_to_datetime(buckets[0]["val"])
+
     def get_queryset(self):
         """Perform requested search and return solr queryset"""
         # limit to documents with published status (i.e., no suppressed documents);
@@ -142,6 +261,9 @@ class DocumentSearchView(ListView, FormMixin, SolrLastModifiedMixin):
                 "has_image", "has_digital_edition", "has_translation", "has_discussion"
             )
             .facet_field("type", exclude="type", sort="value")
+            .raw_query_parameters(
+                **{"json.facet": json.dumps(self.all_documents_facet)}
+            )
         )
 
         form = self.get_form()
@@ -157,52 +279,19 @@ class DocumentSearchView(ListView, FormMixin, SolrLastModifiedMixin):
                 # NOTE: using requireFieldMatch so that field-specific search
                 # terms will NOT be usind for highlighting text matches
                 # (unless they are in the appropriate field)
-                documents = (
-                    documents.keyword_search(search_opts["q"])
-                    .highlight(
-                        "description",
-                        snippets=3,
-                        method="unified",
-                        requireFieldMatch=True,
-                    )
-                    # return smaller chunk of highlighted text for transcriptions
-                    # since the lines are often shorter, resulting in longer text
-                    .highlight(
-                        "transcription",
-                        method="unified",
-                        fragsize=150,  # try including more context
-                        requireFieldMatch=True,
-                    )
-                    .also("score")
-                )  # include relevance score in results
-
-            # order by sort option
-            documents = documents.order_by(self.get_solr_sort(search_opts["sort"]))
-
-            # filter by type if specified
-            if search_opts["doctype"]:
-                typelist = literal_eval(search_opts["doctype"])
-                quoted_typelist = ['"%s"' % doctype for doctype in typelist]
-                documents = documents.filter(type__in=quoted_typelist, tag="type")
-
-            # image filter
-            if search_opts["has_image"] == True:
-                documents = documents.filter(has_image=True)
-
-            # scholarship filters
-            if search_opts["has_transcription"] == True:
-                documents = documents.filter(has_digital_edition=True)
-            if search_opts["has_discussion"] == True:
-                documents = documents.filter(has_discussion=True)
-            if search_opts["has_translation"] == True:
-                documents = documents.filter(has_translation=True)
-            if search_opts["docdate"]:
-                # date range filter; returns tuple of value or None for open-ended range
-                start, end = search_opts["docdate"]
-                documents = documents.filter(
-                    document_date_dr="[%s TO %s]" % (start or "*", end or "*")
+                # (matching transcription lines are returned with each
+                # result instead; see get_transcription_highlights)
+                documents = documents.highlight(
+                    "description",
+                    snippets=3,
+                    method="unified",
+                    requireFieldMatch=True,
+                ).with_transcription_lines(
+                    search_opts["q"], self.transcription_lines_per_document
                 )
 
+            documents = self.search_documents(documents, search_opts)
+
         self.queryset = documents
 
         return documents
@@ -223,19 +312,219 @@ class DocumentSearchView(ListView, FormMixin, SolrLastModifiedMixin):
                 pass
         return paginate_by
 
+    def get_result_cache_key(self, page_size):
+        """Key for caching the current page of search results, based on
+        cleaned form data, page number and size, and the Solr index version.
+        Returns None if results should not be cached (i.e., invalid form,
+        or the index version could not be determined)."""
+        form = self.get_form()
+        version = index_version()
+        if not form.is_valid() or version is None:
+            return None
+        search_opts = dict(form.cleaned_data)
+        # normalize whitespace in keyword search
+        search_opts["q"] = " ".join(search_opts["q"].split())
+        # random results depend on the seed; ignore seed for other sorts
+        if search_opts["sort"] == "random":
+            if search_opts["seed"] is None:
+                search_opts["seed"] = self.random_seed
+        else:
+            search_opts["seed"] = None
+        cursor_mark = self.get_cursor_mark()
+        if cursor_mark:
+            page = (self.cursor_kwarg, cursor_mark)
+        else:
+            page = (
+                self.page_kwarg,
+                str(
+                    self.kwargs.get(self.page_kwarg)
+                    or self.request.GET.get(self.page_kwarg)
+                    or 1
+                ),
+            )
+        return (
+            tuple(sorted(search_opts.items())),
+            page,
+            page_size,
+            version,
+        )
+
+    #: request parameter for next page token (Solr cursor) paging
+    cursor_kwarg = "cursor"
+
+    def get_cursor_mark(self):
+        """Return the Solr cursor mark requested as a next page token, or
+        None when using numbered pages. Start cursor paging with ``*``.
+        Random sort does not support cursor paging; seeded random results
+        use numbered pages."""
+        cursor_mark = self.request.GET.get(self.cursor_kwarg)
+        if cursor_mark:
+            form = self.get_form()
+            if form.is_valid() and form.cleaned_data["sort"] != "random":
+                return cursor_mark
+
+    def paginate_queryset(self, queryset, page_size):
+        """Extend pagination to retrieve documents, total, highlighting,
+        facets, date range, and last modified for the current page from a
+        single Solr response, and cache them in
+        :attr:`~geniza.corpus.solr_cache.search_result_cache`. Only the
+        result data is cached; the paginator and page are rebuilt from it
+        for each request."""
+        cache_key = self.get_result_cache_key(page_size)
+        results = search_result_cache.get(cache_key) if cache_key else None
+        if results is None:
+            results = self.get_search_results(queryset, page_size)
+            if cache_key:
+                search_result_cache.set(cache_key, results)
+
+        self.search_results = results
+        paginator, page = self.get_results_page(results, page_size)
+        return (
+            paginator,
+            page,
+            results["documents"],
+            page is not None and page.has_other_pages(),
+        )
+
+    def get_results_page(self, results, page_size):
+        """Build a paginator and page for search results returned by
+        :meth:`get_search_results`, without a reference to the Solr
+        queryset. Page is None when paging by next page token."""
+        paginator = self.get_paginator(
+            results["documents"],
+            page_size,
+            orphans=self.get_paginate_orphans(),
+            allow_empty_first_page=self.get_allow_empty(),
+        )
+        # total from the search response rather than the document list
+        paginator.count = results["count"]
+        page = None
+        if results["page_number"] is not None:
+            page = paginator.page(results["page_number"])
+            # page object list is results for the page, not a slice
+            page.object_list = results["documents"]
+        return paginator, page
+
+    def get_search_results(self, queryset, page_size):
+        """Get the requested page of search results and everything else
+        needed to display it from one Solr request. Returns a dictionary
+        of plain result data (suitable for caching): total count, page
+        number, and the page's documents, highlighting, facets, range
+        stats, last modified date, and next page token. When paging by
+        next page token, there is no page number."""
+        page_number = (
+            self.kwargs.get(self.page_kwarg)
+            or self.request.GET.get(self.page_kwarg)
+            or 1
+        )
+        try:
+            start = (int(page_number) - 1) * page_size
+        except ValueError:
+            start = -1
+        next_page_token = None
+        cursor_mark = self.get_cursor_mark()
+        if cursor_mark:
+            paged_result = queryset.cursor(cursor_mark)[:page_size]
+            documents = paged_result.get_results()
+            count = paged_result.count()
+            next_page_token = paged_result.get_next_cursor_mark()
+            page_number = None
+        elif start >= 0:
+            # get the requested page first, so the paginator can use the
+            # total from the same response instead of a separate count query
+            paged_result = queryset[start : start + page_size]
+            documents = paged_result.get_results()
+            count = paged_result.count()
+            # check that the page exists before caching results for it
+            paginator = self.get_paginator(
+                documents,
+                page_size,
+                orphans=self.get_paginate_orphans(),
+                allow_empty_first_page=self.get_allow_empty(),
+            )
+            paginator.count = count
+            try:
+                page_number = paginator.validate_number(page_number)
+            except InvalidPage as err:
+                raise Http404(str(err))
+        else:
+            # use default pagination for "last" and invalid page numbers
+            paginator, page, paged_result, _ = super().paginate_queryset(
+                queryset, page_size
+            )
+            documents = paged_result.get_results()
+            count = paginator.count
+            page_number = page.number
+
+        json_facets = paged_result.get_json_facets()
+        highlighting = paged_result.get_highlighting() if documents else {}
+        for doc_id, highlights in self.get_transcription_highlights(documents).items():
+            highlighting.setdefault(doc_id, {}).update(highlights)
+        return {
+            "count": count,
+            "page_number": page_number,
+            "documents": documents,
+            "next_page_token": next_page_token,
+            # highlighting and facets are included in the same response
+            "highlighting": highlighting,
+            "facets": paged_result.get_facets(),
+            "range_stats": self.get_range_stats(json_facets),
+            "last_modified": self.get_last_modified(json_facets),
+        }
+
+    #: maximum number of matching transcription lines to show per document
+    transcription_lines_per_document = 3
+
+    def get_transcription_highlights(self, documents):
+        """Return the transcription lines that matched the keyword search
+        for a page of documents (see
+        :meth:`~geniza.corpus.solr_queryset.DocumentSolrQuerySet.with_transcription_lines`)
+        as transcription highlighting keyed on document id, with matching
+        words marked as in Solr highlighting."""
+        form = self.get_form()
+        if not documents or not form.is_valid() or not form.cleaned_data["q"]:
+            return {}
+        lines_field = DocumentSolrQuerySet.lines_field
+        return {
+            doc["id"]: {
+                "transcription": [
+                    "\n".join(
+                        highlight_search_terms(line["text"], form.cleaned_data["q"])
+                        for line in doc[lines_field]
+                    )
+                ]
+            }
+            for doc in documents
+            if doc.get(lines_field)
+        }
+
+    def get_seed(self):
+        """Seed for the current random sort: the seed in the request, or
+        the current :attr:`random_seed`. Included in the search form and
+        pagination links so that every page of results is in the same
+        random order. Returns None when not sorting by random."""
+        form = self.get_form()
+        if not form.is_valid() or form.cleaned_data["sort"] != "random":
+            return None
+        seed = form.cleaned_data["seed"]
+        return self.random_seed if seed is None else seed
+
     def get_context_data(self, **kwargs):
         """extend context data to add page metadata, highlighting,
         and update form with facets"""
         context_data = super().get_context_data(**kwargs)
 
-        paged_result = context_data["page_obj"].object_list
-        highlights = paged_result.get_highlighting() if paged_result.count() else {}
-        facet_dict = self.queryset.get_facets()
+        highlights = self.search_results["highlighting"]
+        facet_dict = self.search_results["facets"]
+        # set min/max configuration for document date range field
+        context_data["form"].set_range_minmax(self.search_results["range_stats"])
         # populate choices for facet filter fields on the form
         context_data["form"].set_choices_from_facets(facet_dict.facet_fields)
         context_data.update(
             {
+                "seed": self.get_seed(),
                 "highlighting": highlights,
+                "next_page_token": self.search_results["next_page_token"],
                 "page_description": self.page_description,
                 "page_title": self.page_title,
                 "page_type": "search",
@@ -247,11 +536,205 @@ class DocumentSearchView(ListView, FormMixin, SolrLastModifiedMixin):
         return context_data
 
 
+@method_decorator(gzip_page, name="dispatch")
+class DocumentSearchAPIView(DocumentSearchMixin, View):
+    """JSON API for document search. Accepts the same parameters as
+    :class:`DocumentSearchView`, plus ``fields``, a comma-separated list of
+    field names from :attr:`public_fields`. Streams all matching documents,
+    retrieved from Solr in chunks with cursor paging. Random sort is not
+    supported; results are sorted by PGPID instead."""
+
+    #: number of documents to request from Solr at a time
+    chunk_size = 1000
+
+    #: fields that may be requested, in default output order; a subset of
+    #: :attr:`DocumentSolrQuerySet.field_aliases
+    #: <geniza.corpus.solr_queryset.DocumentSolrQuerySet.field_aliases>`
+    #: that excludes internal fields such as notes and review flags
+    public_fields = [
+        "pgpid",
+        "old_pgpids",
+        "type",
+        "shelfmark",
+        "collection",
+        "document_date",
+        "description",
+        "tags",
+        "language_code",
+        "input_year",
+        "input_date",
+        "num_editions",
+        "num_translations",
+        "num_discussions",
+        "scholarship_count",
+        "has_image",
+        "has_digital_edition",
+        "has_translation",
+        "has_discussion",
+        "iiif_images",
+        "iiif_labels",
+    ]
+
+    def get_solr_sort(self, sort_option, seed=None):
+        """Extend to sort by PGPID instead of randomly, since random sort
+        cannot be used with cursor paging."""
+        if sort_option == "random":
+            return "pgpid_i"
+        return super().get_solr_sort(sort_option, seed)
+
+    def get_fields(self):
+        """Return the list of requested fields; defaults to all public
+        fields. Raises :class:`ValueError` for unknown or non-public
+        field names."""
+        fields = [
+            field.strip()
+            for field in self.request.GET.get("fields", "").split(",")
+            if field.strip()
+        ]
+        unknown_fields = set(fields) - set(self.public_fields)
+        if unknown_fields:
+            raise ValueError("Unknown fields: %s" % ", ".join(sorted(unknown_fields)))
+        return fields or list(self.public_fields)
+
+    def get_etag(self):
+        """Generate an ETag from the request parameters and the Solr index
+        version, so that clients can check for changes without a search.
+        Returns None if the index version could not be determined."""
+        version = index_version()
+        if version is None:
+            return None
+        params = sorted(self.request.GET.lists())
+        return hashlib.sha1(json.dumps([params, version]).encode()).hexdigest()
+
+    def get(self, request, *args, **kwargs):
+        form = self.get_form()
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors.get_json_data()}, status=400)
+        try:
+            fields = self.get_fields()
+        except ValueError as err:
+            return JsonResponse(
+                {"errors": {"fields": [{"message": str(err), "code": "invalid"}]}},
+                status=400,
+            )
+
+        etag = self.get_etag()
+        if etag:
+            etag = quote_etag(etag)
+            # return not modified without searching if client has current results
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                return response
+
+        documents = self.search_documents(
+            DocumentSolrQuerySet().filter(status=Document.PUBLIC_LABEL),
+            form.cleaned_data,
+        ).only(*fields)
+        response = StreamingHttpResponse(
+            self.stream_results(documents, fields), content_type="application/json"
+        )
+        if etag:
+            response["ETag"] = etag
+        return response
+
+    def stream_results(self, documents, fields):
+        """Generator for JSON output with the total number of results and
+        a list of documents, retrieved from Solr in chunks with cursor
+        paging, so that memory use is the same for any number of results."""
+        cursor_mark = "*"
+        separator = ""
+        while cursor_mark:
+            chunk = documents.cursor(cursor_mark)[: self.chunk_size]
+            results = chunk.get_results()
+            if not separator:
+                yield '{"count": %d, "documents": [' % chunk.count()
+            for doc in results:
+                yield separator + json.dumps(self.api_result(doc, fields))
+                separator = ","
+            # skip request for an empty page after a partial chunk
+            cursor_mark = (
+                chunk.get_next_cursor_mark()
+                if len(results) == self.chunk_size
+                else None
+            )
+        yield "]}"
+
+    def api_result(self, doc, fields):
+        """Convert a search result document for JSON output, with only
+        the requested fields."""
+        doc = {field: doc[field] for field in fields if field in doc}
+        if "iiif_images" in doc:
+            # convert image clients and labels back to IIIF image ids
+            doc["iiif_images"] = [
+                "%s/%s" % (image.api_endpoint, image.image_id)
+                for image, _label in doc["iiif_images"]
+            ]
+        return doc
+
+
 class DocumentDetailBase(SolrLastModifiedMixin):
-    """View mixin to handle lastmodified and redirects for documents with old PGPIDs.
-    Overrides get request in the case of a 404, looking for any records
-    with passed PGPID in old_pgpids, and if found, redirects to that document
-    with current PGPID."""
+    """View mixin to handle lastmodified, etags, and redirects for documents
+    with old PGPIDs. Overrides get request in the case of a 404, looking for
+    any records with passed PGPID in old_pgpids, and if found, redirects to
+    that document with current PGPID."""
+
+    def get_etag_data(self, content_modified):
+        """Values that determine the content of this page, for
+        :meth:`get_etag`: the path, language, and current user, the time
+        the document or related records shown on its pages were last
+        changed (see :attr:`~geniza.corpus.models.Document.content_modified`),
+        the application version, and, for content such as related documents
+        that comes from Solr, the time documents were last indexed (see
+        :func:`~geniza.corpus.solr_cache.index_changed`). Returns None if
+        the index time can't be determined."""
+        changed = index_changed()
+        if changed is None:
+            return None
+        return [
+            self.request.path,
+            get_language(),
+            # pages may differ for logged in users
+            self.request.user.pk,
+            content_modified.isoformat(),
+            changed,
+            __version__,
+        ]
+
+    def get_etag(self):
+        """Generate a strong ETag for this page from
+        :meth:`get_etag_data`, using only values that are stored in the
+        database or the shared cache, so that Solr is never queried.
+        Returns None if there is no public document with the requested
+        PGPID, or the page content can't be versioned."""
+        content_modified = (
+            Document.objects.filter(pk=self.kwargs["pk"], status=Document.PUBLIC)
+            .values_list("content_modified", flat=True)
+            .first()
+        )
+        if content_modified is None:
+            return None
+        etag_data = self.get_etag_data(content_modified)
+        if etag_data is None:
+            return None
+        return hashlib.sha1(json.dumps(etag_data).encode()).hexdigest()
+
+    def dispatch(self, request, *args, **kwargs):
+        """Return not modified without loading the document or querying
+        Solr if the client has the current version of the page;
+        otherwise add an ETag to the response."""
+        etag = None
+        if request.method in ("GET", "HEAD"):
+            etag = self.get_etag()
+        if etag:
+            etag = quote_etag(etag)
+            response = get_conditional_response(request, etag=etag)
+            if response is not None:
+                return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        if etag and response.status_code == 200:
+            response["ETag"] = etag
+        return response
 
     def get(self, request, *args, **kwargs):
         """extend GET to check for old pgpid and redirect on 404"""
@@ -291,9 +774,17 @@ class DocumentDetailView(DocumentDetailBase, DetailView):
         return Truncator(self.get_object().description).words(20)
 
     def get_queryset(self, *args, **kwargs):
-        """Don't show document if it isn't public"""
-        queryset = super().get_queryset(*args, **kwargs)
-        return queryset.filter(status=Document.PUBLIC)
+        """Don't show document if it isn't public; prefetch everything
+        needed for display"""
+        return Document.detail_queryset().filter(status=Document.PUBLIC)
+
+    def get_object(self, queryset=None):
+        """Load the document once per request; page metadata and
+        templates use the same prefetched instance."""
+        if queryset is None and getattr(self, "object", None) is not None:
+            return self.object
+        self.object = super().get_object(queryset)
+        return self.object
 
     def get_context_data(self, **kwargs):
         """extend context data to add page metadata"""
@@ -327,7 +818,7 @@ class DocumentScholarshipView(DocumentDetailView):
 
     def page_description(self):
         doc = self.get_object()
-        count = doc.footnotes.count()
+        count = len(doc.footnotes.all())
         # Translators: description of document scholarship page, for search engines
         return ngettext(
             "%(count)d scholarship record",
@@ -339,11 +830,10 @@ class DocumentScholarshipView(DocumentDetailView):
 
     def get_queryset(self, *args, **kwargs):
         """Prefetch footnotes, and don't show the page if there are none."""
-        # prefetch footnotes since we'll render all of them in the template
+        # footnotes are prefetched, since we'll render all of them in the template
         queryset = (
             super()
             .get_queryset(*args, **kwargs)
-            .prefetch_related("footnotes")
             .distinct()  # prevent MultipleObjectsReturned if many footnotes
         )
 
@@ -401,8 +891,10 @@ class DocumentTranscriptionText(DocumentDetailView):
     def get(self, request, *args, **kwargs):
         document = self.get_object()
         try:
-            edition = document.digital_editions().get(
-                pk=self.kwargs["transcription_pk"]
+            edition = next(
+                ed
+                for ed in document.digital_editions()
+                if ed.pk == self.kwargs["transcription_pk"]
             )
             shelfmark = slugify(document.textblock_set.first().fragment.shelfmark)
             authors = [slugify(a.last_name) for a in edition.source.authors.all()]
@@ -416,7 +908,7 @@ class DocumentTranscriptionText(DocumentDetailView):
                     "Content-Disposition": 'attachment; filename="%s"' % filename,
                 },
             )
-        except (Footnote.DoesNotExist, KeyError):
+        except (StopIteration, KeyError):
             # if there is no footnote, or no plain text content, return 404
             raise Http404
 
@@ -428,13 +920,23 @@ class DocumentManifestView(DocumentDetailView):
 
     viewname = "corpus:document-manifest"
 
+    def get_etag_data(self, content_modified):
+        """Manifests are generated from the database and IIIF manifests,
+        not Solr; version by content modified time, language, and
+        application version only."""
+        return [
+            self.request.path,
+            get_language(),
+            content_modified.isoformat(),
+            __version__,
+        ]
+
     def get(self, request, *args, **kwargs):
         document = self.get_object()
         # should 404 if no images or no transcription
         if not document.has_transcription() and not document.has_image():
             raise Http404
 
-        iiif_urls = document.iiif_urls()
         local_manifest_id = self.get_absolute_url()
         first_canvas = None
 
@@ -448,9 +950,9 @@ class DocumentManifestView(DocumentDetailView):
         canvases = []
         # keep track of unique attributions so we can include them all
         attributions = set()
-        for url in iiif_urls:
-            # NOTE: If this url fails, may raise IIIFException
-            remote_manifest = IIIFPresentation.from_url(url)
+        # use manifests built from locally cached data where possible;
+        # remote manifests are only loaded for fragments not yet cached
+        for remote_manifest in document.iiif_manifests():
             # CUDL attribution has some variation in tags;
             # would be nice to preserve tagged version,
             # for now, ignore tags so we can easily de-dupe
@@ -464,7 +966,6 @@ class DocumentManifestView(DocumentDetailView):
                 local_canvas = dict(canvas)
                 if first_canvas is None:
                     first_canvas = local_canvas
-                # TODO: can we build this from djiffy canvas?
 
                 # adding provenance per recommendation from folks on IIIf Slack
                 # to track original source of this canvas
@@ -518,6 +1019,17 @@ class DocumentAnnotationListView(DocumentDetailView):
 
     viewname = "corpus:document-annotations"
 
+    def get_etag_data(self, content_modified):
+        """Annotation lists are generated from the database, not Solr;
+        version by content modified time, language, and application
+        version only."""
+        return [
+            self.request.path,
+            get_language(),
+            content_modified.isoformat(),
+            __version__,
+        ]
+
     def get(self, request, *args, **kwargs):
         """handle GET request: construct and return JSON annotation list"""
         document = self.get_object()
@@ -534,27 +1046,19 @@ class DocumentAnnotationListView(DocumentDetailView):
         # create outer annotation list structure
         annotation_list = iiif_utils.new_annotation_list()
         annotation_list.id = annotation_list_id
-        # for now, annotate the first canvas
-        # get a list of djiffy manifests
-        manifests = [
-            b.fragment.manifest
-            for b in document.textblock_set.all()
-            if b.fragment.iiif_url
-        ]
-        canvas = None
-        if manifests and manifests[0]:
-            canvas = manifests[0].canvases.first()
-        # fallback to loading the remote manifest; (is this needed?)
-
-        if not canvas:
-            iiif_urls = document.iiif_urls()
-            if iiif_urls:
-                # NOTE: If this url fails, may raise IIIFException
-                manifest = IIIFPresentation.from_url(iiif_urls[0])
-                canvas = manifest.sequences[0].canvases[0]
-            else:
-                # if there are no images available, use an empty canvas
-                canvas = iiif_utils.empty_iiif_canvas()
+        # for now, annotate the first canvas of the first available manifest,
+        # using locally cached data where possible
+        canvas = next(
+            (
+                manifest.sequences[0].canvases[0]
+                for manifest in document.iiif_manifests()
+                if manifest.sequences[0].canvases
+            ),
+            None,
+        )
+        if canvas is None:
+            # if there are no images available, use an empty canvas
+            canvas = iiif_utils.empty_iiif_canvas()
 
         resources = []
         digital_editions = document.digital_editions()
@@ -1,3 +1,5 @@
+import re
+
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.humanize.templatetags.humanize import ordinal
@@ -156,10 +158,11 @@ class Source(models.Model):
         specify `extra_fields=False`."""
 
         author = ""
-        if self.authorship_set.exists():
-            author_lastnames = [
-                a.creator.firstname_lastname() for a in self.authorship_set.all()
-            ]
+        # check authors and languages with all() rather than exists/count,
+        # so that prefetched data is used when available
+        authorships = self.authorship_set.all()
+        if authorships:
+            author_lastnames = [a.creator.firstname_lastname() for a in authorships]
             # combine the last pair with and; combine all others with comma
             # thanks to https://stackoverflow.com/a/30084022
             if len(author_lastnames) > 1:
@@ -173,7 +176,8 @@ class Source(models.Model):
 
         # Ensure that Unicode LTR mark is added after fields when RTL languages present
         rtl_langs = ["Hebrew", "Arabic", "Judaeo-Arabic"]
-        source_langs = [str(lang) for lang in self.languages.all()]
+        languages = self.languages.all()
+        source_langs = [str(lang) for lang in languages]
         source_contains_rtl = set(source_langs).intersection(set(rtl_langs))
         ltr_mark = chr(8206) if source_contains_rtl else ""
 
@@ -215,8 +219,8 @@ class Source(models.Model):
 
         # Add non-English languages as parenthetical
         non_english_langs = 0
-        if self.languages.count():
-            for lang in self.languages.all():
+        if languages:
+            for lang in languages:
                 if "English" not in str(lang):
                     non_english_langs += 1
                     parts.append("(in %s)" % lang)
@@ -482,6 +486,22 @@ class Footnote(TrackChangesModel):
         if self.content:
             return self.content.get("text")
 
+    # regex to find lines and optional line numbers in html content
+    re_html_line = re.compile(r"<li(?: value='([^']*)')?>(.*?)</li>", flags=re.DOTALL)
+
+    def content_lines(self):
+        """content as a list of line number and text tuples, based on
+        the line structure of the html content, if available; line number
+        is an empty string for lines with no number"""
+        html_content = self.content.get("html") if self.content else None
+        if not html_content:
+            return []
+        lines = [
+            (number, strip_tags(text).strip())
+            for number, text in self.re_html_line.findall(html_content)
+        ]
+        return [(number, text) for number, text in lines if text]
+
     def iiif_annotation_content(self):
         """Return transcription content from this footnote (if any)
         as a IIIF annotation resource that can be associated with a canvas.
@@ -248,6 +248,24 @@ class TestFootnote:
         footnote.url = "http://example.com/"
         assert footnote.has_url()
 
+    def test_content_lines(self):
+        footnote = Footnote()
+        assert footnote.content_lines() == []
+        footnote.content = {"text": "plain text only"}
+        assert footnote.content_lines() == []
+        footnote.content = {
+            "html": "<section>\n <h1>Recto</h1>\n <ul>"
+            + "\n <li value='1'>first line</li>"
+            + "\n <li value='2'>second <b>line</b></li>"
+            + "\n <li>unnumbered</li>"
+            + "\n <li value='4'> </li></ul>\n</section>"
+        }
+        assert footnote.content_lines() == [
+            ("1", "first line"),
+            ("2", "second line"),
+            ("", "unnumbered"),
+        ]
+
 
 class TestFootnoteQuerySet:
     @pytest.mark.django_db
@@ -30,3 +30,10 @@ ALLOWED_HOSTS = ["*"]
 
 # enable django-dbml for generating dbdocs
 INSTALLED_APPS.append("django_dbml")
+
+# always check the current Solr index version, since tests index and
+# query documents immediately
+SOLR_INDEX_VERSION_TIMEOUT = 0
+
+# don't cache rendered document pages, so tests always render templates
+DOCUMENT_RENDER_CACHE_TIMEOUT = 0
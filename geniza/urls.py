@@ -27,6 +27,7 @@ from wagtail.contrib.sitemaps import views as sitemap_views
 from wagtail.core import urls as wagtail_urls
 from wagtail.documents import urls as wagtaildocs_urls
 
+from geniza.corpus import views as corpus_views
 from geniza.corpus.sitemaps import DocumentScholarshipSitemap, DocumentSitemap
 
 SITEMAPS = {
@@ -49,6 +50,11 @@ urlpatterns = [
     path("accounts/", include("pucas.cas_urls")),
     path("i18n/", include("django.conf.urls.i18n")),
     path("taggit/", include("taggit_selectize.urls")),
+    path(
+        "api/documents/",
+        corpus_views.DocumentSearchAPIView.as_view(),
+        name="document-search-api",
+    ),
     url(
         "sitemap.xml",
         sitemap_views.index,